@@ -1,73 +1,21 @@
 import os
+import json
+import atexit
+import hashlib
+import math
+import socket
+import threading
 from datetime import datetime, timedelta
+from time import monotonic, perf_counter
 from pathlib import Path
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-import requests
-import pymysql
-
-
-from datetime import date, datetime, time, timedelta
-
-def clean(val):
-    if isinstance(val, (datetime, date, time)):
-        return str(val)
-    if isinstance(val, timedelta):
-        # Convert timedelta to HH:MM:SS
-        total_seconds = int(val.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-    return val
-
-def make_json_safe(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-
-    if isinstance(obj, timedelta):
-        return str(obj)
-
-    if isinstance(obj, dict):
-        return {k: make_json_safe(v) for k, v in obj.items()}
-
-    if isinstance(obj, list):
-        return [make_json_safe(i) for i in obj]
-
-    if isinstance(obj, tuple):   # ✅ ADD THIS
-        return [make_json_safe(i) for i in obj]
-
-    return obj
-
-
-def fix_timedelta(row):
-    """Convert any timedelta fields in a row dict to 'HH:MM:SS' strings."""
-    if not row:
-        return row
-    fixed = {}
-    for k, v in row.items():
-        if isinstance(v, timedelta):
-            total = int(v.total_seconds())
-            h = total // 3600
-            m = (total % 3600) // 60
-            s = total % 60
-            fixed[k] = f"{h:02d}:{m:02d}:{s:02d}"
-        else:
-            fixed[k] = v
-    return fixed
-
-def fix_timedelta_row(row):
-    """In-place version used for lists of rows."""
-    if not row:
-        return row
-    for k, v in row.items():
-        if isinstance(v, timedelta):
-            total_seconds = int(v.total_seconds())
-            h = total_seconds // 3600
-            m = (total_seconds % 3600) // 60
-            s = total_seconds % 60
-            row[k] = f"{h:02d}:{m:02d}:{s:02d}"
-    return row
+
+import db_driver
+from aqi import aqi_to_list, calculate_aqi, calculate_aqi_batch  # noqa: F401
+from json_provider import RowJSONProvider, columnar, dumps as json_dumps, format_timedelta
+import metrics
+
 
 def clean_value(v):
     try:
@@ -78,97 +26,23 @@ def clean_value(v):
     except Exception:
         return None
 
-def calculate_aqi(pollutants):
-    """
-    pollutants: dict with keys:
-        'PM2.5', 'PM10', 'SO2', 'NO2', 'O3', 'CO', 'NH3'
-    units: µg/m³ except CO (mg/m³)
-    """
-    breakpoints = {
-        "PM2.5": [
-            (0, 30, 0, 50),
-            (31, 60, 51, 100),
-            (61, 90, 101, 200),
-            (91, 120, 201, 300),
-            (121, 250, 301, 400),
-            (251, 500, 401, 500),
-        ],
-        "PM10": [
-            (0, 50, 0, 50),
-            (51, 100, 51, 100),
-            (101, 250, 101, 200),
-            (251, 350, 201, 300),
-            (351, 430, 301, 400),
-            (431, 600, 401, 500),
-        ],
-        "SO2": [
-            (0, 40, 0, 50),
-            (41, 80, 51, 100),
-            (81, 380, 101, 200),
-            (381, 800, 201, 300),
-            (801, 1600, 301, 400),
-            (1601, 2620, 401, 500),
-        ],
-        "NO2": [
-            (0, 40, 0, 50),
-            (41, 80, 51, 100),
-            (81, 180, 101, 200),
-            (181, 280, 201, 300),
-            (281, 400, 301, 400),
-            (401, 800, 401, 500),
-        ],
-        "O3": [
-            (0, 50, 0, 50),
-            (51, 100, 51, 100),
-            (101, 168, 101, 200),
-            (169, 208, 201, 300),
-            (209, 748, 301, 400),
-            (749, 1000, 401, 500),
-        ],
-        "CO": [
-            (0, 1, 0, 50),
-            (1.1, 2, 51, 100),
-            (2.1, 10, 101, 200),
-            (10.1, 17, 201, 300),
-            (17.1, 34, 301, 400),
-            (34.1, 50, 401, 500),
-        ],
-        "NH3": [
-            (0, 200, 0, 50),
-            (201, 400, 51, 100),
-            (401, 800, 101, 200),
-            (801, 1200, 201, 300),
-            (1201, 1800, 301, 400),
-            (1801, 2500, 401, 500),
-        ],
-    }
-
-    def compute_iaqi(Cp, bp_list):
-        if Cp is None:
-            return None
-        for BP_Lo, BP_Hi, I_Lo, I_Hi in bp_list:
-            if BP_Lo <= Cp <= BP_Hi:
-                return ((I_Hi - I_Lo) / (BP_Hi - BP_Lo)) * (Cp - BP_Lo) + I_Lo
-        return None
-
-    iaqis = {}
-    for p, bp in breakpoints.items():
-        iaqis[p] = compute_iaqi(pollutants.get(p), bp)
-
-    overall_aqi = max([v for v in iaqis.values() if v is not None], default=None)
-    return int(overall_aqi) if overall_aqi is not None else None, iaqis
-
-try:
-    from dotenv import load_dotenv
+env_path = Path(__file__).resolve().parent / ".env"
+if env_path.exists():
+    try:
+        from dotenv import load_dotenv
 
-    env_path = Path(__file__).resolve().parent / ".env"
-    load_dotenv(dotenv_path=env_path)
-    print("Loaded .env from:", env_path)
-except Exception as e:
-    print("WARNING: dotenv not loaded:", e)
+        load_dotenv(dotenv_path=env_path)
+    except Exception as e:
+        print("WARNING: dotenv not loaded:", e)
 
-import os
-import mysql.connector
+from db_pool import ConnectionPool, PoolTimeout
+from db_router import ReadRouter
+from ingest import RateLimiter, StageTimer, fan_out, retry, time_left
+from scheduler import MySQLLock, SyncScheduler
+from live_updates import Broadcaster, LocalBackend, MySQLBackend, SubscriberLimit
+from station_registry import StationRegistry
+from write_behind import QueueFull, WriteBehindQueue
+from response_cache import DataGeneration, ResponseCache
 
 PORT = int(os.getenv("PORT", 5001))
 HOST = os.getenv("HOST", "0.0.0.0")
@@ -183,104 +57,964 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 DB_SSL_CA = os.getenv("DB_SSL_CA")
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+# Read replicas ("host[:port],host[:port]"; empty = primary only), the
+# replication lag (seconds) above which a replica is skipped, how often
+# lag is probed and how long a failed replica is left out.
+DB_REPLICA_HOSTS = os.getenv("DB_REPLICA_HOSTS", "")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 30))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))
+DB_REPLICA_COOLDOWN = float(os.getenv("DB_REPLICA_COOLDOWN", 30))
+
+# Queries slower than this (ms) are logged and counted
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 500))
+
+# Sync fan-out: max parallel upstream requests, per-provider rate limits
+# (requests/second, burst) and per-request / per-stage deadlines (seconds).
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", 8))
+POLLUTANT_API_RPS = float(os.getenv("POLLUTANT_API_RPS", 5))
+POLLUTANT_API_BURST = int(os.getenv("POLLUTANT_API_BURST", 7))
+OPENWEATHER_RPS = float(os.getenv("OPENWEATHER_RPS", 1))
+OPENWEATHER_BURST = int(os.getenv("OPENWEATHER_BURST", 60))
+POLLUTANT_API_TIMEOUT = float(os.getenv("POLLUTANT_API_TIMEOUT", 30))
+OPENWEATHER_TIMEOUT = float(os.getenv("OPENWEATHER_TIMEOUT", 20))
+SYNC_STAGE_DEADLINE = float(os.getenv("SYNC_STAGE_DEADLINE", 120))
+
+# Sync scheduler (see scheduler.py): slot length, offset into the slot
+# (900 = hh:15), random start jitter, whole-run deadline (seconds), stage
+# attempts and the first retry delay (doubles per attempt).
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", 3600))
+SYNC_OFFSET_SECONDS = int(os.getenv("SYNC_OFFSET_SECONDS", 900))
+SYNC_JITTER_SECONDS = float(os.getenv("SYNC_JITTER_SECONDS", 120))
+SYNC_RUN_DEADLINE = float(os.getenv("SYNC_RUN_DEADLINE", 1800))
+SYNC_STAGE_ATTEMPTS = int(os.getenv("SYNC_STAGE_ATTEMPTS", 3))
+SYNC_RETRY_BASE_DELAY = float(os.getenv("SYNC_RETRY_BASE_DELAY", 10))
+SYNC_LOCK_NAME = os.getenv("SYNC_LOCK_NAME", "python_backend_sync")
+
+pollutant_api_limiter = RateLimiter(POLLUTANT_API_RPS, POLLUTANT_API_BURST)
+openweather_limiter = RateLimiter(OPENWEATHER_RPS, OPENWEATHER_BURST)
+
+# A station's stored OpenWeather forecast younger than this is reused
+# instead of calling the API again (forecasts are issued every 3 hours).
+FORECAST_MAX_AGE_MINUTES = float(os.getenv("FORECAST_MAX_AGE_MINUTES", 170))
+FORECAST_RETENTION_HOURS = int(os.getenv("FORECAST_RETENTION_HOURS", 24))
+
+# Stations are snapped to a lat/lon grid of this cell size (degrees,
+# 0.02 ≈ 2 km) and OpenWeather is called once per cell; 0 = per station.
+WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", 0.02))
+
+# Bulk ingest endpoints: max rows per request and rows per multi-row INSERT
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", 20000))
+BATCH_CHUNK_ROWS = int(os.getenv("BATCH_CHUNK_ROWS", 500))
+
+# Write-behind mode for the insert endpoints (see write_behind.py): rows are
+# acknowledged once fsync'ed to a local log and group-committed in the
+# background every WRITE_BEHIND_MAX_BATCH rows or WRITE_BEHIND_MAX_DELAY_MS.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_DIR = os.getenv(
+    "WRITE_BEHIND_DIR", str(Path(__file__).resolve().parent / "write_behind")
+)
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 500))
+WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", 200))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 50000))
+
+# /api/live Server-Sent Events (see live_updates.py). LIVE_UPDATES_BACKEND
+# "mysql" reaches streams in every worker (and events from fetch.py);
+# "local" only serves a single-process deployment.
+LIVE_UPDATES_BACKEND = os.getenv("LIVE_UPDATES_BACKEND", "mysql")
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 1.0))
+LIVE_EVENT_RETENTION = int(os.getenv("LIVE_EVENT_RETENTION", 3600))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", 1000))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 256))
+LIVE_STREAM_MAX_SECONDS = float(os.getenv("LIVE_STREAM_MAX_SECONDS", 600))
+
+# data.gov.in pagination
+POLLUTANT_PAGE_SIZE = int(os.getenv("POLLUTANT_PAGE_SIZE", 500))
+POLLUTANT_MAX_PAGES = int(os.getenv("POLLUTANT_MAX_PAGES", 100))
+
+# One keep-alive session for every upstream call (gzip, pooled sockets),
+# created on first use: web workers that never sync don't import requests.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                session.mount(
+                    "https://",
+                    HTTPAdapter(pool_connections=4, pool_maxsize=SYNC_CONCURRENCY),
+                )
+                _http_session = session
+    return _http_session
+
+def get_db_connection(host=None, port=None):
+    return db_driver.connect(
+        host=host or DB_HOST,
+        port=port or DB_PORT,
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
         ssl_ca=DB_SSL_CA,
         ssl_verify_cert=True,
-        
-        connection_timeout=5,   # ⬅️ ADD THIS
-        use_pure=True 
+        connection_timeout=5,
     )
 
+# One pool per gunicorn worker: the TLS handshake is paid once per
+# connection instead of once per request.
+db_pool = ConnectionPool(
+    metrics.instrumented_connect(get_db_connection, SLOW_QUERY_MS / 1000.0),
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+)
 
-def get_latest_pollutant_reading_for_station(station_display_name: str | None):
+def db_connection():
+    """
+    Check out a pooled connection:
+
+        with db_connection() as conn:
+            ...
+
+    The connection goes back to the pool when the block exits.
+    """
+    return db_pool.connection()
+
+def _replica_pool(target):
+    host, _, port = target.strip().partition(":")
+    return ConnectionPool(
+        metrics.instrumented_connect(
+            lambda: get_db_connection(host, int(port) if port else None),
+            SLOW_QUERY_MS / 1000.0,
+        ),
+        size=DB_POOL_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        recycle=DB_POOL_RECYCLE,
+    )
+
+# Read-only endpoints go through read_router: a healthy, caught-up replica
+# from DB_REPLICA_HOSTS ("host[:port],..."; same credentials as the
+# primary), else the primary pool.
+read_router = ReadRouter(
+    db_pool,
+    [(t.strip(), _replica_pool(t)) for t in DB_REPLICA_HOSTS.split(",") if t.strip()],
+    max_lag=DB_REPLICA_MAX_LAG,
+    check_interval=DB_REPLICA_CHECK_INTERVAL,
+    cooldown=DB_REPLICA_COOLDOWN,
+    required_generation=lambda: data_generation.current()[0],
+)
+
+def db_read_connection():
+    """
+    Like db_connection(), for SELECT-only work that may be served by a
+    read replica. Don't use it where a request must see its own writes.
+    """
+    return read_router.read_connection()
+
+STATION_REGISTRY_TTL = int(os.getenv("STATION_REGISTRY_TTL", 900))
+NEAREST_STATION_MAX_K = int(os.getenv("NEAREST_STATION_MAX_K", 20))
+COMBINED_DATA_MAX_STATIONS = int(os.getenv("COMBINED_DATA_MAX_STATIONS", 1000))
+
+# Name → id / id → record / lat-lon maps of the stations table, shared by
+# ingestion and the station endpoints.
+station_registry = StationRegistry(db_connection, ttl=STATION_REGISTRY_TTL)
+
+live_updates = Broadcaster(
+    LocalBackend()
+    if LIVE_UPDATES_BACKEND == "local"
+    else MySQLBackend(db_connection, poll_interval=LIVE_POLL_INTERVAL, retention=LIVE_EVENT_RETENTION),
+    dumps=json_dumps,
+    max_queue=LIVE_QUEUE_SIZE,
+    max_subscribers=LIVE_MAX_SUBSCRIBERS,
+)
+
+
+# ----------------------------------------------------
+# Schema owned by this service (created on first use)
+# ----------------------------------------------------
+SCHEMA_STATEMENTS = [
+    # Which SCHEMA_VERSION migrate() last completed.
+    """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        id TINYINT NOT NULL PRIMARY KEY,
+        version VARCHAR(64) NOT NULL,
+        migrated_at DATETIME NOT NULL
+    )
+    """,
+    # One row per station with the newest pollutant + weather snapshot,
+    # upserted in the same transaction as the history insert.
+    """
+    CREATE TABLE IF NOT EXISTS latest_readings (
+        station_name VARCHAR(255) NOT NULL PRIMARY KEY,
+        station_id INT NULL,
+        pollutant_json JSON NULL,
+        pollutant_updated_at DATETIME NULL,
+        meteo_json JSON NULL,
+        meteo_updated_at DATETIME NULL,
+        KEY idx_latest_pollutant (pollutant_updated_at),
+        KEY idx_latest_meteo (meteo_updated_at)
+    )
+    """,
+    # Single-row counter bumped by every write; read endpoints cache
+    # their responses per generation.
+    """
+    CREATE TABLE IF NOT EXISTS data_generation (
+        id TINYINT NOT NULL PRIMARY KEY,
+        generation BIGINT NOT NULL,
+        updated_at DATETIME NOT NULL
+    )
+    """,
+    # Per station/pollutant hour, day and month buckets for trend charts,
+    # maintained incrementally by the pollutant write paths.
+    """
+    CREATE TABLE IF NOT EXISTS pollutant_rollup (
+        resolution ENUM('hour', 'day', 'month') NOT NULL,
+        station_name VARCHAR(255) NOT NULL,
+        pollutant VARCHAR(16) NOT NULL,
+        bucket_start DATETIME NOT NULL,
+        min_value DOUBLE NOT NULL,
+        max_value DOUBLE NOT NULL,
+        sum_value DOUBLE NOT NULL,
+        sample_count INT NOT NULL,
+        PRIMARY KEY (resolution, station_name, pollutant, bucket_start)
+    )
+    """,
+    # Newest upstream `last_update` already stored per station; the sync
+    # skips stations whose feed timestamp has not moved past it.
+    """
+    CREATE TABLE IF NOT EXISTS pollutant_watermarks (
+        station_id INT NOT NULL PRIMARY KEY,
+        source_updated_at DATETIME NOT NULL,
+        synced_at DATETIME NOT NULL
+    )
+    """,
+    # Every entry of each station's 5 day / 3 hour OpenWeather forecast,
+    # overwritten in place by newer forecasts for the same target time.
+    """
+    CREATE TABLE IF NOT EXISTS weather_forecast (
+        station_name VARCHAR(255) NOT NULL,
+        target_at DATETIME NOT NULL,
+        station_id INT NULL,
+        fetched_at DATETIME NOT NULL,
+        temperature_c DOUBLE NULL,
+        feels_like_c DOUBLE NULL,
+        pressure_hpa DOUBLE NULL,
+        grnd_level_hpa DOUBLE NULL,
+        humidity_percent DOUBLE NULL,
+        wind_kph DOUBLE NULL,
+        wind_deg DOUBLE NULL,
+        wind_gust DOUBLE NULL,
+        visibility_km DOUBLE NULL,
+        clouds_percent DOUBLE NULL,
+        precipitation_prob DOUBLE NULL,
+        rain_3h DOUBLE NULL,
+        condition_main VARCHAR(64) NULL,
+        condition_text VARCHAR(255) NULL,
+        sunrise TIME NULL,
+        sunset TIME NULL,
+        PRIMARY KEY (station_name, target_at),
+        KEY idx_forecast_target (target_at)
+    )
+    """,
+    # One row per scheduled sync run; the newest slot_at tells every
+    # scheduler process whether the current slot has already been run.
+    """
+    CREATE TABLE IF NOT EXISTS sync_runs (
+        run_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        slot_at DATETIME NOT NULL,
+        started_at DATETIME NOT NULL,
+        finished_at DATETIME NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        host VARCHAR(255) NULL,
+        report JSON NULL,
+        KEY idx_sync_runs_slot (slot_at)
+    )
+    """,
+    # Live update events for /api/live, written after each ingestion
+    # commit and polled by every process with open streams; pruned after
+    # LIVE_EVENT_RETENTION seconds.
     """
-    EXACT station match on location_name.
-    If no row for that station → fallback to latest overall.
-    Returns a dict or None.
+    CREATE TABLE IF NOT EXISTS live_events (
+        event_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        created_at DATETIME NOT NULL,
+        event VARCHAR(32) NOT NULL,
+        payload MEDIUMTEXT NOT NULL,
+        KEY idx_live_events_created (created_at)
+    )
+    """,
+    # Processes with open /api/live streams; publishers skip live_events
+    # while no row is fresh.
+    """
+    CREATE TABLE IF NOT EXISTS live_listeners (
+        listener VARCHAR(128) NOT NULL PRIMARY KEY,
+        seen_at DATETIME NOT NULL
+    )
+    """,
+    # Hourly temperature rollup across all stations, maintained by the
+    # weather write paths (sum/count so increments stay exact).
     """
-    conn = get_db_connection()
+    CREATE TABLE IF NOT EXISTS temperature_hourly (
+        hour_start DATETIME NOT NULL PRIMARY KEY,
+        temp_sum DOUBLE NOT NULL,
+        temp_count INT NOT NULL
+    )
+    """,
+]
+
+# Columns we add to the pre-existing history tables:
+# (table, column, definition, backfill expression or None, source date column)
+SCHEMA_COLUMNS = [
+    ("pollutant_readings", "recorded_at", "DATETIME NULL",
+     "TIMESTAMP(reading_date, COALESCE(reading_time, '00:00:00'))", "reading_date"),
+    ("meteorological_data", "recorded_at", "DATETIME NULL",
+     "TIMESTAMP(record_date, COALESCE(record_time, '00:00:00'))", "record_date"),
+    # upstream `last_update` of the reading (NULL for manual inserts)
+    ("pollutant_readings", "source_updated_at", "DATETIME NULL", None, None),
+]
+
+# (table, index name, kind, columns)
+SCHEMA_INDEXES = [
+    ("pollutant_readings", "idx_pollutant_recorded_at", "INDEX", "recorded_at"),
+    ("meteorological_data", "idx_meteo_recorded_at", "INDEX", "recorded_at"),
+    # per-station range scans (trend queries, rollup bucket rebuilds)
+    ("pollutant_readings", "idx_pollutant_location_recorded_at", "INDEX",
+     "location_name, recorded_at"),
+    # one row per station per upstream reading; NULLs never collide, so
+    # manual inserts without a source timestamp are unaffected
+    ("pollutant_readings", "uq_pollutant_station_source", "UNIQUE INDEX",
+     "station_id, source_updated_at"),
+]
+
+# Changes whenever the schema definitions above change; migrate() records
+# it in schema_version once every statement and backfill has run.
+SCHEMA_VERSION = hashlib.sha1(
+    repr((SCHEMA_STATEMENTS, SCHEMA_COLUMNS, SCHEMA_INDEXES)).encode()
+).hexdigest()[:16]
+SCHEMA_LOCK_NAME = os.getenv("SCHEMA_LOCK_NAME", "python_backend_migrate")
+SCHEMA_LOCK_WAIT = int(os.getenv("SCHEMA_LOCK_WAIT", 900))
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", 5))
+
+class SchemaNotReady(RuntimeError):
+    """The database has not been migrated to SCHEMA_VERSION (run migrate.py)."""
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_schema_checked_at = None
+
+def _stored_schema_version(cur):
     try:
-        with conn.cursor(dictionary=True) as cur:
-            if station_display_name:
+        cur.execute("SELECT version FROM schema_version WHERE id = 1")
+    except Exception as e:
+        if getattr(e, "errno", None) == 1146:  # table doesn't exist yet
+            return None
+        raise
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def migrate():
+    """
+    Create/alter our tables and run the one-time backfills. Serialized
+    across processes and hosts with a MySQL named lock, and a no-op once
+    schema_version matches SCHEMA_VERSION. Run it from `python migrate.py`
+    (Procfile `release`), never from a request. Returns True if it did work.
+    """
+    global _schema_ready
+    lock = MySQLLock(get_db_connection, SCHEMA_LOCK_NAME, wait=SCHEMA_LOCK_WAIT)
+    with lock.hold() as acquired:
+        if not acquired:
+            raise RuntimeError(f"another migration held {SCHEMA_LOCK_NAME} for {SCHEMA_LOCK_WAIT}s")
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                if _stored_schema_version(cur) == SCHEMA_VERSION:
+                    print(f"✅ Schema is up to date ({SCHEMA_VERSION})")
+                    _schema_ready = True
+                    return False
+
+            print(f"🛠  Migrating schema to {SCHEMA_VERSION}")
+            with conn.cursor() as cur:
+                for stmt in SCHEMA_STATEMENTS:
+                    cur.execute(stmt)
+                for table, column, definition, _, _ in SCHEMA_COLUMNS:
+                    _ensure_column(cur, table, column, definition)
+                for table, index, kind, columns in SCHEMA_INDEXES:
+                    _ensure_index(cur, table, index, kind, columns)
+            conn.commit()
+            # rows that only now got a recorded_at are missing from
+            # aggregates an earlier migration already built
+            filled = backfill_recorded_at(conn)
+            backfill_latest_readings(conn)
+            backfill_temperature_hourly(conn, rebuild=bool(filled.get("meteorological_data")))
+            backfill_pollutant_rollup(conn, rebuild=bool(filled.get("pollutant_readings")))
+            with conn.cursor() as cur:
                 cur.execute(
                     """
-                    SELECT *
-                    FROM pollutant_readings
-                    WHERE location_name = %s
-                    ORDER BY reading_date DESC, reading_time DESC, record_id DESC
-                    LIMIT 1
+                    INSERT INTO schema_version (id, version, migrated_at)
+                    VALUES (1, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        version = VALUES(version), migrated_at = VALUES(migrated_at)
                     """,
-                    (station_display_name,),
+                    (SCHEMA_VERSION, datetime.now()),
                 )
-                row = cur.fetchone()
-                if row:
-                    return fix_timedelta(row)
+            conn.commit()
+    _schema_ready = True
+    print(f"✅ Schema migrated to {SCHEMA_VERSION}")
+    return True
 
-            # fallback: latest overall
-            cur.execute(
-                """
-                SELECT *
-                FROM pollutant_readings
-                ORDER BY reading_date DESC, reading_time DESC, record_id DESC
-                LIMIT 1
-                """
+def ensure_schema():
+    """
+    Raise SchemaNotReady unless migrate() has brought the database to
+    SCHEMA_VERSION. Only reads schema_version (at most every
+    SCHEMA_CHECK_INTERVAL seconds until it matches, then never again).
+    """
+    global _schema_ready, _schema_checked_at
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        now = monotonic()
+        if _schema_checked_at is None or now - _schema_checked_at >= SCHEMA_CHECK_INTERVAL:
+            _schema_checked_at = now
+            with db_connection() as conn, conn.cursor() as cur:
+                _schema_ready = _stored_schema_version(cur) == SCHEMA_VERSION
+                conn.commit()
+        if not _schema_ready:
+            raise SchemaNotReady(
+                f"database schema is not at {SCHEMA_VERSION}; run `python migrate.py`"
             )
-            row = cur.fetchone()
-            return fix_timedelta(row) if row else None
 
-    finally:
-        conn.close()
+def _ensure_column(cur, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless already present."""
+    cur.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """,
+        (table, column),
+    )
+    if not cur.fetchone()[0]:
+        print(f"🛠  Adding {table}.{column}")
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _ensure_index(cur, table, index, kind, columns):
+    """ALTER TABLE ... ADD INDEX unless already present."""
+    cur.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """,
+        (table, index),
+    )
+    if not cur.fetchone()[0]:
+        print(f"🛠  Adding index {table}.{index}")
+        cur.execute(f"ALTER TABLE {table} ADD {kind} {index} ({columns})")
 
-def get_latest_meteorological_reading_for_station(station_display_name: str | None):
+def backfill_recorded_at(conn, chunk_size=10000):
     """
-    EXACT station match on station_name in meteorological_data.
-    If no row for that station → fallback to latest overall.
-    Returns a dict or None.
+    Fill recorded_at from the separate date/time columns, in chunks (a
+    missing time counts as midnight, as in _combine_date_time). Rows
+    the expression can't fill (zero or invalid dates) are excluded from
+    the WHERE: rowcount counts changed rows only, so a chunk of them
+    would otherwise look like the end of the table.
+    Returns {table: rows filled}.
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(dictionary=True) as cur:
-            if station_display_name:
+    filled = {}
+    for table, column, _, expr, date_col in SCHEMA_COLUMNS:
+        if expr is None:
+            continue
+        total = 0
+        while True:
+            with conn.cursor() as cur:
                 cur.execute(
+                    f"""
+                    UPDATE {table} SET {column} = {expr}
+                    WHERE {column} IS NULL AND {date_col} IS NOT NULL
+                      AND {expr} IS NOT NULL
+                    LIMIT {int(chunk_size)}
                     """
-                    SELECT *
-                    FROM meteorological_data
-                    WHERE station_name = %s
-                    ORDER BY record_date DESC, record_time DESC, record_id DESC
-                    LIMIT 1
-                    """,
-                    (station_display_name,),
                 )
-                row = cur.fetchone()
-                if row:
-                    return fix_timedelta(row)
+                changed = cur.rowcount
+            conn.commit()
+            total += changed
+            if changed < chunk_size:
+                break
+        if total:
+            print(f"✅ Backfilled {table}.{column} for {total} rows")
+        filled[table] = filled.get(table, 0) + total
+    return filled
+
+def backfill_temperature_hourly(conn, rebuild=False):
+    """
+    One-time fill of temperature_hourly from meteorological_data;
+    rebuild=True recomputes it (rows got a recorded_at after the fill).
+    """
+    with conn.cursor() as cur:
+        if rebuild:
+            cur.execute("DELETE FROM temperature_hourly")
+        else:
+            cur.execute("SELECT 1 FROM temperature_hourly LIMIT 1")
+            if cur.fetchone():
+                return
+        cur.execute(
+            """
+            INSERT INTO temperature_hourly (hour_start, temp_sum, temp_count)
+            SELECT DATE_FORMAT(recorded_at, '%Y-%m-%d %H:00:00'),
+                   SUM(temperature_c), COUNT(temperature_c)
+            FROM meteorological_data
+            WHERE recorded_at IS NOT NULL AND temperature_c IS NOT NULL
+            GROUP BY 1
+            """
+        )
+        print(f"✅ Backfilled temperature_hourly ({cur.rowcount} hours)")
+    conn.commit()
+
+# pollutant_readings columns that get trend rollups
+TREND_POLLUTANTS = [
+    "pm25_ug_m3",
+    "so2_ug_m3",
+    "no2_ug_m3",
+    "OZONE",
+    "CO",
+    "NH3",
+    "PM10",
+]
+
+# rollup resolution → (bucket length in seconds, MySQL bucket format)
+ROLLUP_RESOLUTIONS = {
+    "hour": (3600, "%Y-%m-%d %H:00:00"),
+    "day": (86400, "%Y-%m-%d 00:00:00"),
+    "month": (30 * 86400, "%Y-%m-01 00:00:00"),
+}
+
+def _bucket_start(ts, resolution):
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def upsert_pollutant_rollup(cur, rows):
+    """
+    Fold pollutant_readings rows (dicts with location_name, recorded_at and
+    the pollutant columns) into the hour/day/month buckets.
+    """
+    buckets = {}
+    for row in rows:
+        station = row.get("location_name")
+        ts = row.get("recorded_at")
+        if not station or ts is None:
+            continue
+        for pollutant in TREND_POLLUTANTS:
+            value = row.get(pollutant)
+            if value is None:
+                continue
+            value = float(value)
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = (resolution, station, pollutant, _bucket_start(ts, resolution))
+                b = buckets.get(key)
+                if b is None:
+                    buckets[key] = [value, value, value, 1]
+                else:
+                    b[0] = min(b[0], value)
+                    b[1] = max(b[1], value)
+                    b[2] += value
+                    b[3] += 1
+    if not buckets:
+        return
+    cur.executemany(
+        """
+        INSERT INTO pollutant_rollup
+        (resolution, station_name, pollutant, bucket_start,
+         min_value, max_value, sum_value, sample_count)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            min_value = LEAST(min_value, VALUES(min_value)),
+            max_value = GREATEST(max_value, VALUES(max_value)),
+            sum_value = sum_value + VALUES(sum_value),
+            sample_count = sample_count + VALUES(sample_count)
+        """,
+        [key + tuple(b) for key, b in buckets.items()],
+    )
+
+def _bucket_end(start, resolution):
+    if resolution == "hour":
+        return start + timedelta(hours=1)
+    if resolution == "day":
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+# every TREND_POLLUTANTS column as (pollutant, value) rows of one reading
+_ROLLUP_POLLUTANT_NAMES = " UNION ALL ".join(
+    f"SELECT '{p}' AS pollutant" for p in TREND_POLLUTANTS
+)
+_ROLLUP_POLLUTANT_VALUE = "CASE p.pollutant {} END".format(
+    " ".join(f"WHEN '{p}' THEN r.{p}" for p in TREND_POLLUTANTS)
+)
+
+def recompute_pollutant_rollup(cur, points):
+    """
+    Rebuild, from pollutant_readings, every bucket containing one of the
+    (station_name, recorded_at) points: used where a reading was
+    overwritten, since min/max can't be taken back incrementally.
+    Each bucket is one DELETE plus one grouped INSERT ... SELECT over the
+    station's rows in that range (idx_pollutant_location_recorded_at).
+    """
+    buckets = {
+        (resolution, station, _bucket_start(ts, resolution))
+        for station, ts in points
+        if station and ts is not None
+        for resolution in ROLLUP_RESOLUTIONS
+    }
+    for resolution, station, start in sorted(buckets):
+        cur.execute(
+            """
+            DELETE FROM pollutant_rollup
+            WHERE resolution = %s AND station_name = %s AND bucket_start = %s
+            """,
+            (resolution, station, start),
+        )
+        cur.execute(
+            f"""
+            INSERT INTO pollutant_rollup
+            (resolution, station_name, pollutant, bucket_start,
+             min_value, max_value, sum_value, sample_count)
+            SELECT %s, %s, pollutant, %s, MIN(v), MAX(v), SUM(v), COUNT(v)
+            FROM (
+                SELECT p.pollutant, {_ROLLUP_POLLUTANT_VALUE} AS v
+                FROM pollutant_readings r
+                CROSS JOIN ({_ROLLUP_POLLUTANT_NAMES}) p
+                WHERE r.location_name = %s
+                  AND r.recorded_at >= %s AND r.recorded_at < %s
+            ) x
+            WHERE v IS NOT NULL
+            GROUP BY pollutant
+            """,
+            (resolution, station, start, station, start, _bucket_end(start, resolution)),
+        )
+
+def backfill_pollutant_rollup(conn, rebuild=False):
+    """
+    One-time fill of pollutant_rollup from pollutant_readings;
+    rebuild=True recomputes it, one resolution per transaction.
+    """
+    with conn.cursor() as cur:
+        if not rebuild:
+            cur.execute("SELECT 1 FROM pollutant_rollup LIMIT 1")
+            if cur.fetchone():
+                return
+        for resolution, (_, fmt) in ROLLUP_RESOLUTIONS.items():
+            if rebuild:
+                cur.execute("DELETE FROM pollutant_rollup WHERE resolution = %s", (resolution,))
+            for pollutant in TREND_POLLUTANTS:
+                cur.execute(
+                    f"""
+                    INSERT INTO pollutant_rollup
+                    (resolution, station_name, pollutant, bucket_start,
+                     min_value, max_value, sum_value, sample_count)
+                    SELECT '{resolution}', location_name, '{pollutant}',
+                           DATE_FORMAT(recorded_at, '{fmt}'),
+                           MIN({pollutant}), MAX({pollutant}),
+                           SUM({pollutant}), COUNT({pollutant})
+                    FROM pollutant_readings
+                    WHERE recorded_at IS NOT NULL
+                      AND location_name IS NOT NULL
+                      AND {pollutant} IS NOT NULL
+                    GROUP BY location_name, DATE_FORMAT(recorded_at, '{fmt}')
+                    """
+                )
+            conn.commit()
+    print("✅ Backfilled pollutant_rollup")
+
+def upsert_temperature_hourly(cur, rows):
+    """Add meteorological rows (dicts) to their hour buckets."""
+    buckets = {}
+    for row in rows:
+        temp = row.get("temperature_c")
+        ts = row.get("recorded_at")
+        if temp is None or ts is None:
+            continue
+        hour = ts.replace(minute=0, second=0, microsecond=0)
+        total, count = buckets.get(hour, (0.0, 0))
+        buckets[hour] = (total + float(temp), count + 1)
+    if not buckets:
+        return
+    cur.executemany(
+        """
+        INSERT INTO temperature_hourly (hour_start, temp_sum, temp_count)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            temp_sum = temp_sum + VALUES(temp_sum),
+            temp_count = temp_count + VALUES(temp_count)
+        """,
+        [(hour, total, count) for hour, (total, count) in buckets.items()],
+    )
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+DATA_GENERATION_CHECK_INTERVAL = float(os.getenv("DATA_GENERATION_CHECK_INTERVAL", 5))
+
+def _load_data_generation():
+    ensure_schema()
+    with db_connection() as conn, conn.cursor(dictionary=True) as cur:
+        cur.execute("SELECT generation, updated_at FROM data_generation WHERE id = 1")
+        row = cur.fetchone()
+    return (row["generation"], row["updated_at"]) if row else (0, None)
+
+data_generation = DataGeneration(
+    _load_data_generation, check_interval=DATA_GENERATION_CHECK_INTERVAL
+)
+response_cache = ResponseCache(
+    data_generation,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+)
+
+def _snapshot_json(row):
+    return json_dumps(row)
+
+LATEST_KINDS = {
+    "pollutant": ("pollutant_json", "pollutant_updated_at"),
+    "meteo": ("meteo_json", "meteo_updated_at"),
+}
+
+def upsert_latest_readings(cur, kind, snapshots):
+    """
+    snapshots: list of (station_name, station_id, row_dict, reading_datetime).
+    Only replaces the stored snapshot when the new reading is not older,
+    so back-dated inserts never overwrite a newer value.
+    """
+    if not snapshots:
+        return
+    json_col, ts_col = LATEST_KINDS[kind]
+    # ON DUPLICATE KEY UPDATE assigns left to right: the JSON column must be
+    # compared against the OLD timestamp, so it comes first.
+    cur.executemany(
+        f"""
+        INSERT INTO latest_readings (station_name, station_id, {json_col}, {ts_col})
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            station_id = COALESCE(VALUES(station_id), station_id),
+            {json_col} = IF({ts_col} IS NULL OR VALUES({ts_col}) >= {ts_col},
+                            VALUES({json_col}), {json_col}),
+            {ts_col} = IF({ts_col} IS NULL OR VALUES({ts_col}) >= {ts_col},
+                          VALUES({ts_col}), {ts_col})
+        """,
+        [
+            (name, station_id, _snapshot_json(row), ts)
+            for name, station_id, row, ts in snapshots
+            if name
+        ],
+    )
+
+# Fields of a snapshot carried in /api/live deltas, per kind.
+LIVE_FIELDS = {
+    "pollutant": ["aqi", "pm25_ug_m3", "PM10", "no2_ug_m3", "so2_ug_m3", "CO", "OZONE", "NH3"],
+    "meteo": ["temperature_c", "feels_like_c", "humidity_percent", "wind_kph",
+              "condition_main", "condition_text"],
+}
 
-            # fallback: latest any station
+def publish_latest(kind, snapshots):
+    """
+    After a commit: push the newest snapshot per station (same tuples as
+    upsert_latest_readings) to /api/live subscribers as one 'readings' event.
+    """
+    newest = {}
+    for name, station_id, row, ts in snapshots:
+        if name and (name not in newest or ts >= newest[name][2]):
+            newest[name] = (station_id, row, ts)
+    if not newest:
+        return
+    live_updates.publish(
+        "readings",
+        {
+            "kind": kind,
+            "stations": [
+                dict(
+                    {f: row.get(f) for f in LIVE_FIELDS[kind]},
+                    station=name,
+                    station_id=station_id,
+                    updated_at=ts,
+                )
+                for name, (station_id, row, ts) in newest.items()
+            ],
+        },
+    )
+
+def backfill_latest_readings(conn):
+    """One-time fill of latest_readings from history (groupwise max id)."""
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("SELECT 1 FROM latest_readings LIMIT 1")
+        if cur.fetchone():
+            return
+
+        cur.execute(
+            """
+            SELECT p.*
+            FROM pollutant_readings p
+            JOIN (SELECT location_name, MAX(record_id) AS record_id
+                  FROM pollutant_readings GROUP BY location_name) m
+              ON p.record_id = m.record_id
+            """
+        )
+        pollutant_rows = cur.fetchall()
+
+        cur.execute(
+            """
+            SELECT d.*
+            FROM meteorological_data d
+            JOIN (SELECT station_name, MAX(record_id) AS record_id
+                  FROM meteorological_data GROUP BY station_name) m
+              ON d.record_id = m.record_id
+            """
+        )
+        meteo_rows = cur.fetchall()
+
+        upsert_latest_readings(
+            cur,
+            "pollutant",
+            [
+                (r["location_name"], r.get("station_id"), r,
+                 _combine_date_time(r.get("reading_date"), r.get("reading_time")))
+                for r in pollutant_rows
+            ],
+        )
+        upsert_latest_readings(
+            cur,
+            "meteo",
+            [
+                (r["station_name"], r.get("station_id"), r,
+                 _combine_date_time(r.get("record_date"), r.get("record_time")))
+                for r in meteo_rows
+            ],
+        )
+    conn.commit()
+    print(
+        f"✅ Backfilled latest_readings "
+        f"({len(pollutant_rows)} pollutant, {len(meteo_rows)} weather stations)"
+    )
+
+def _combine_date_time(d, t):
+    """reading_date/reading_time (date|str, timedelta|time|str) → datetime."""
+    if d is None:
+        return datetime.now()
+    try:
+        if isinstance(t, timedelta):
+            t = format_timedelta(t)
+        return datetime.fromisoformat(f"{d} {t or '00:00:00'}")
+    except Exception:
+        return datetime.now()
+
+def get_latest_readings_for_station(station_display_name: str | None):
+    """
+    EXACT station match in latest_readings (primary-key lookup).
+    Missing halves fall back to the latest snapshot of any station.
+    Returns (pollutant_dict | None, meteorological_dict | None).
+    """
+    ensure_schema()
+    pollutant = meteo = None
+    with db_read_connection() as conn, conn.cursor(dictionary=True) as cur:
+        if station_display_name:
             cur.execute(
                 """
-                SELECT *
-                FROM meteorological_data
-                ORDER BY record_date DESC, record_time DESC, record_id DESC
-                LIMIT 1
+                SELECT pollutant_json, meteo_json
+                FROM latest_readings
+                WHERE station_name = %s
+                """,
+                (station_display_name,),
+            )
+            row = cur.fetchone()
+            if row:
+                pollutant = row["pollutant_json"]
+                meteo = row["meteo_json"]
+
+        # fallback: latest overall (index on the *_updated_at columns)
+        if pollutant is None:
+            cur.execute(
+                """
+                SELECT pollutant_json FROM latest_readings
+                WHERE pollutant_json IS NOT NULL
+                ORDER BY pollutant_updated_at DESC LIMIT 1
                 """
             )
             row = cur.fetchone()
-            return fix_timedelta(row) if row else None
+            pollutant = row["pollutant_json"] if row else None
 
-    finally:
-        conn.close()
+        if meteo is None:
+            cur.execute(
+                """
+                SELECT meteo_json FROM latest_readings
+                WHERE meteo_json IS NOT NULL
+                ORDER BY meteo_updated_at DESC LIMIT 1
+                """
+            )
+            row = cur.fetchone()
+            meteo = row["meteo_json"] if row else None
+
+    return _decode_snapshot(pollutant), _decode_snapshot(meteo)
+
+def get_latest_pollutant_reading_for_station(station_display_name: str | None):
+    """Latest pollutant snapshot for a station (see latest_readings)."""
+    return get_latest_readings_for_station(station_display_name)[0]
 
+def get_latest_meteorological_reading_for_station(station_display_name: str | None):
+    """Latest weather snapshot for a station (see latest_readings)."""
+    return get_latest_readings_for_station(station_display_name)[1]
+
+def _decode_snapshot(value):
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+def get_latest_readings_for_stations(station_names=None):
+    """
+    Latest snapshots for many stations in one query over latest_readings
+    (primary-key IN lookup; every station when station_names is None).
+    Returns {station_name: (pollutant_dict | None, meteorological_dict | None)};
+    stations without a row are left out (no latest-overall fallback).
+    """
+    sql = "SELECT station_name, pollutant_json, meteo_json FROM latest_readings"
+    params = ()
+    if station_names is not None:
+        params = list(dict.fromkeys(n for n in station_names if n))
+        if not params:
+            return {}
+        sql += f" WHERE station_name IN ({', '.join(['%s'] * len(params))})"
+    ensure_schema()
+    with db_read_connection() as conn, conn.cursor(dictionary=True) as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return {
+        r["station_name"]: (_decode_snapshot(r["pollutant_json"]), _decode_snapshot(r["meteo_json"]))
+        for r in rows
+    }
+
+
+def timed_get(provider, url, **kwargs):
+    """requests.get() with latency recorded per provider and status."""
+    status = "error"
+    started = perf_counter()
+    try:
+        r = get_http_session().get(url, **kwargs)
+        status = str(r.status_code)
+        return r
+    finally:
+        metrics.upstream_request_seconds.observe(
+            perf_counter() - started, provider=provider, status=status
+        )
 
-def fetch_openweather(lat: float, lon: float):
+def fetch_openweather(lat: float, lon: float, timeout: float = OPENWEATHER_TIMEOUT):
     """
     Fetch 5-day/3h forecast from OpenWeather for a given lat/lon.
-    We only use the first element (next forecast) for dashboard.
+    Every entry is stored in weather_forecast; the first one (next
+    forecast) also feeds the dashboard's current conditions.
     """
     url = "https://api.openweathermap.org/data/2.5/forecast"
     params = {
@@ -289,385 +1023,1035 @@ def fetch_openweather(lat: float, lon: float):
         "units": "metric",
         "appid": WEATHERAPI_KEY,
     }
-    r = requests.get(url, params=params, timeout=20)
+    r = timed_get("openweather", url, params=params, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
-def fetch_pollutant_data(pollutant_id: str):
+def fetch_pollutant_data(
+    pollutant_id: str,
+    timeout: float = POLLUTANT_API_TIMEOUT,
+    offset: int = 0,
+    limit: int = 1000,
+):
     API_URL = "https://api.data.gov.in/resource/3b01bcb8-0b14-4abf-b6f2-c1bfd384ba69"
     params = {
         "api-key": INDIA_DATA_API_KEY,
         "format": "json",
         "filters[state]": "Delhi",
         "filters[pollutant_id]": pollutant_id,
-        "limit": 1000,
+        "offset": offset,
+        "limit": limit,
     }
-    r = requests.get(API_URL, params=params, timeout=30)
+    r = timed_get("data.gov.in", API_URL, params=params, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
-def get_or_create_station_id(conn, station_name, latitude=None, longitude=None):
-    with conn.cursor() as cur:
-        cur.execute(
-            "SELECT station_id FROM stations WHERE name = %s", (station_name,)
-        )
-        row = cur.fetchone()
-        if row:
-            return row["station_id"]
+def iter_pollutant_records(pollutant_id: str, page_size: int = POLLUTANT_PAGE_SIZE):
+    """
+    Yield every record of one pollutant feed, following offset/total page
+    by page (a short page only ends the feed when `total` is missing).
+    Only one page is held in memory at a time.
+    """
+    offset = 0
+    for _ in range(POLLUTANT_MAX_PAGES):
+        pollutant_api_limiter.acquire()
+        page = fetch_pollutant_data(pollutant_id, offset=offset, limit=page_size)
+        recs = page.get("records") or []
+
+        for r in recs:
+            r["pollutant_id"] = pollutant_id  # normalize pollutant id
+            yield r
 
+        offset += len(recs)
+        try:
+            total = int(page.get("total") or 0)
+        except (TypeError, ValueError):
+            total = 0
+        if not recs:
+            return
+        if total:
+            # the API may cap `limit` below page_size (sample keys do), so
+            # a short page is not the end while `total` says otherwise
+            if offset >= total:
+                return
+        elif len(recs) < page_size:
+            return
+
+    print(f"⚠️ {pollutant_id}: stopped after {POLLUTANT_MAX_PAGES} pages ({offset} records)")
+
+def resolve_station_ids(conn, stations):
+    """
+    Bulk version of get_or_create_station_id().
+    stations: iterable of (name, latitude, longitude).
+    Names already in the station registry cost nothing; for the rest,
+    one SELECT for the existing ids, one multi-row INSERT for the missing
+    ones, one SELECT to read their new ids back. Does NOT commit: the
+    caller commits together with the rows that reference the stations
+    and then calls station_registry.ensure_known().
+    Returns {name: station_id}.
+    """
+    wanted = {}
+    for name, lat, lon in stations:
+        if name and name not in wanted:
+            wanted[name] = (lat, lon)
+    if not wanted:
+        return {}
+
+    cached = station_registry.cached_ids(wanted)
+    if len(cached) == len(wanted):
+        return cached
+    for name in cached:
+        del wanted[name]
+
+    def select_ids(names):
+        placeholders = ", ".join(["%s"] * len(names))
         cur.execute(
-            """
-            INSERT INTO stations (name, latitude, longitude)
-            VALUES (%s, %s, %s)
-            """,
-            (station_name, latitude, longitude),
+            f"SELECT station_id, name FROM stations WHERE name IN ({placeholders})",
+            tuple(names),
         )
-        conn.commit()
-        return cur.lastrowid
+        return {r["name"]: r["station_id"] for r in cur.fetchall()}
+
+    with conn.cursor(dictionary=True) as cur:
+        ids = select_ids(list(wanted))
+
+        missing = [n for n in wanted if n not in ids]
+        if missing:
+            cur.executemany(
+                """
+                INSERT INTO stations (name, latitude, longitude)
+                VALUES (%s, %s, %s)
+                """,
+                [(n, wanted[n][0], wanted[n][1]) for n in missing],
+            )
+            ids.update(select_ids(missing))
+
+    ids.update(cached)
+    return ids
+
+def get_or_create_station_id(conn, station_name, latitude=None, longitude=None):
+    station_id = resolve_station_ids(conn, [(station_name, latitude, longitude)])[
+        station_name
+    ]
+    conn.commit()
+    station_registry.ensure_known([station_name])
+    return station_id
 
 def create_user(first_name, middle_name, last_name, user_name, age):
     print(f"➡️ Attempting to save user: {user_name}")
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
-
-            # Check if username exists
-            cur.execute(
-                "SELECT user_id FROM users WHERE user_name = %s", (user_name,)
-            )
-            if cur.fetchone():
-                return {"status": "error", "message": "Username already exists"}
+        with db_connection() as conn:
+            with conn.cursor() as cur:
 
-            # Insert required fields
-            sql = """
-                INSERT INTO users
-                (first_name, middle_name, last_name, user_name, age)
-                VALUES (%s, %s, %s, %s, %s)
-            """
+                # Check if username exists
+                cur.execute(
+                    "SELECT user_id FROM users WHERE user_name = %s", (user_name,)
+                )
+                if cur.fetchone():
+                    return {"status": "error", "message": "Username already exists"}
+
+                # Insert required fields
+                sql = """
+                    INSERT INTO users
+                    (first_name, middle_name, last_name, user_name, age)
+                    VALUES (%s, %s, %s, %s, %s)
+                """
 
-            cur.execute(
-                sql,
-                (
-                    first_name,
-                    middle_name,
-                    last_name,
-                    user_name,
-                    age
+                cur.execute(
+                    sql,
+                    (
+                        first_name,
+                        middle_name,
+                        last_name,
+                        user_name,
+                        age
+                    )
                 )
-            )
 
-            conn.commit()
-            return {"status": "success", "user_id": cur.lastrowid}
+                conn.commit()
+                return {"status": "success", "user_id": cur.lastrowid}
 
     except Exception as e:
         print("DB Error:", e)
         return {"status": "error", "message": str(e)}
 
-    finally:
-        conn.close()
 
-def save_pollutant_records_to_db(records):
+POLLUTANT_COLUMNS = [
+    "station_id", "location_name",
+    "pm25_ug_m3", "so2_ug_m3", "no2_ug_m3",
+    "PM10", "CO", "OZONE", "NH3",
+    "reading_date", "reading_time", "aqi", "recorded_at", "source_updated_at",
+]
+
+POLLUTANT_INSERT_SQL = f"""
+    INSERT INTO pollutant_readings ({", ".join(POLLUTANT_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(POLLUTANT_COLUMNS))})
+"""
+
+# Sync writes hit uq_pollutant_station_source: replaying the same upstream
+# reading overwrites the stored row instead of adding another one.
+POLLUTANT_UPSERT_SQL = POLLUTANT_INSERT_SQL + "ON DUPLICATE KEY UPDATE " + ", ".join(
+    f"{c} = VALUES({c})"
+    for c in POLLUTANT_COLUMNS
+    if c not in ("station_id", "source_updated_at")
+)
+
+def _existing_pollutant_readings(cur, rows):
     """
-    Saves ONLY ONE latest pollutant reading per station per sync.
-    Groups all pollutants of a station, computes AQI, inserts one row.
+    (station_id, source_updated_at) → (location_name, recorded_at) of the
+    stored rows the upsert of `rows` will overwrite, locked FOR UPDATE so
+    a concurrent writer can't count the same reading as new too.
+    """
+    keys = sorted({
+        (r["station_id"], r["source_updated_at"])
+        for r in rows
+        if r["station_id"] is not None and r["source_updated_at"] is not None
+    })
+    existing = {}
+    for i in range(0, len(keys), BATCH_CHUNK_ROWS):
+        chunk = keys[i:i + BATCH_CHUNK_ROWS]
+        cur.execute(
+            f"""
+            SELECT station_id, source_updated_at, location_name, recorded_at
+            FROM pollutant_readings
+            WHERE (station_id, source_updated_at) IN ({", ".join(["(%s, %s)"] * len(chunk))})
+            FOR UPDATE
+            """,
+            [v for key in chunk for v in key],
+        )
+        for station_id, source_ts, name, recorded_at in cur.fetchall():
+            existing[(station_id, source_ts)] = (name, recorded_at)
+    return existing
+
+def upsert_pollutant_readings(cur, rows):
     """
-    conn = get_db_connection()
+    Write pollutant row dicts through POLLUTANT_UPSERT_SQL in
+    BATCH_CHUNK_ROWS multi-row INSERTs (mysql.connector turns executemany
+    on an INSERT into a single statement) and keep pollutant_rollup exact:
+    new readings are folded into their buckets, and buckets touched by a
+    reading that replaced a stored one (same station_id and
+    source_updated_at, e.g. a replayed feed or batch) are recomputed.
+    """
+    existing = _existing_pollutant_readings(cur, rows)
+    new_rows = []
+    replaced = set()  # (location_name, recorded_at) of old and new versions
+    seen = {}  # key → (location_name, recorded_at) of its previous row in this batch
+    for row in rows:
+        key = (row["station_id"], row["source_updated_at"])
+        point = (row["location_name"], row["recorded_at"])
+        if None in key:
+            new_rows.append(row)
+            continue
+        if key in existing or key in seen:
+            replaced.add(point)
+            if key in existing:
+                replaced.add(existing[key])
+            if key in seen:
+                # the earlier copy was folded (or recomputed) where it sat
+                replaced.add(seen[key])
+        else:
+            new_rows.append(row)
+        seen[key] = point
+
+    for i in range(0, len(rows), BATCH_CHUNK_ROWS):
+        cur.executemany(
+            POLLUTANT_UPSERT_SQL,
+            [tuple(row[c] for c in POLLUTANT_COLUMNS) for row in rows[i:i + BATCH_CHUNK_ROWS]],
+        )
+    upsert_pollutant_rollup(cur, new_rows)
+    recompute_pollutant_rollup(cur, replaced)
+
+# data.gov.in sends last_update as "18-10-2026 09:00:00"
+SOURCE_TIMESTAMP_FORMATS = ("%d-%m-%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+def parse_source_timestamp(raw):
+    """Upstream timestamp string → naive datetime (None if unparseable)."""
+    if not raw:
+        return None
+    raw = str(raw).strip()
     try:
-        with conn.cursor() as cur:
-            grouped = {}
-
-            for rec in records:
-                station = (
-                    rec.get("station")
-                    or rec.get("station_name")
-                    or rec.get("location")
-                    or rec.get("city")
+        # keep the feed's wall-clock time; the DB columns are naive
+        return datetime.fromisoformat(raw).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for fmt in SOURCE_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt)
+        except ValueError:
+            continue
+    return None
+
+# AQI engine pollutant key → pollutant_readings column
+AQI_READING_COLUMNS = {
+    "PM2.5": "pm25_ug_m3",
+    "PM10": "PM10",
+    "SO2": "so2_ug_m3",
+    "NO2": "no2_ug_m3",
+    "O3": "OZONE",
+    "CO": "CO",
+    "NH3": "NH3",
+}
+
+def backfill_aqi(only_missing=True, chunk_size=5000):
+    """
+    Recompute aqi for historical pollutant_readings with the batch engine,
+    walking the table in record_id order one chunk (one commit) at a time.
+    """
+    ensure_schema()
+    where = "AND aqi IS NULL" if only_missing else ""
+    columns = ", ".join(AQI_READING_COLUMNS.values())
+    last_id = 0
+    updated = 0
+
+    while True:
+        with db_connection() as conn:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute(
+                    f"""
+                    SELECT record_id, {columns}
+                    FROM pollutant_readings
+                    WHERE record_id > %s {where}
+                    ORDER BY record_id
+                    LIMIT %s
+                    """,
+                    (last_id, chunk_size),
                 )
-                if not station:
-                    continue
-
-                station = station.strip().replace(" ,", ",").replace("  ", " ")
-
-                if station not in grouped:
-                    grouped[station] = {
-                        "PM2.5": None,
-                        "PM10": None,
-                        "SO2": None,
-                        "NO2": None,
-                        "OZONE": None,
-                        "CO": None,
-                        "NH3": None,
-                        "latitude": clean_value(rec.get("latitude")),
-                        "longitude": clean_value(rec.get("longitude")),
-                        "timestamp": None,
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                aqi, _ = calculate_aqi_batch(
+                    {
+                        p: [r[col] for r in rows]
+                        for p, col in AQI_READING_COLUMNS.items()
                     }
-
-                # pollutant ID normalize
-                pid = str(rec.get("pollutant_id", "")).upper()
-                if pid in grouped[station]:
-                    grouped[station][pid] = clean_value(rec.get("avg_value"))
-
-                # timestamp normalize
-                ts_raw = (
-                    rec.get("last_update")
-                    or rec.get("date")
-                    or rec.get("timestamp")
                 )
-                ts = None
-                if ts_raw:
-                    try:
-                        ts = datetime.fromisoformat(ts_raw)
-                    except Exception:
-                        try:
-                            ts = datetime.strptime(ts_raw, "%Y-%m-%d %H:%M:%S")
-                        except Exception:
-                            ts = None
-
-                if ts:
-                    old = grouped[station]["timestamp"]
-                    if old is None or ts > old:
-                        grouped[station]["timestamp"] = ts
-
-            # insert final rows per station
-            for station_name, pollutants in grouped.items():
-                now = datetime.now()
-                reading_date = now.strftime("%Y-%m-%d")
-                reading_time = now.strftime("%H:%M:%S")
-
-                lat = pollutants.get("latitude")
-                lon = pollutants.get("longitude")
-
-                station_id = get_or_create_station_id(
-                    conn, station_name, latitude=lat, longitude=lon
+                cur.executemany(
+                    "UPDATE pollutant_readings SET aqi = %s WHERE record_id = %s",
+                    list(zip(aqi_to_list(aqi), [r["record_id"] for r in rows])),
                 )
+                data_generation.bump(cur)
+            conn.commit()
 
-                pollutant_data = {
-                    "PM2.5": pollutants.get("PM2.5"),
-                    "PM10": pollutants.get("PM10"),
-                    "SO2": pollutants.get("SO2"),
-                    "NO2": pollutants.get("NO2"),
-                    "O3": pollutants.get("OZONE"),
-                    "CO": pollutants.get("CO"),
-                    "NH3": pollutants.get("NH3"),
-                }
+        last_id = rows[-1]["record_id"]
+        updated += len(rows)
+        print(f"🧮 AQI backfill: {updated} rows (up to record_id {last_id})")
 
-                aqi, _ = calculate_aqi(pollutant_data)
+    print(f"✅ AQI backfill done: {updated} rows updated")
+    return updated
 
-                cur.execute(
-                    """
-                    INSERT INTO pollutant_readings
-                    (station_id, location_name,
-                     pm25_ug_m3, so2_ug_m3, no2_ug_m3,
-                     PM10, CO, OZONE, NH3,
-                     reading_date, reading_time, aqi)
-                    VALUES (%s, %s, %s, %s, %s,
-                            %s, %s, %s, %s,
-                            %s, %s, %s)
-                    """,
-                    (
-                        station_id,
-                        station_name,
-                        pollutants.get("PM2.5"),
-                        pollutants.get("SO2"),
-                        pollutants.get("NO2"),
-                        pollutants.get("PM10"),
-                        pollutants.get("CO"),
-                        pollutants.get("OZONE"),
-                        pollutants.get("NH3"),
-                        reading_date,
-                        reading_time,
-                        aqi,
-                    ),
-                )
+def add_pollutant_record(grouped, rec):
+    """
+    Fold one raw India API record (one station, one pollutant) into
+    `grouped`: one dict per station with every pollutant value and the
+    newest timestamp.
+    """
+    station = (
+        rec.get("station")
+        or rec.get("station_name")
+        or rec.get("location")
+        or rec.get("city")
+    )
+    if not station:
+        return
 
-        conn.commit()
-        print(f"✅ Saved {len(grouped)} station rows into pollutant_readings")
-    finally:
-        conn.close()
+    station = station.strip().replace(" ,", ",").replace("  ", " ")
+
+    if station not in grouped:
+        grouped[station] = {
+            "PM2.5": None,
+            "PM10": None,
+            "SO2": None,
+            "NO2": None,
+            "OZONE": None,
+            "CO": None,
+            "NH3": None,
+            "latitude": clean_value(rec.get("latitude")),
+            "longitude": clean_value(rec.get("longitude")),
+            "timestamp": None,
+        }
 
-def save_openweather_to_db(weather_json, station_name: str):
+    # pollutant ID normalize
+    pid = str(rec.get("pollutant_id", "")).upper()
+    if pid in grouped[station]:
+        grouped[station][pid] = clean_value(rec.get("avg_value"))
+
+    # timestamp normalize
+    ts_raw = (
+        rec.get("last_update")
+        or rec.get("date")
+        or rec.get("timestamp")
+    )
+    ts = parse_source_timestamp(ts_raw)
+    if ts:
+        old = grouped[station]["timestamp"]
+        if old is None or ts > old:
+            grouped[station]["timestamp"] = ts
+
+def group_pollutant_records(records):
+    """Group an iterable of raw India API records per station."""
+    grouped = {}
+    for rec in records:
+        add_pollutant_record(grouped, rec)
+    return grouped
+
+def save_pollutant_records_to_db(records):
     """
-    Save a single weather snapshot for one station into meteorological_data.
-    location_name will be the station_name (so front-end can query by station).
+    Saves ONLY ONE latest pollutant reading per station per sync.
+    Groups all pollutants of a station, then hands off to
+    save_grouped_pollutants_to_db().
     """
-    if not weather_json:
+    save_grouped_pollutants_to_db(group_pollutant_records(records))
+
+def load_pollutant_watermarks(cur, station_ids):
+    """
+    station_id → stored source_updated_at, locking those watermark rows so
+    two overlapping syncs cannot both write the same upstream reading.
+    """
+    ids = sorted({sid for sid in station_ids if sid is not None})
+    if not ids:
+        return {}
+    cur.execute(
+        f"""
+        SELECT station_id, source_updated_at FROM pollutant_watermarks
+        WHERE station_id IN ({", ".join(["%s"] * len(ids))})
+        FOR UPDATE
+        """,
+        ids,
+    )
+    return {sid: ts for sid, ts in cur.fetchall()}
+
+def save_grouped_pollutants_to_db(grouped, complete=True):
+    """
+    grouped: output of group_pollutant_records() / add_pollutant_record().
+    complete: False when some pollutant feeds failed. The rows are still
+    saved, but watermarks are left alone so the next (complete) feed for
+    the same `last_update` is not skipped and fills in what was missing.
+
+    Delta sync: a station is only written when its upstream `last_update`
+    is newer than its watermark in pollutant_watermarks. Rows are stamped
+    with that source timestamp and written through POLLUTANT_UPSERT_SQL,
+    so replaying a feed is idempotent. Stations without a parseable
+    timestamp are always written (stamped with the current time).
+    Everything goes out in one executemany and ONE commit.
+    """
+    if not grouped:
         return
 
-    try:
-        entry = weather_json["list"][0]
-
-        temperature = entry["main"]["temp"]
-        feels_like = entry["main"].get("feels_like")
-        pressure = entry["main"].get("pressure")
-        grnd_level = entry["main"].get("grnd_level")
-        humidity = entry["main"]["humidity"]
-        wind_speed = entry["wind"]["speed"]
-        wind_deg = entry["wind"].get("deg")
-        wind_gust = entry["wind"].get("gust")
-        clouds_all = entry.get("clouds", {}).get("all")
-        visibility = entry.get("visibility", 0) / 1000.0
-        pop = entry.get("pop")
-        rain_3h = entry.get("rain", {}).get("3h")
-
-        weather_main = entry["weather"][0]["main"]
-        weather_desc = entry["weather"][0]["description"]
-
-        city_block = weather_json.get("city", {})
-        sunrise_ts = city_block.get("sunrise")
-        sunset_ts = city_block.get("sunset")
-
-        sunrise = (
-            datetime.fromtimestamp(sunrise_ts).strftime("%H:%M:%S")
-            if sunrise_ts else None
+    now = datetime.now().replace(microsecond=0)
+
+    with db_connection() as conn:
+        station_ids = resolve_station_ids(
+            conn,
+            [
+                (name, p.get("latitude"), p.get("longitude"))
+                for name, p in grouped.items()
+            ],
         )
-        sunset = (
-            datetime.fromtimestamp(sunset_ts).strftime("%H:%M:%S")
-            if sunset_ts else None
+
+        with conn.cursor() as cur:
+            watermarks = load_pollutant_watermarks(cur, station_ids.values())
+
+        changed = {}
+        for name, pollutants in grouped.items():
+            source_ts = pollutants.get("timestamp")
+            mark = watermarks.get(station_ids.get(name))
+            if source_ts is None or mark is None or source_ts > mark:
+                changed[name] = pollutants
+
+        skipped = len(grouped) - len(changed)
+        if not changed:
+            conn.rollback()  # release the watermark locks
+            print(f"⏭  Pollutant feed unchanged for all {skipped} stations")
+            return
+
+        # AQI for every changed station in one vectorized pass
+        aqi_values, _ = calculate_aqi_batch(
+            {
+                "PM2.5": [p.get("PM2.5") for p in changed.values()],
+                "PM10": [p.get("PM10") for p in changed.values()],
+                "SO2": [p.get("SO2") for p in changed.values()],
+                "NO2": [p.get("NO2") for p in changed.values()],
+                "O3": [p.get("OZONE") for p in changed.values()],
+                "CO": [p.get("CO") for p in changed.values()],
+                "NH3": [p.get("NH3") for p in changed.values()],
+            }
         )
 
-        record_date = datetime.now().strftime("%Y-%m-%d")
-        record_time = datetime.now().strftime("%H:%M:%S")
+        rows = []
+        latest = []
+        new_marks = []
+        for (station_name, pollutants), aqi in zip(
+            changed.items(), aqi_to_list(aqi_values)
+        ):
+            source_ts = pollutants.get("timestamp")
+            reading_at = source_ts or now
+            row = {
+                "station_id": station_ids.get(station_name),
+                "location_name": station_name,
+                "pm25_ug_m3": pollutants.get("PM2.5"),
+                "so2_ug_m3": pollutants.get("SO2"),
+                "no2_ug_m3": pollutants.get("NO2"),
+                "PM10": pollutants.get("PM10"),
+                "CO": pollutants.get("CO"),
+                "OZONE": pollutants.get("OZONE"),
+                "NH3": pollutants.get("NH3"),
+                "reading_date": reading_at.strftime("%Y-%m-%d"),
+                "reading_time": reading_at.strftime("%H:%M:%S"),
+                "aqi": aqi,
+                "recorded_at": reading_at,
+                "source_updated_at": source_ts,
+            }
+            rows.append(row)
+            latest.append((station_name, row["station_id"], row, reading_at))
+            if complete and source_ts is not None and row["station_id"] is not None:
+                new_marks.append((row["station_id"], source_ts, now))
 
-        # ----------------------------------------------------
-        # ⭐ FIX: Resolve station_id correctly
-        # ----------------------------------------------------
-        conn = get_db_connection()
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT station_id FROM stations WHERE name = %s",
-                (station_name,)
-            )
-            row = cur.fetchone()
-            if row:
-                station_id = row["station_id"]
-            else:
-                cur.execute(
-                    "INSERT INTO stations (name) VALUES (%s)",
-                    (station_name,)
+            upsert_pollutant_readings(cur, rows)
+            upsert_latest_readings(cur, "pollutant", latest)
+            if new_marks:
+                cur.executemany(
+                    """
+                    INSERT INTO pollutant_watermarks
+                        (station_id, source_updated_at, synced_at)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        source_updated_at = GREATEST(source_updated_at,
+                                                     VALUES(source_updated_at)),
+                        synced_at = VALUES(synced_at)
+                    """,
+                    new_marks,
                 )
-                conn.commit()
-                station_id = cur.lastrowid
+            data_generation.bump(cur)
+
+        conn.commit()
+        print(
+            f"✅ Saved {len(rows)} changed station rows into pollutant_readings"
+            f" ({skipped} unchanged skipped)"
+        )
+
+    station_registry.ensure_known(station_ids)
+    publish_latest("pollutant", latest)
+
+# Per-entry forecast fields; same names as the meteorological_data columns.
+FORECAST_FIELDS = [
+    "temperature_c", "feels_like_c", "pressure_hpa", "grnd_level_hpa",
+    "humidity_percent", "wind_kph", "wind_deg", "wind_gust",
+    "visibility_km", "clouds_percent",
+    "precipitation_prob", "rain_3h",
+    "condition_main", "condition_text",
+    "sunrise", "sunset",
+]
+
+def _forecast_entry(entry, sunrise, sunset):
+    return {
+        "temperature_c": entry["main"]["temp"],
+        "feels_like_c": entry["main"].get("feels_like"),
+        "pressure_hpa": entry["main"].get("pressure"),
+        "grnd_level_hpa": entry["main"].get("grnd_level"),
+        "humidity_percent": entry["main"]["humidity"],
+        "wind_kph": entry["wind"]["speed"],
+        "wind_deg": entry["wind"].get("deg"),
+        "wind_gust": entry["wind"].get("gust"),
+        "visibility_km": entry.get("visibility", 0) / 1000.0,
+        "clouds_percent": entry.get("clouds", {}).get("all"),
+        "precipitation_prob": entry.get("pop"),
+        "rain_3h": entry.get("rain", {}).get("3h"),
+        "condition_main": entry["weather"][0]["main"],
+        "condition_text": entry["weather"][0]["description"],
+        "sunrise": sunrise,
+        "sunset": sunset,
+    }
 
-            # NOW safe to insert
+def _city_sun_times(weather_json):
+    city_block = weather_json.get("city", {})
+    sunrise_ts = city_block.get("sunrise")
+    sunset_ts = city_block.get("sunset")
+    return (
+        datetime.fromtimestamp(sunrise_ts).strftime("%H:%M:%S") if sunrise_ts else None,
+        datetime.fromtimestamp(sunset_ts).strftime("%H:%M:%S") if sunset_ts else None,
+    )
+
+def parse_forecast_entries(weather_json):
+    """
+    Every entry of an OpenWeather /forecast payload as a dict of
+    FORECAST_FIELDS plus target_at (the forecast time, server-local).
+    """
+    sunrise, sunset = _city_sun_times(weather_json)
+    entries = []
+    for entry in weather_json.get("list", []):
+        try:
+            row = _forecast_entry(entry, sunrise, sunset)
+            row["target_at"] = datetime.fromtimestamp(entry["dt"])
+        except (KeyError, IndexError, TypeError) as e:
+            print("⚠️ Skipping malformed forecast entry:", e)
+            continue
+        entries.append(row)
+    return entries
+
+def _stamp_snapshot(fields, now):
+    """Forecast fields → meteorological_data row recorded at `now`."""
+    return dict(
+        fields,
+        record_date=now.strftime("%Y-%m-%d"),
+        record_time=now.strftime("%H:%M:%S"),
+        recorded_at=now.replace(microsecond=0),
+    )
+
+def parse_openweather_snapshot(weather_json):
+    """
+    Pull the next forecast entry out of an OpenWeather /forecast payload
+    as a dict of meteorological_data columns (without station fields).
+    """
+    sunrise, sunset = _city_sun_times(weather_json)
+    entry = _forecast_entry(weather_json["list"][0], sunrise, sunset)
+    return _stamp_snapshot(entry, datetime.now())
+
+METEO_COLUMNS = [
+    "temperature_c", "feels_like_c", "pressure_hpa", "grnd_level_hpa",
+    "humidity_percent", "wind_kph", "wind_deg", "wind_gust",
+    "visibility_km", "clouds_percent",
+    "precipitation_prob", "rain_3h",
+    "condition_main", "condition_text",
+    "sunrise", "sunset", "record_date", "record_time", "recorded_at",
+]
+
+METEO_INSERT_SQL = f"""
+    INSERT INTO meteorological_data ({", ".join(METEO_COLUMNS)}, station_id, station_name)
+    VALUES ({", ".join(["%s"] * (len(METEO_COLUMNS) + 2))})
+"""
+
+FORECAST_COLUMNS = ["station_name", "target_at", "station_id", "fetched_at"] + FORECAST_FIELDS
+
+FORECAST_UPSERT_SQL = f"""
+    INSERT INTO weather_forecast ({", ".join(FORECAST_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(FORECAST_COLUMNS))})
+    ON DUPLICATE KEY UPDATE {", ".join(
+        f"{c} = VALUES({c})" for c in FORECAST_COLUMNS[2:]
+    )}
+"""
+
+def load_fresh_forecasts(station_names, max_age_minutes=FORECAST_MAX_AGE_MINUTES):
+    """
+    station_name → next stored forecast entry (FORECAST_FIELDS) for every
+    station whose stored forecast was fetched within max_age_minutes.
+    Those stations need no OpenWeather call this run.
+    """
+    names = sorted(set(station_names))
+    if not names or max_age_minutes <= 0:
+        return {}
+    now = datetime.now().replace(microsecond=0)
+    fresh_after = now - timedelta(minutes=max_age_minutes)
+    placeholders = ", ".join(["%s"] * len(names))
+
+    with db_connection() as conn:
+        with conn.cursor(dictionary=True) as cur:
             cur.execute(
-                """
-                INSERT INTO meteorological_data(
-                    temperature_c, feels_like_c, pressure_hpa, grnd_level_hpa,
-                    humidity_percent, wind_kph, wind_deg, wind_gust,
-                    visibility_km, clouds_percent,
-                    precipitation_prob, rain_3h,
-                    condition_main, condition_text,
-                    sunrise, sunset, record_date, record_time,
-                    station_id, station_name
-                )
-                VALUES (%s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s, %s)
+                f"""
+                SELECT f.station_name, {", ".join(f"f.{c}" for c in FORECAST_FIELDS)}
+                FROM weather_forecast f
+                JOIN (
+                    SELECT station_name, MIN(target_at) AS target_at
+                    FROM weather_forecast
+                    WHERE station_name IN ({placeholders})
+                      AND target_at >= %s AND fetched_at >= %s
+                    GROUP BY station_name
+                ) nxt
+                  ON nxt.station_name = f.station_name AND nxt.target_at = f.target_at
                 """,
-                (
-                    temperature,
-                    feels_like,
-                    pressure,
-                    grnd_level,
-                    humidity,
-                    wind_speed,
-                    wind_deg,
-                    wind_gust,
-                    visibility,
-                    clouds_all,
-                    pop,
-                    rain_3h,
-                    weather_main,
-                    weather_desc,
-                    sunrise,
-                    sunset,
-                    record_date,
-                    record_time,
-                    station_id,
-                    station_name,
-                ),
+                (*names, now, fresh_after),
             )
-            conn.commit()
+            rows = cur.fetchall()
+
+    fresh = {}
+    for r in rows:
+        name = r.pop("station_name")
+        for key in ("sunrise", "sunset"):
+            if isinstance(r[key], timedelta):
+                r[key] = format_timedelta(r[key])
+        fresh[name] = r
+    return fresh
 
-        conn.close()
+def save_openweather_batch_to_db(snapshots, cached=()):
+    """
+    Save many weather snapshots at once.
+    snapshots: iterable of (weather_json, station_name) fresh from the API;
+        every forecast entry goes to weather_forecast and the next one to
+        meteorological_data.
+    cached: iterable of (station_name, forecast_fields) from
+        load_fresh_forecasts(); only recorded in meteorological_data.
+    Station ids are resolved in bulk and every table gets one executemany,
+    all in ONE commit. Bad payloads are skipped and logged.
+    """
+    now = datetime.now().replace(microsecond=0)
+    parsed = []
+    forecasts = []
+    for weather_json, station_name in snapshots:
+        if not weather_json:
+            continue
+        try:
+            parsed.append((station_name, parse_openweather_snapshot(weather_json)))
+            forecasts.append((station_name, parse_forecast_entries(weather_json)))
+        except Exception as e:
+            print(f"OpenWeather Save Error for {station_name}:", e)
+    for station_name, fields in cached:
+        parsed.append((station_name, _stamp_snapshot(fields, now)))
+
+    if not parsed:
+        return 0
+
+    columns = METEO_COLUMNS + ["station_id", "station_name"]
+
+    with db_connection() as conn:
+        station_ids = resolve_station_ids(
+            conn, [(name, None, None) for name, _ in parsed]
+        )
+        rows = []
+        latest = []
+        dicts = []
+        for name, m in parsed:
+            row = dict(m, station_id=station_ids.get(name), station_name=name)
+            rows.append(tuple(row[c] for c in columns))
+            latest.append((name, row["station_id"], row, row["recorded_at"]))
+            dicts.append(row)
+        forecast_rows = [
+            tuple(
+                dict(e, station_name=name, station_id=station_ids.get(name),
+                     fetched_at=now)[c]
+                for c in FORECAST_COLUMNS
+            )
+            for name, entries in forecasts
+            for e in entries
+        ]
+        with conn.cursor() as cur:
+            cur.executemany(METEO_INSERT_SQL, rows)
+            upsert_latest_readings(cur, "meteo", latest)
+            upsert_temperature_hourly(cur, dicts)
+            if forecast_rows:
+                cur.executemany(FORECAST_UPSERT_SQL, forecast_rows)
+                cur.execute(
+                    "DELETE FROM weather_forecast WHERE target_at < %s",
+                    (now - timedelta(hours=FORECAST_RETENTION_HOURS),),
+                )
+            data_generation.bump(cur)
+        conn.commit()
+
+    station_registry.ensure_known(station_ids)
+    publish_latest("meteo", latest)
+    return len(rows)
+
+def save_openweather_to_db(weather_json, station_name: str):
+    """
+    Save a single weather snapshot for one station into meteorological_data.
+    location_name will be the station_name (so front-end can query by station).
+    """
+    try:
+        save_openweather_batch_to_db([(weather_json, station_name)])
     except Exception as e:
         print(f"OpenWeather Save Error for {station_name}:", e)
 
-def sync_external_data():
+def weather_grid_cells(stations, cell_degrees=WEATHER_GRID_DEGREES):
     """
-    Called by fetch.py every hour (no Flask request context).
-    - Pollutant sync: same as before
-    - Weather sync: now per station, using stations.latitude/longitude
+    Group stations (dicts with name/latitude/longitude) by grid cell.
+    Returns [(lat, lon, [stations...])], with lat/lon at the cell centre,
+    in first-seen order. cell_degrees <= 0 gives one cell per station at
+    its own coordinates.
     """
+    if cell_degrees <= 0:
+        return [(s["latitude"], s["longitude"], [s]) for s in stations]
+
+    cells = {}
+    for s in stations:
+        key = (
+            math.floor(float(s["latitude"]) / cell_degrees),
+            math.floor(float(s["longitude"]) / cell_degrees),
+        )
+        cells.setdefault(key, []).append(s)
 
-    print("🔄 sync_external_data(): starting external API sync")
+    return [
+        (
+            round((i + 0.5) * cell_degrees, 6),
+            round((j + 0.5) * cell_degrees, 6),
+            members,
+        )
+        for (i, j), members in cells.items()
+    ]
 
-    # 1) Pollutant sync (India API)
-    try:
-        pollutant_ids = ["PM2.5", "SO2", "NO2", "OZONE", "CO", "NH3", "PM10"]
-        all_records = []
+class IncompleteStage(Exception):
+    """A sync stage got only part of its upstream data."""
 
-        for pid in pollutant_ids:
-            resp = fetch_pollutant_data(pid)
-            recs = resp.get("records", [])
+def sync_pollutants(timer, deadline=None, final=True):
+    """
+    Pollutant stage: every pollutant id fetched concurrently, grouped per
+    station as pages arrive, then saved in one transaction.
+    Raises IncompleteStage (without saving) if any feed failed, unless this
+    is the final attempt, which saves whatever arrived.
+    """
+    pollutant_ids = ["PM2.5", "SO2", "NO2", "OZONE", "CO", "NH3", "PM10"]
+
+    # Pages are grouped per station as they arrive, so only the
+    # grouped rows (not every raw record) are kept in memory.
+    grouped = {}
+    group_lock = threading.Lock()
+    closed = False
+
+    def ingest_feed(pid):
+        count = 0
+        for rec in iter_pollutant_records(pid):
+            with group_lock:
+                if closed:  # stage deadline passed
+                    break
+                add_pollutant_record(grouped, rec)
+            count += 1
+        return count
+
+    with timer.stage("pollutant_fetch"):
+        results = fan_out(
+            ingest_feed,
+            pollutant_ids,
+            max_workers=SYNC_CONCURRENCY,
+            deadline=time_left(deadline, SYNC_STAGE_DEADLINE),
+        )
+        with group_lock:
+            closed = True
+
+    failed = []
+    for pid, count, err in results:
+        if err is not None:
+            print(f"⚠️ India API error for {pid}:", err)
+            failed.append(pid)
+        else:
+            print(f"   {pid}: {count} records")
 
-            for r in recs:
-                r["pollutant_id"] = pid  # normalize pollutant id
+    # Only the last attempt saves a partial feed, and without advancing
+    # the station watermarks, so the next run stores the complete one.
+    if failed and not final:
+        raise IncompleteStage(f"pollutant feeds failed: {', '.join(failed)}")
 
-            all_records.extend(recs)
+    with timer.stage("pollutant_save"):
+        if grouped:
+            save_grouped_pollutants_to_db(grouped, complete=not failed)
+        else:
+            print("⚠️ India API returned NO pollutant data")
+
+def sync_weather(timer, deadline=None, final=True, done=None):
+    """
+    Weather stage: per station, using stations.latitude/longitude, fetched
+    concurrently once per WEATHER_GRID_DEGREES cell and saved for every
+    station in the cell; stations with a fresh stored forecast are served
+    from weather_forecast instead.
+    `done` collects the stations saved so far, so a retry only fetches the
+    cells that failed. Raises IncompleteStage if any cell failed.
+    """
+    done = set() if done is None else done
+    stations = station_registry.with_coordinates()
+
+    print(f"🌤  Fetching weather for {len(stations)} stations")
+
+    targets = []
+    for s in stations:
+        if s["name"] in done:
+            continue
+        if s["latitude"] is None or s["longitude"] is None:
+            print(f"Skipping station {s['name']}: missing lat/lon")
+            continue
+        targets.append(s)
+
+    with timer.stage("forecast_lookup"):
+        fresh = load_fresh_forecasts(s["name"] for s in targets)
+    if fresh:
+        print(f"   {len(fresh)} stations have a fresh stored forecast, not refetched")
+    targets = [s for s in targets if s["name"] not in fresh]
+
+    cells = weather_grid_cells(targets)
+    timer.count("weather_calls", len(cells))
+    timer.count("weather_calls_saved", len(targets) - len(cells))
+    if len(cells) < len(targets):
+        print(
+            f"   {len(targets)} stations share {len(cells)} grid cells:"
+            f" {len(targets) - len(cells)} OpenWeather calls saved"
+        )
+
+    with timer.stage("weather_fetch"):
+        results = fan_out(
+            lambda cell: fetch_openweather(cell[0], cell[1]),
+            cells,
+            max_workers=SYNC_CONCURRENCY,
+            limiter=openweather_limiter,
+            deadline=time_left(deadline, SYNC_STAGE_DEADLINE),
+        )
+
+    failed = 0
+    with timer.stage("weather_save"):
+        snapshots = []
+        for (lat, lon, members), wjson, err in results:
+            if err is not None:
+                print(f"⚠️ Weather sync error for cell ({lat}, {lon}):", err)
+                failed += 1
+                continue
+            snapshots.extend((wjson, s["name"]) for s in members)
+
+        saved = save_openweather_batch_to_db(snapshots, fresh.items())
+        print(f"✅ Saved {saved} station rows into meteorological_data")
+
+    done.update(name for _, name in snapshots)
+    done.update(fresh)
+    if failed:
+        raise IncompleteStage(f"{failed} of {len(cells)} weather cells failed")
+
+def sync_external_data(deadline=None, attempts=1):
+    """
+    Called by fetch.py / the sync scheduler (no Flask request context).
+    Runs the pollutant stage, then the weather stage, each retried up to
+    `attempts` times with exponential backoff. `deadline` is an absolute
+    time.monotonic() value after which no stage or retry is started and
+    running fetches are cut off.
+    Returns a dict of stage durations (seconds), counters and per-stage
+    status.
+    """
 
-        if all_records:
-            save_pollutant_records_to_db(all_records)
-        else:
-            print("⚠️ India API returned NO pollutant data")
+    print("🔄 sync_external_data(): starting external API sync")
+    timer = StageTimer()
+    ensure_schema()
+
+    weather_done = set()
+    stages = [
+        ("pollutants", lambda final: sync_pollutants(timer, deadline, final)),
+        ("weather", lambda final: sync_weather(timer, deadline, final, weather_done)),
+    ]
+    status = {}
+    for name, stage in stages:
+        if deadline is not None and time_left(deadline) <= 0:
+            print(f"⏰ sync deadline reached, skipping {name} stage")
+            status[name] = "skipped"
+            continue
+        try:
+            retry(
+                stage,
+                attempts=attempts,
+                base_delay=SYNC_RETRY_BASE_DELAY,
+                deadline=deadline,
+                label=f"{name} stage",
+            )
+            status[name] = "ok"
+        except Exception as e:
+            print(f"⚠️ {name} sync error:", e)
+            status[name] = "error"
+
+    report = timer.report()
+    report["stages"] = status
+    print("⏱  sync stage timings:", report)
+    return report
+
+def last_sync_run():
+    """Newest slot any scheduler process has run (see sync_runs)."""
+    ensure_schema()
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(slot_at) FROM sync_runs")
+            row = cur.fetchone()
+    return row[0] if row else None
 
-    except Exception as e:
-        print("⚠️ India API sync error:", e)
+def record_sync_run(slot_at, started, finished, status, report):
+    metrics.sync_runs.inc(status=status)
+    for stage, seconds in report.items():
+        if stage in SYNC_TIMED_STAGES:
+            metrics.sync_stage_seconds.observe(seconds, stage=stage)
 
-    # 2) Weather sync per station
-    try:
-        conn = get_db_connection()
+    with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT name, latitude, longitude
-                FROM stations
-                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-                """
+                INSERT INTO sync_runs
+                    (slot_at, started_at, finished_at, status, host, report)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    slot_at,
+                    started.replace(microsecond=0),
+                    finished.replace(microsecond=0),
+                    status,
+                    f"{socket.gethostname()}:{os.getpid()}",
+                    json_dumps(report),
+                ),
             )
-            stations = cur.fetchall()
-
-        conn.close()
-
-        print(f"🌤  Fetching weather for {len(stations)} stations")
-
-        for s in stations:
-            name = s["name"]
-            lat = s["latitude"]
-            lon = s["longitude"]
-
-            if lat is None or lon is None:
-                print(f"Skipping station {name}: missing lat/lon")
-                continue
+        conn.commit()
 
-            try:
-                wjson = fetch_openweather(lat, lon)
-                save_openweather_to_db(wjson, name)
-            except Exception as e:
-                print(f"⚠️ Weather sync error for {name}:", e)
+SYNC_TIMED_STAGES = {
+    "pollutant_fetch", "pollutant_save",
+    "forecast_lookup", "weather_fetch", "weather_save",
+}
 
-    except Exception as e:
-        print("⚠️ Station weather sync error:", e)
+def build_sync_scheduler():
+    """
+    Scheduler for sync_external_data(): single-flight across every process
+    through a MySQL named lock, retries per stage, one deadline per run.
+    """
+    def job(deadline):
+        report = sync_external_data(deadline=deadline, attempts=SYNC_STAGE_ATTEMPTS)
+        if any(v != "ok" for v in report["stages"].values()):
+            report["status"] = "partial"
+        return report
+
+    return SyncScheduler(
+        job,
+        MySQLLock(get_db_connection, SYNC_LOCK_NAME),
+        last_run=last_sync_run,
+        record_run=record_sync_run,
+        interval=SYNC_INTERVAL_SECONDS,
+        offset=SYNC_OFFSET_SECONDS,
+        jitter=SYNC_JITTER_SECONDS,
+        run_deadline=SYNC_RUN_DEADLINE,
+    )
 
 app = Flask(__name__)
+# One-pass encoding of MySQL result types for every jsonify() call
+app.json = RowJSONProvider(app)
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.http_request_seconds.observe(
+            perf_counter() - started,
+            route=route,
+            method=request.method,
+            status=str(response.status_code),
+        )
+        if not response.is_streamed and response.content_length is not None:
+            metrics.http_response_bytes.observe(response.content_length, route=route)
+    return response
+
+metrics.registry.gauges("db_pool", "DB connection pool state", lambda: db_pool.stats())
+metrics.registry.gauges("response_cache", "Response cache state", lambda: response_cache.stats())
+if read_router.replicas:
+    metrics.registry.gauges("db_read", "Read routing per target", read_router.gauges)
+if WRITE_BEHIND:
+    metrics.registry.gauges(
+        "write_behind", "Write-behind queue state",
+        lambda: _write_behind.stats() if _write_behind else {},
+    )
+metrics.registry.gauges("live_updates", "Live update streams", live_updates.stats)
 CORS(app, resources={r"/*": {"origins": "*"}})
 @app.route("/api/combined_data", methods=["GET"])
+@response_cache.cached()
 def combined_data():
+    """
+    ?station=NAME                      one station (latest-overall fallback)
+    ?stations=A&stations=B, ?stations=all
+                                       many stations in one query, keyed by name
+    """
+    stations = request.args.getlist("stations")
+    if len(request.args.getlist("station")) > 1:
+        stations += request.args.getlist("station")
+    if stations:
+        return combined_data_batch(stations)
+
     station = request.args.get("station")
 
     if not station:
@@ -678,16 +2062,45 @@ def combined_data():
     print(f"/api/combined_data called for station: {station}")
 
     try:
-        db_pollutants = get_latest_pollutant_reading_for_station(station)
-        db_meteo = get_latest_meteorological_reading_for_station(station)
+        db_pollutants, db_meteo = get_latest_readings_for_station(station)
         return jsonify(
-            make_json_safe(
-                {
-                    "location": station,
-                    "pollutant_data": db_pollutants,
-                    "meteorological_data_db": db_meteo,
-                }
-            )
+            {
+                "location": station,
+                "pollutant_data": db_pollutants,
+                "meteorological_data_db": db_meteo,
+            }
+        )
+
+    except Exception as e:
+        print("❌ /api/combined_data ERROR:", repr(e))
+        return jsonify({
+            "error": "combined_data failed",
+            "details": str(e)
+        }), 500
+
+def combined_data_batch(stations):
+    """Batch form of /api/combined_data; requested stations without data map to nulls."""
+    names = None if stations == ["all"] else list(dict.fromkeys(stations))
+    if names is not None and len(names) > COMBINED_DATA_MAX_STATIONS:
+        return jsonify({
+            "error": f"at most {COMBINED_DATA_MAX_STATIONS} stations per request (or stations=all)"
+        }), 400
+
+    try:
+        latest = get_latest_readings_for_stations(names)
+        if names is not None:
+            latest = {n: latest.get(n, (None, None)) for n in names}
+        return jsonify(
+            {
+                "count": len(latest),
+                "stations": {
+                    name: {
+                        "pollutant_data": pollutant,
+                        "meteorological_data_db": meteo,
+                    }
+                    for name, (pollutant, meteo) in sorted(latest.items())
+                },
+            }
         )
 
     except Exception as e:
@@ -698,6 +2111,98 @@ def combined_data():
         }), 500
 
 
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+def _live_filter(data, stations):
+    """Encoded 'readings' event → same event restricted to `stations` (None if empty)."""
+    if stations is None:
+        return data
+    delta = json.loads(data)
+    delta["stations"] = [s for s in delta["stations"] if s["station"] in stations]
+    return json_dumps(delta) if delta["stations"] else None
+
+def stream_live_updates(sub, replay, complete):
+    """
+    SSE body: replayed events, then new ones as they are published, with
+    a comment line every LIVE_HEARTBEAT_SECONDS to keep proxies from
+    timing out. The stream ends after LIVE_STREAM_MAX_SECONDS (clients
+    reconnect with Last-Event-ID) or with a 'resync' event when the client
+    fell behind and should refetch /api/combined_data?stations=all.
+    """
+    ends_at = monotonic() + LIVE_STREAM_MAX_SECONDS
+    try:
+        yield "retry: 3000\n\n"
+        if not complete:
+            yield _sse("resync", "{}")
+        for event_id, event, data in replay:
+            data = _live_filter(data, sub.stations)
+            if data is not None:
+                yield _sse(event, data, event_id)
+
+        while True:
+            left = ends_at - monotonic()
+            if left <= 0:
+                return
+            item = sub.get(min(LIVE_HEARTBEAT_SECONDS, left))
+            if sub.overflowed:
+                yield _sse("resync", "{}")
+                return
+            if item is None:
+                yield ": ping\n\n"
+                continue
+            event_id, event, data = item
+            data = _live_filter(data, sub.stations)
+            if data is not None:
+                yield _sse(event, data, event_id)
+    finally:
+        sub.close()
+
+def configure_live_streams(worker_class, threads):
+    """
+    Called in each gunicorn worker: an open stream pins one request
+    thread, so a threaded worker streams on at most half of its threads
+    and a sync worker (one request at a time, killed after `timeout`)
+    on none. Async workers keep LIVE_MAX_SUBSCRIBERS.
+    """
+    if worker_class in ("sync", "gthread"):
+        live_updates.max_subscribers = min(LIVE_MAX_SUBSCRIBERS, threads // 2 if threads > 1 else 0)
+
+@app.route("/api/live", methods=["GET"])
+def live():
+    """
+    Server-Sent Events: one 'readings' event per ingestion commit with the
+    changed stations' newest values ({kind, stations: [{station, station_id,
+    updated_at, aqi | temperature_c, ...}]}). ?stations=A&stations=B limits
+    the stream to those stations.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    stations = set(request.args.getlist("stations")) or None
+
+    if not live_updates.max_subscribers:
+        return jsonify({
+            "error": "live streams are not served by this worker class",
+            "details": "run gunicorn with gthread workers (GUNICORN_THREADS > 1)",
+        }), 503
+    ensure_schema()
+    sub, replay, complete = live_updates.subscribe(stations, last_event_id)
+    return Response(
+        stream_with_context(stream_live_updates(sub, replay, complete)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.errorhandler(SubscriberLimit)
+def live_subscriber_limit(e):
+    print("❌ live stream refused:", e)
+    return jsonify({"error": "too many live streams", "details": str(e)}), 503, {"Retry-After": "5"}
+
+
 @app.post("/api/register_user")
 def register_user_endpoint():
     data = request.json or {}
@@ -713,113 +2218,362 @@ def register_user_endpoint():
     status_code = 200 if result["status"] == "success" else 400
     return jsonify(result), status_code
 
+class BatchError(Exception):
+    """Request-level problem with a bulk ingest body (→ 4xx)."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def read_batch_body():
+    """
+    Rows of a bulk ingest request: a JSON array, or NDJSON (one object per
+    line) when the body is sent as application/x-ndjson.
+    Returns a list of (row dict | None, parse error | None).
+    """
+    raw = request.get_data(cache=False)
+    if not raw.strip():
+        raise BatchError("empty body")
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        items = []
+        for n, line in enumerate(raw.splitlines(), 1):
+            if not line.strip():
+                continue
+            if len(items) >= BATCH_MAX_ROWS:
+                raise BatchError(f"more than {BATCH_MAX_ROWS} rows", 413)
+            try:
+                items.append(app.json.loads(line))
+            except ValueError as e:
+                items.append(ValueError(f"line {n}: invalid JSON ({e})"))
+    else:
+        try:
+            items = app.json.loads(raw)
+        except ValueError as e:
+            raise BatchError(f"invalid JSON: {e}")
+        if not isinstance(items, list):
+            raise BatchError("body must be a JSON array (or NDJSON)")
+        if len(items) > BATCH_MAX_ROWS:
+            raise BatchError(f"more than {BATCH_MAX_ROWS} rows", 413)
+
+    rows = []
+    for item in items:
+        if isinstance(item, Exception):
+            rows.append((None, str(item)))
+        elif not isinstance(item, dict):
+            rows.append((None, "row must be a JSON object"))
+        else:
+            rows.append((item, None))
+    return rows
+
+def _number_fields(data, fields):
+    """Coerce numeric fields in place; returns an error message or None."""
+    for f in fields:
+        v = data.get(f)
+        if isinstance(v, str):
+            v = v.strip()
+            if v in ("NA", "na", "NaN", "-", "--", "", "null", "None"):
+                v = None
+            else:
+                try:
+                    v = float(v)
+                except ValueError:
+                    return f"{f} must be a number"
+        elif v is not None and (isinstance(v, bool) or not isinstance(v, (int, float))):
+            return f"{f} must be a number"
+        data[f] = v
+    return None
+
+def _date_time_fields(data, date_field, time_field, required=True):
+    if required or data.get(date_field) is not None:
+        try:
+            datetime.strptime(str(data.get(date_field)), "%Y-%m-%d")
+        except ValueError:
+            return f"{date_field} must be YYYY-MM-DD"
+    t = data.get(time_field)
+    if t is not None:
+        try:
+            datetime.strptime(str(t), "%H:%M:%S" if str(t).count(":") == 2 else "%H:%M")
+        except ValueError:
+            return f"{time_field} must be HH:MM[:SS]"
+    return None
+
+POLLUTANT_VALUE_COLUMNS = list(AQI_READING_COLUMNS.values())
+
+METEO_NUMERIC_COLUMNS = [
+    "temperature_c", "feels_like_c", "pressure_hpa", "grnd_level_hpa",
+    "humidity_percent", "wind_kph", "wind_deg", "wind_gust",
+    "visibility_km", "clouds_percent", "precipitation_prob", "rain_3h",
+]
+
+def _name_field(data, field, required):
+    value = data.get(field)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value.strip()):
+        return f"{field} is required" if required else f"{field} must be a string"
+    return None
+
+def validate_pollutant_input(data, required=True):
+    """
+    Error message for an unusable pollutant row, else None (coerces numbers).
+    required=False (single-row endpoint) only checks what the INSERT needs:
+    location_name, reading_date and a pollutant value may be missing, but
+    whatever is present must have the right type/format.
+    """
+    if data.get("station_id") is not None and not isinstance(data["station_id"], int):
+        return "station_id must be an integer"
+    return (
+        _name_field(data, "location_name", required)
+        or _date_time_fields(data, "reading_date", "reading_time", required)
+        or _number_fields(data, POLLUTANT_VALUE_COLUMNS)
+        or (
+            None if not required or any(data.get(c) is not None for c in POLLUTANT_VALUE_COLUMNS)
+            else "at least one pollutant value is required"
+        )
+    )
+
+def validate_meteo_input(data, required=True):
+    """Error message for an unusable weather row, else None (coerces numbers)."""
+    if data.get("station_id") is not None and not isinstance(data["station_id"], int):
+        return "station_id must be an integer"
+    return (
+        _name_field(data, "station_name", required)
+        or _date_time_fields(data, "record_date", "record_time", required)
+        or _number_fields(data, METEO_NUMERIC_COLUMNS)
+    )
+
+def pollutant_aqis(inputs):
+    """AQI for every pollutant input row, in one vectorized pass."""
+    aqi_values, _ = calculate_aqi_batch(
+        {p: [d.get(col) for d in inputs] for p, col in AQI_READING_COLUMNS.items()}
+    )
+    return aqi_to_list(aqi_values)
+
+def _insert_pollutant_rows(cur, inputs):
+    """
+    Insert pollutant readings (dicts keyed by POLLUTANT_COLUMNS input
+    fields) on `cur`, without committing. AQI is computed for all of them
+    in one pass; rows go out in BATCH_CHUNK_ROWS multi-row INSERTs
+    (mysql.connector turns executemany on an INSERT into a single
+    statement). Returns (AQI per input row, latest_readings snapshots).
+    """
+    aqis = pollutant_aqis(inputs)
+
+    rows = []
+    for data, aqi in zip(inputs, aqis):
+        row = {c: data.get(c) for c in POLLUTANT_COLUMNS}
+        row["aqi"] = aqi
+        row["recorded_at"] = _combine_date_time(row["reading_date"], row["reading_time"])
+        row["source_updated_at"] = parse_source_timestamp(row["source_updated_at"])
+        rows.append(row)
+
+    upsert_pollutant_readings(cur, rows)
+    latest = [(r["location_name"], r["station_id"], r, r["recorded_at"]) for r in rows]
+    upsert_latest_readings(cur, "pollutant", latest)
+    return aqis, latest
+
+def _insert_meteo_rows(cur, inputs):
+    """Weather counterpart of _insert_pollutant_rows(); returns (None, snapshots)."""
+    columns = METEO_COLUMNS + ["station_id", "station_name"]
+    rows = []
+    for data in inputs:
+        row = {c: data.get(c) for c in columns}
+        row["recorded_at"] = _combine_date_time(row["record_date"], row["record_time"])
+        rows.append(row)
+
+    for i in range(0, len(rows), BATCH_CHUNK_ROWS):
+        cur.executemany(
+            METEO_INSERT_SQL,
+            [tuple(row[c] for c in columns) for row in rows[i:i + BATCH_CHUNK_ROWS]],
+        )
+    latest = [(r["station_name"], r["station_id"], r, r["recorded_at"]) for r in rows]
+    upsert_latest_readings(cur, "meteo", latest)
+    upsert_temperature_hourly(cur, rows)
+    return None, latest
+
+# kind → (validator, writer on a cursor)
+INGEST_KINDS = {
+    "pollutant": (validate_pollutant_input, _insert_pollutant_rows),
+    "meteo": (validate_meteo_input, _insert_meteo_rows),
+}
+
+def write_ingest_rows(groups):
+    """
+    Write {kind: validated input rows} in ONE transaction: all of it
+    commits or none of it does. Returns {kind: writer result} (the AQI
+    per row for pollutants).
+    """
+    ensure_schema()
+    results = {}
+    snapshots = []
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            for kind, rows in groups.items():
+                results[kind], latest = INGEST_KINDS[kind][1](cur, rows)
+                snapshots.append((kind, latest))
+            data_generation.bump(cur)
+        conn.commit()
+    for kind, latest in snapshots:
+        publish_latest(kind, latest)
+    return results
+
+def _is_bad_row_error(e):
+    """
+    True when a write failed because of the rows themselves (value too
+    long, bad foreign key, unparsable value), so retrying the same rows
+    can never succeed. Anything else (DB outage, pool timeout,
+    SchemaNotReady, a bug in the writer) is retried: dead-lettering is
+    only for rows that could never be written.
+    """
+    module, _ = db_driver.load()
+    return isinstance(e, (module.errors.DataError, module.errors.IntegrityError, ValueError))
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+def get_write_behind():
+    """This process's write-behind queue (started on first use), or None."""
+    global _write_behind
+    if not WRITE_BEHIND:
+        return None
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                queue = WriteBehindQueue(
+                    WRITE_BEHIND_DIR,
+                    write_ingest_rows,
+                    max_batch=WRITE_BEHIND_MAX_BATCH,
+                    max_delay=WRITE_BEHIND_MAX_DELAY_MS / 1000,
+                    max_pending=WRITE_BEHIND_MAX_PENDING,
+                    is_bad_rows=_is_bad_row_error,
+                ).start()
+                atexit.register(queue.close)
+                _write_behind = queue
+    return _write_behind
+
+def ingest_rows(kind, rows):
+    """
+    Store validated input rows of one kind: written and committed now, or
+    only appended to the write-behind log when WRITE_BEHIND is on.
+    Returns the per-row AQI for pollutant rows, else None.
+    Raises QueueFull when the write-behind queue is too deep, and
+    SchemaNotReady (before accepting anything) until migrate.py has run.
+    """
+    queue = get_write_behind()
+    if queue is None:
+        return write_ingest_rows({kind: rows})[kind]
+    ensure_schema()
+    queue.append(kind, rows)
+    return pollutant_aqis(rows) if kind == "pollutant" else None
+
+def _batch_endpoint(kind):
+    """
+    Shared body of the bulk ingest endpoints: validate every row, write the
+    valid ones in one transaction (or queue them), report per row in
+    request order.
+    """
+    validate = INGEST_KINDS[kind][0]
+    try:
+        items = read_batch_body()
+    except BatchError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    results = []
+    valid = []
+    for index, (data, error) in enumerate(items):
+        if error is None:
+            error = validate(data)
+        if error is None:
+            results.append({"index": index, "status": "ok"})
+            valid.append((index, data))
+        else:
+            results.append({"index": index, "status": "error", "error": error})
+
+    if valid:
+        try:
+            written = ingest_rows(kind, [d for _, d in valid])
+        except (QueueFull, SchemaNotReady):
+            raise  # 503 from their error handlers
+        except Exception as e:
+            print("❌ bulk insert failed:", repr(e))
+            return jsonify({"error": "bulk insert failed", "details": str(e)}), 500
+        if written is not None:
+            for (index, _), aqi in zip(valid, written):
+                results[index]["aqi"] = aqi
+
+    rejected = len(results) - len(valid)
+    if not valid:
+        code = 400
+    else:
+        code = 202 if WRITE_BEHIND else 201
+    return jsonify({
+        "status": "ok" if not rejected else ("partial" if valid else "error"),
+        "inserted": len(valid),
+        "rejected": rejected,
+        "queued": WRITE_BEHIND,
+        "results": results,
+    }), code
+
+def _insert_one(kind, data):
+    """
+    Single-row insert endpoints, in both modes: unlike the batch form,
+    station name and date stay optional (as they always were here); only
+    values the INSERT can't store are rejected.
+    """
+    if not isinstance(data, dict):
+        return None, (jsonify({"error": "body must be a JSON object"}), 400)
+    error = INGEST_KINDS[kind][0](data, required=False)
+    if error:
+        return None, (jsonify({"error": error}), 400)
+    return ingest_rows(kind, [data]), None
+
+@app.errorhandler(SchemaNotReady)
+def schema_not_ready(e):
+    print("❌", e)
+    return jsonify({"error": "database not migrated", "details": str(e)}), 503, {"Retry-After": "30"}
+
+@app.errorhandler(QueueFull)
+def write_queue_full(e):
+    print("❌ write-behind queue full:", e)
+    return jsonify({"error": "write queue full", "details": str(e)}), 503, {"Retry-After": "1"}
+
 @app.route("/api/insert_pollutant", methods=["POST"])
 def insert_pollutant():
-    data = request.get_json()
-    pollutant_data = {
-        "PM2.5": data.get("pm25_ug_m3"),
-        "PM10": data.get("PM10"),
-        "SO2": data.get("so2_ug_m3"),
-        "NO2": data.get("no2_ug_m3"),
-        "O3": data.get("OZONE"),
-        "CO": data.get("CO"),
-        "NH3": data.get("NH3"),
-    }
-    aqi, _ = calculate_aqi(pollutant_data)
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO pollutant_readings
-                (station_id, location_name,
-                 pm25_ug_m3, so2_ug_m3, no2_ug_m3,
-                 PM10, CO, OZONE, NH3,
-                 reading_date, reading_time, aqi)
-                VALUES (%s, %s, %s, %s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s, %s)
-                """,
-                (
-                    data.get("station_id"),
-                    data.get("location_name"),
-                    data.get("pm25_ug_m3"),
-                    data.get("so2_ug_m3"),
-                    data.get("no2_ug_m3"),
-                    data.get("PM10"),
-                    data.get("CO"),
-                    data.get("OZONE"),
-                    data.get("NH3"),
-                    data.get("reading_date"),
-                    data.get("reading_time"),
-                    aqi,
-                ),
-            )
-            conn.commit()
-    finally:
-        conn.close()
-    return jsonify({"status": "ok", "aqi": aqi}), 201
+    written, error = _insert_one("pollutant", request.get_json())
+    if error:
+        return error
+    return jsonify({"status": "queued" if WRITE_BEHIND else "ok", "aqi": written[0]}), (
+        202 if WRITE_BEHIND else 201
+    )
+
+@app.route("/api/insert_pollutant/batch", methods=["POST"])
+def insert_pollutant_batch():
+    """JSON array or NDJSON of /api/insert_pollutant bodies."""
+    return _batch_endpoint("pollutant")
 
 @app.route("/api/insert_meteorological", methods=["POST"])
 def insert_meteorological():
-    data = request.get_json()
+    _, error = _insert_one("meteo", request.get_json())
+    if error:
+        return error
+    return jsonify({"status": "queued" if WRITE_BEHIND else "ok"}), (
+        202 if WRITE_BEHIND else 201
+    )
 
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO meteorological_data
-                (temperature_c, feels_like_c, pressure_hpa, grnd_level_hpa,
-                 humidity_percent, wind_kph, wind_deg, wind_gust, visibility_km, clouds_percent,
-                 precipitation_prob, rain_3h, condition_main, condition_text,
-                 sunrise, sunset, record_date, record_time,station_id , station_name)
-                VALUES (%s, %s, %s, %s,
-                        %s, %s, %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s, %s, %s, %s ,%s ,%s)
-                """,
-                (
-                    data.get("temperature_c"),
-                    data.get("feels_like_c"),
-                    data.get("pressure_hpa"),
-                    data.get("grnd_level_hpa"),
-                    data.get("humidity_percent"),
-                    data.get("wind_kph"),
-                    data.get("wind_deg"),
-                    data.get("wind_gust"),
-                    data.get("visibility_km"),
-                    data.get("clouds_percent"),
-                    data.get("precipitation_prob"),
-                    data.get("rain_3h"),
-                    data.get("condition_main"),
-                    data.get("condition_text"),
-                    data.get("sunrise"),
-                    data.get("sunset"),
-                    data.get("record_date"),
-                    data.get("record_time"),
-                    data.get("station_id"),
-                    data.get("station_name"),
-                ),
-            )
-            conn.commit()
-    finally:
-        conn.close()
-    return jsonify({"status": "ok"}), 201
+@app.route("/api/insert_meteorological/batch", methods=["POST"])
+def insert_meteorological_batch():
+    """JSON array or NDJSON of /api/insert_meteorological bodies."""
+    return _batch_endpoint("meteo")
 
 @app.route("/api/station", methods=["GET"])
+@response_cache.cached()
 def get_all_stations():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("SELECT station_id, name FROM stations")
-        rows = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
+        rows = [
+            {"station_id": r["station_id"], "name": r["name"]}
+            for r in station_registry.all()
+        ]
 
         return jsonify(rows)
 
@@ -830,86 +2584,291 @@ def get_all_stations():
             "details": str(e)
         }), 500
 
+# Not response-cached: arbitrary coordinates would only churn the cache,
+# and the lookup is an in-memory KD-tree search plus one IN query.
+@app.route("/api/nearest_station", methods=["GET"])
+def nearest_station():
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+        k = int(request.args.get("k", 1))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon (numbers) are required, k must be an integer"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat must be within ±90 and lon within ±180"}), 400
+    if not 1 <= k <= NEAREST_STATION_MAX_K:
+        return jsonify({"error": f"k must be between 1 and {NEAREST_STATION_MAX_K}"}), 400
+
+    try:
+        nearest = station_registry.nearest(lat, lon, k)
+        latest = get_latest_readings_for_stations(r["name"] for _, r in nearest)
+        return jsonify([
+            {
+                "station_id": r["station_id"],
+                "name": r["name"],
+                "latitude": r["latitude"],
+                "longitude": r["longitude"],
+                "distance_km": round(distance, 3),
+                "pollutant_data": latest.get(r["name"], (None, None))[0],
+                "meteorological_data_db": latest.get(r["name"], (None, None))[1],
+            }
+            for distance, r in nearest
+        ])
+
+    except Exception as e:
+        print("❌ /api/nearest_station ERROR:", repr(e))
+        return jsonify({
+            "error": "nearest_station failed",
+            "details": str(e)
+        }), 500
+
 @app.route("/")
 def root():
     return {"status": "ok", "service": "python-backend"}
+
+@app.get("/api/db_pool")
+def db_pool_status():
+    return jsonify({
+        **db_pool.stats(),
+        "driver": db_driver.info(),
+        "read_routing": read_router.stats(),
+    })
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(
+        metrics.registry.render(), mimetype="text/plain; version=0.0.4"
+    )
+
+@app.get("/api/cache_stats")
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    print("❌ DB pool exhausted:", e)
+    return jsonify({"error": "database busy", "details": str(e)}), 503
     
+TREND_MIN_POINTS = int(os.getenv("TREND_MIN_POINTS", 24))
+
+# requested resolution → seconds (the coarsest rollup not longer than this
+# is used)
+TREND_RESOLUTION_SECONDS = {
+    "raw": 0,
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 30 * 86400,
+    "year": 365 * 86400,
+}
+
+def _parse_trend_time(value, default):
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # recorded_at and datetime.now() are naive local time
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _pick_rollup(resolution, start, end):
+    """
+    Coarsest rollup that satisfies the request:
+    - explicit resolution: longest bucket ≤ the requested one
+    - auto: longest bucket that still yields TREND_MIN_POINTS points
+    Returns a ROLLUP_RESOLUTIONS key, or None for raw rows.
+    """
+    if resolution == "auto":
+        span = (end - start).total_seconds()
+        limit = span / TREND_MIN_POINTS
+    else:
+        limit = TREND_RESOLUTION_SECONDS[resolution]
+
+    best = None
+    for name, (seconds, _) in ROLLUP_RESOLUTIONS.items():
+        if seconds <= limit:
+            best = name
+    return best
+
 @app.route("/api/pollutant_trend")
+@response_cache.cached()
 def pollutant_trend():
+    """
+    Without from/to/resolution: last 48 raw readings (legacy behaviour).
+    With them: points between `from` and `to` (ISO dates, default last
+    48 h), served from the coarsest pollutant_rollup resolution that fits.
+    """
     station = request.args.get("station")
     pollutant = request.args.get("pollutant")  # example: pm25_ug_m3
 
-    VALID = {
-        "pm25_ug_m3",
-        "so2_ug_m3",
-        "no2_ug_m3",
-        "OZONE",
-        "CO",
-        "NH3",
-        "PM10",
-    }
-
-    if pollutant not in VALID:
+    if pollutant not in TREND_POLLUTANTS:
         return jsonify({"error": "Invalid pollutant"}), 400
 
-    query = f"""
-        SELECT reading_date, reading_time, {pollutant}
-        FROM pollutant_readings
-        WHERE location_name = %s
-        ORDER BY reading_date DESC, reading_time DESC
-        LIMIT 48
-    """
-
-    conn = get_db_connection()
+    args = request.args
+    if not any(k in args for k in ("from", "to", "resolution")):
+        query = f"""
+            SELECT reading_date, reading_time, {pollutant}
+            FROM pollutant_readings
+            WHERE location_name = %s
+            ORDER BY reading_date DESC, reading_time DESC
+            LIMIT 48
+        """
+
+        with db_read_connection() as conn:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute(query, (station,))
+                rows = cur.fetchall()
+                rows.reverse()  # oldest → latest
+            if args.get("format") == "columnar":
+                return jsonify(columnar(rows))
+            return jsonify(rows)
+
+    resolution = args.get("resolution", "auto")
+    if resolution != "auto" and resolution not in TREND_RESOLUTION_SECONDS:
+        return jsonify({"error": "Invalid resolution"}), 400
     try:
-        with conn.cursor() as cur:
-            cur.execute(query, (station,))
-            rows = cur.fetchall()
-            fixed_rows = [fix_timedelta_row(r) for r in rows]
-            fixed_rows.reverse()  # oldest → latest
-        return jsonify(fixed_rows)
-    finally:
-        conn.close()
+        end = _parse_trend_time(args.get("to"), datetime.now())
+        start = _parse_trend_time(args.get("from"), end - timedelta(hours=48))
+    except ValueError:
+        return jsonify({"error": "from/to must be ISO dates"}), 400
+    if start >= end:
+        return jsonify({"error": "from must be before to"}), 400
+
+    rollup = _pick_rollup(resolution, start, end)
+
+    ensure_schema()
+    with db_read_connection() as conn:
+        with conn.cursor(dictionary=True) as cur:
+            if rollup is None:
+                cur.execute(
+                    f"""
+                    SELECT recorded_at AS bucket_start, {pollutant} AS value
+                    FROM pollutant_readings
+                    WHERE location_name = %s
+                      AND recorded_at >= %s AND recorded_at < %s
+                      AND {pollutant} IS NOT NULL
+                    ORDER BY recorded_at
+                    """,
+                    (station, start, end),
+                )
+                points = [
+                    {"bucket_start": r["bucket_start"], pollutant: r["value"]}
+                    for r in cur.fetchall()
+                ]
+            else:
+                cur.execute(
+                    """
+                    SELECT bucket_start, min_value, max_value,
+                           sum_value / sample_count AS mean_value, sample_count
+                    FROM pollutant_rollup
+                    WHERE resolution = %s AND station_name = %s
+                      AND pollutant = %s
+                      AND bucket_start >= %s AND bucket_start < %s
+                    ORDER BY bucket_start
+                    """,
+                    (rollup, station, pollutant,
+                     _bucket_start(start, rollup), end),
+                )
+                points = [
+                    {
+                        "bucket_start": r["bucket_start"],
+                        pollutant: r["mean_value"],
+                        "min": r["min_value"],
+                        "max": r["max_value"],
+                        "count": r["sample_count"],
+                    }
+                    for r in cur.fetchall()
+                ]
+
+    return jsonify(
+        {
+            "station": station,
+            "pollutant": pollutant,
+            "resolution": rollup or "raw",
+            "from": start,
+            "to": end,
+            "points": columnar(points) if args.get("format") == "columnar" else points,
+        }
+    )
 
 @app.route("/api/temp_trend", methods=["GET"])
+@response_cache.cached(vary=lambda: datetime.now().strftime("%Y-%m-%d %H"))
 def temp_trend():
     """
     Returns exactly 12 hourly points (across all stations combined).
     Missing hours are filled with None.
+    Reads the temperature_hourly rollup (≤ 12 rows by primary key).
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(dictionary=True) as cur:  # ✅ FIX
+    current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    first_hour = current_hour - timedelta(hours=11)
+
+    ensure_schema()
+    with db_read_connection() as conn:
+        with conn.cursor(dictionary=True) as cur:
             cur.execute(
                 """
-                SELECT 
-                    DATE_FORMAT(record_time, '%H') AS hour_slot,
-                    AVG(temperature_c) AS temp_avg
-                FROM meteorological_data
-                WHERE CONCAT(record_date, ' ', record_time) >= NOW() - INTERVAL 12 HOUR
-                GROUP BY hour_slot
-                ORDER BY hour_slot DESC;
-                """
+                SELECT hour_start, temp_sum / temp_count AS temp_avg
+                FROM temperature_hourly
+                WHERE hour_start >= %s
+                ORDER BY hour_start
+                """,
+                (first_hour,),
             )
             rows = cur.fetchall()
 
-        data_map = {
-            r["hour_slot"]: float(r["temp_avg"]) if r["temp_avg"] is not None else None
-            for r in rows
-        }
+    data_map = {
+        r["hour_start"]: float(r["temp_avg"]) if r["temp_avg"] is not None else None
+        for r in rows
+    }
 
-        result = []
-        for i in range(11, -1, -1):
-            hour = (datetime.now() - timedelta(hours=i)).strftime("%H")
-            result.append({
-                "record_time": f"{hour}:00",
-                "temperature_c": data_map.get(hour),
-            })
+    result = []
+    for i in range(11, -1, -1):
+        hour = current_hour - timedelta(hours=i)
+        result.append({
+            "record_time": hour.strftime("%H:00"),
+            "temperature_c": data_map.get(hour),
+        })
 
-        return jsonify(result)
+    return jsonify(result)
 
-    finally:
-        conn.close()
+@app.route("/api/forecast", methods=["GET"])
+@response_cache.cached(vary=lambda: datetime.now().strftime("%Y-%m-%d %H"))
+def forecast():
+    """
+    Stored 3-hourly OpenWeather forecast for one station, from the current
+    3 hour slot up to `hours` ahead (default 120 = the full 5 days).
+    Served from weather_forecast; never calls the API.
+    """
+    station = request.args.get("station")
+    if not station:
+        return jsonify({"error": "station query parameter is required"}), 400
+    try:
+        hours = min(max(int(request.args.get("hours", 120)), 1), 120)
+    except ValueError:
+        return jsonify({"error": "hours must be an integer"}), 400
+
+    now = datetime.now().replace(microsecond=0)
+
+    ensure_schema()
+    with db_read_connection() as conn:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute(
+                f"""
+                SELECT target_at, fetched_at, {", ".join(FORECAST_FIELDS)}
+                FROM weather_forecast
+                WHERE station_name = %s AND target_at > %s AND target_at <= %s
+                ORDER BY target_at
+                """,
+                (station, now - timedelta(hours=3), now + timedelta(hours=hours)),
+            )
+            rows = cur.fetchall()
+
+    fetched_at = max((r.pop("fetched_at") for r in rows), default=None)
+    return jsonify({
+        "location": station,
+        "fetched_at": fetched_at,
+        "forecast": rows,
+    })
 
 @app.post("/api/login_user")
 def login_user():
@@ -919,40 +2878,38 @@ def login_user():
     if not user_name:
         return jsonify({"status": "error", "message": "user_name required"}), 400
 
-    conn = get_db_connection()
     try:
-        with conn.cursor(dictionary=True) as cur:  # ✅ FIX
-            cur.execute(
-                """
-                SELECT user_id, first_name, middle_name, last_name, age
-                FROM users
-                WHERE user_name = %s
-                """,
-                (user_name,),
-            )
+        with db_connection() as conn:
+            with conn.cursor(dictionary=True) as cur:  # ✅ FIX
+                cur.execute(
+                    """
+                    SELECT user_id, first_name, middle_name, last_name, age
+                    FROM users
+                    WHERE user_name = %s
+                    """,
+                    (user_name,),
+                )
 
-            user = cur.fetchone()
+                user = cur.fetchone()
 
-            if not user:
-                return jsonify({"status": "error", "message": "Invalid username"}), 400
+                if not user:
+                    return jsonify({"status": "error", "message": "Invalid username"}), 400
 
-            session["user_id"] = user["user_id"]
+                session["user_id"] = user["user_id"]
 
-            return jsonify({
-                "status": "success",
-                "user_id": user["user_id"],
-                "first_name": user["first_name"],
-                "middle_name": user["middle_name"],
-                "last_name": user["last_name"],
-                "age": user["age"],
-            }), 200
+                return jsonify({
+                    "status": "success",
+                    "user_id": user["user_id"],
+                    "first_name": user["first_name"],
+                    "middle_name": user["middle_name"],
+                    "last_name": user["last_name"],
+                    "age": user["age"],
+                }), 200
 
     except Exception as e:
         print("Login Error:", repr(e))
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    finally:
-        conn.close()
 
 
 @app.post("/api/register_user")
@@ -968,26 +2925,24 @@ def register_user():
     if not uname:
         return jsonify({"error": "user_name required"}), 400
 
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO users (first_name, last_name, middle_name, user_name, age)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (first, last, mid, uname, age),
-            )
-            conn.commit()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO users (first_name, last_name, middle_name, user_name, age)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    (first, last, mid, uname, age),
+                )
+                conn.commit()
 
-        return jsonify({"status": "ok"}), 200
+            return jsonify({"status": "ok"}), 200
 
     except Exception as e:
         print("Register Error:", repr(e))
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        conn.close()
 
 
 @app.get("/api/get_user")
@@ -998,30 +2953,28 @@ def get_user():
     if not uid or not uid.isdigit():
         return jsonify({"error": "Invalid or missing user_id"}), 400
 
-    conn = get_db_connection()
     try:
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute("""
-            SELECT first_name, last_name, age
-            FROM users
-            WHERE user_id = %s
-        """, (uid,))
+        with db_read_connection() as conn:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT first_name, last_name, age
+                FROM users
+                WHERE user_id = %s
+            """, (uid,))
 
-        row = cur.fetchone()
+            row = cur.fetchone()
 
-        # 2️⃣ User not found
-        if not row:
-            return jsonify({"error": "User not found"}), 404
+            # 2️⃣ User not found
+            if not row:
+                return jsonify({"error": "User not found"}), 404
 
-        # 3️⃣ Success
-        return jsonify(row), 200
+            # 3️⃣ Success
+            return jsonify(row), 200
 
     except Exception as e:
         print("get_user error:", e)
         return jsonify({"error": "Server error"}), 500
 
-    finally:
-        conn.close()
 
 
 @app.get("/api/station_by_id")
@@ -1030,23 +2983,20 @@ def station_by_id():
     if not sid:
         return jsonify({"error": "Missing id"}), 400
 
-    conn = get_db_connection()
+    if not sid.isdigit():
+        return jsonify({}), 200
+
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT station_id, location_name
-            FROM stations
-            WHERE station_id=%s
-        """, (sid,))
-        row = cur.fetchone()
-        return jsonify(row if row else {})
+        row = station_registry.get(int(sid))
+        return jsonify(
+            {"station_id": row["station_id"], "location_name": row["name"]}
+            if row else {}
+        )
 
     except Exception as e:
         print("station_by_id error:", e)
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        conn.close()
 
 @app.get("/api/station_by_name")
 def station_by_name():
@@ -1054,23 +3004,90 @@ def station_by_name():
     if not name:
         return jsonify({"error": "Missing name"}), 400
 
-    conn = get_db_connection()
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT station_id, location_name
-            FROM stations
-            WHERE location_name = %s
-        """, (name,))
-        row = cur.fetchone()
-        return jsonify(row if row else {})
+        row = station_registry.get_by_name(name)
+        return jsonify(
+            {"station_id": row["station_id"], "location_name": row["name"]}
+            if row else {}
+        )
 
     except Exception as e:
         print("station_by_name error:", e)
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        conn.close()
+
+ADV_SEARCH_CHUNK_ROWS = int(os.getenv("ADV_SEARCH_CHUNK_ROWS", 500))
+ADV_SEARCH_MAX_ROWS = int(os.getenv("ADV_SEARCH_MAX_ROWS", 1_000_000))
+ADV_SEARCH_MAX_BYTES = int(os.getenv("ADV_SEARCH_MAX_BYTES", 256 * 1024 * 1024))
+
+def stream_query_rows(query, fmt, max_rows, max_bytes):
+    """
+    Run `query` on an unbuffered cursor and yield the encoded rows
+    chunk by chunk, so memory stays flat whatever the result size.
+    fmt "ndjson": one object per line, then a {"_meta": ...} trailer line.
+    fmt "json": a JSON array; when a cap or an error cut it short, its
+    last element is that same {"_meta": ...} object.
+    """
+    sent_rows = 0
+    sent_bytes = 0
+    truncated = None
+    error = None
+
+    if fmt == "json":
+        yield "["
+
+    try:
+        with db_read_connection() as conn:
+            # buffered=False: rows stay on the server until fetchmany()
+            cur = conn.cursor(dictionary=True, buffered=False)
+            exhausted = False
+            try:
+                cur.execute(query)
+                while truncated is None:
+                    rows = cur.fetchmany(ADV_SEARCH_CHUNK_ROWS)
+                    if not rows:
+                        exhausted = True
+                        break
+                    parts = []
+                    for row in rows:
+                        if sent_rows >= max_rows:
+                            truncated = "max_rows"
+                            break
+                        encoded = json_dumps(row)
+                        if sent_bytes + len(encoded) > max_bytes:
+                            truncated = "max_bytes"
+                            break
+                        if fmt == "json":
+                            encoded = ("," if sent_rows else "") + encoded
+                        else:
+                            encoded += "\n"
+                        parts.append(encoded)
+                        sent_rows += 1
+                        sent_bytes += len(encoded)
+                    if parts:
+                        yield "".join(parts)
+            finally:
+                if exhausted:
+                    cur.close()
+                else:
+                    # capped, failed or client went away: unread rows are
+                    # still on the wire, so the pool must drop this connection
+                    read_router.invalidate(conn)
+    except Exception as e:
+        print("❌ ADV SEARCH STREAM ERROR:", e)
+        error = str(e)
+
+    meta = {"rows": sent_rows, "bytes": sent_bytes, "truncated": truncated}
+    if error:
+        meta["error"] = error
+    if fmt == "json":
+        # the 200 status is already sent: an incomplete array ends with a
+        # {"_meta": ...} element instead of passing for the full result
+        if truncated or error:
+            yield ("," if sent_rows else "") + json.dumps({"_meta": meta})
+        yield "]"
+    else:
+        yield json.dumps({"_meta": meta}) + "\n"
 
 @app.route("/api/adv_search", methods=["POST", "OPTIONS"])
 def adv_search():
@@ -1086,40 +3103,34 @@ def adv_search():
         print(query)
         print("====================================\n")
 
-        conn = get_db_connection()
-        with conn.cursor() as cur:
+        # Streaming mode: {"query": ..., "stream": "ndjson" | "json",
+        #                  "max_rows": N, "max_bytes": N}
+        fmt = data.get("stream")
+        if fmt:
+            if fmt not in ("ndjson", "json"):
+                return jsonify({"error": "stream must be 'ndjson' or 'json'"}), 400
+            max_rows = min(int(data.get("max_rows") or ADV_SEARCH_MAX_ROWS), ADV_SEARCH_MAX_ROWS)
+            max_bytes = min(int(data.get("max_bytes") or ADV_SEARCH_MAX_BYTES), ADV_SEARCH_MAX_BYTES)
+            return Response(
+                stream_with_context(stream_query_rows(query, fmt, max_rows, max_bytes)),
+                mimetype="application/x-ndjson" if fmt == "ndjson" else "application/json",
+                headers={"X-Max-Rows": str(max_rows), "X-Max-Bytes": str(max_bytes)},
+            )
+
+        with db_read_connection() as conn, conn.cursor(dictionary=True) as cur:
             cur.execute(query)
             rows = cur.fetchall()
 
-        # CLEAN JSON (convert timedelta, datetime → strings)
-        cleaned_rows = []
-        for row in rows:
-            fixed = {}
-            for k, v in row.items():
-                if isinstance(v, (datetime, date, time)):
-                    fixed[k] = str(v)
-                elif isinstance(v, timedelta):
-                    total = int(v.total_seconds())
-                    h = total // 3600
-                    m = (total % 3600) // 60
-                    s = total % 60
-                    fixed[k] = f"{h:02d}:{m:02d}:{s:02d}"
-                else:
-                    fixed[k] = v
-            cleaned_rows.append(fixed)
-
-        return jsonify(cleaned_rows)
+        # the app JSON provider converts datetime/timedelta/Decimal itself
+        if data.get("format") == "columnar":
+            return jsonify(columnar(rows))
+        return jsonify(rows)
 
     except Exception as e:
         print("❌ ADV SEARCH ERROR:", e)
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        try:
-            conn.close()
-        except:
-            pass
-
 if __name__ == "__main__":
+    migrate()
     print(f"Starting Flask server at http://{HOST}:{PORT}")
     app.run(host=HOST, port=PORT, debug=True, use_reloader=False)
@@ -0,0 +1,202 @@
+"""
+Vectorized Indian National AQI. NumPy is imported on first use, so
+importing this module (and app) stays cheap for processes that never
+compute an AQI. Single readings go through calculate_aqi(), a plain
+Python path with the same results (no per-call array overhead).
+"""
+
+import math
+from bisect import bisect_left
+from functools import lru_cache
+
+# Indian National AQI breakpoints:
+# (BP_Lo, BP_Hi, I_Lo, I_Hi) per pollutant.
+# units: µg/m³ except CO (mg/m³)
+BREAKPOINTS = {
+    "PM2.5": [
+        (0, 30, 0, 50),
+        (31, 60, 51, 100),
+        (61, 90, 101, 200),
+        (91, 120, 201, 300),
+        (121, 250, 301, 400),
+        (251, 500, 401, 500),
+    ],
+    "PM10": [
+        (0, 50, 0, 50),
+        (51, 100, 51, 100),
+        (101, 250, 101, 200),
+        (251, 350, 201, 300),
+        (351, 430, 301, 400),
+        (431, 600, 401, 500),
+    ],
+    "SO2": [
+        (0, 40, 0, 50),
+        (41, 80, 51, 100),
+        (81, 380, 101, 200),
+        (381, 800, 201, 300),
+        (801, 1600, 301, 400),
+        (1601, 2620, 401, 500),
+    ],
+    "NO2": [
+        (0, 40, 0, 50),
+        (41, 80, 51, 100),
+        (81, 180, 101, 200),
+        (181, 280, 201, 300),
+        (281, 400, 301, 400),
+        (401, 800, 401, 500),
+    ],
+    "O3": [
+        (0, 50, 0, 50),
+        (51, 100, 51, 100),
+        (101, 168, 101, 200),
+        (169, 208, 201, 300),
+        (209, 748, 301, 400),
+        (749, 1000, 401, 500),
+    ],
+    "CO": [
+        (0, 1, 0, 50),
+        (1.1, 2, 51, 100),
+        (2.1, 10, 101, 200),
+        (10.1, 17, 201, 300),
+        (17.1, 34, 301, 400),
+        (34.1, 50, 401, 500),
+    ],
+    "NH3": [
+        (0, 200, 0, 50),
+        (201, 400, 51, 100),
+        (401, 800, 101, 200),
+        (801, 1200, 201, 300),
+        (1201, 1800, 301, 400),
+        (1801, 2500, 401, 500),
+    ],
+}
+
+POLLUTANTS = list(BREAKPOINTS)
+
+@lru_cache(maxsize=None)
+def _table(pollutant):
+    """Built once per pollutant: one float64 array per breakpoint column."""
+    import numpy as np
+
+    return tuple(
+        np.array(col, dtype=np.float64) for col in zip(*BREAKPOINTS[pollutant])
+    )
+
+
+# pollutant → (band upper bounds, [(lo, i_lo, slope)]): the scalar twin of
+# _table(), with the same float64 arithmetic as compute_iaqi_batch()
+_BANDS = {
+    p: (
+        [float(bp_hi) for _, bp_hi, _, _ in bands],
+        [
+            (float(bp_lo), float(i_lo), (float(i_hi) - i_lo) / (float(bp_hi) - bp_lo))
+            for bp_lo, bp_hi, i_lo, i_hi in bands
+        ],
+    )
+    for p, bands in BREAKPOINTS.items()
+}
+
+
+def compute_iaqi(pollutant, value):
+    """
+    Sub-index of one reading, or None. Same rules and arithmetic as
+    compute_iaqi_batch(): band by binary search, gap values clamped to
+    the next band's lower bound, missing/negative/above-scale → None.
+    """
+    if value is None:
+        return None
+    cp = float(value)
+    if math.isnan(cp):
+        return None
+    upper, bands = _BANDS[pollutant]
+    band = bisect_left(upper, cp)
+    if band == len(bands) or cp < bands[0][0]:
+        return None
+    lo, i_lo, slope = bands[band]
+    return slope * (max(cp, lo) - lo) + i_lo
+
+
+def calculate_aqi(pollutants):
+    """
+    pollutants: dict with keys:
+        'PM2.5', 'PM10', 'SO2', 'NO2', 'O3', 'CO', 'NH3'
+    units: µg/m³ except CO (mg/m³)
+    Returns (aqi int | None, {pollutant: sub-index float | None}) for one
+    reading; calculate_aqi_batch() is the columnar equivalent.
+    """
+    iaqis = {p: compute_iaqi(p, pollutants.get(p)) for p in POLLUTANTS}
+    overall = max((v for v in iaqis.values() if v is not None), default=None)
+    return (None if overall is None else int(overall)), iaqis
+
+
+def _as_array(values):
+    """Column of readings (None / NaN = missing) → float64 array."""
+    import numpy as np
+
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return values
+    return np.array(
+        [np.nan if v is None else v for v in values], dtype=np.float64
+    )
+
+
+def compute_iaqi_batch(pollutant, values):
+    """
+    Sub-index for a whole column of one pollutant's readings.
+
+    The band is found by binary search on the band upper bounds. A value
+    that falls in the gap between two bands (e.g. PM2.5 = 30.5) is
+    clamped to the lower bound of the next band. Missing, negative and
+    above-scale values give NaN.
+    """
+    import numpy as np
+
+    bp_lo, bp_hi, i_lo, i_hi = _table(pollutant)
+    cp = _as_array(values)
+
+    band = np.searchsorted(bp_hi, cp, side="left")
+    valid = ~np.isnan(cp) & (cp >= bp_lo[0]) & (band < len(bp_hi))
+    band = np.where(valid, band, 0)
+
+    lo, hi = bp_lo[band], bp_hi[band]
+    cp_eff = np.maximum(cp, lo)
+    iaqi = ((i_hi[band] - i_lo[band]) / (hi - lo)) * (cp_eff - lo) + i_lo[band]
+    return np.where(valid, iaqi, np.nan)
+
+
+def calculate_aqi_batch(columns):
+    """
+    columns: dict pollutant → sequence of readings, all the same length
+             (keys as in BREAKPOINTS; absent pollutants count as missing).
+    Returns (aqi, iaqis):
+        aqi   – float64 array, overall AQI (max sub-index, truncated),
+                NaN where no pollutant was usable
+        iaqis – dict pollutant → float64 array of sub-indices
+    """
+    import numpy as np
+
+    n = None
+    for v in columns.values():
+        n = len(v)
+        break
+    if n is None:
+        return np.empty(0), {p: np.empty(0) for p in POLLUTANTS}
+
+    iaqis = {}
+    for p in POLLUTANTS:
+        values = columns.get(p)
+        if values is None:
+            iaqis[p] = np.full(n, np.nan)
+        else:
+            iaqis[p] = compute_iaqi_batch(p, values)
+
+    stacked = np.vstack([iaqis[p] for p in POLLUTANTS])
+    all_missing = np.isnan(stacked).all(axis=0)
+    overall = np.max(np.where(np.isnan(stacked), -np.inf, stacked), axis=0)
+    aqi = np.where(all_missing, np.nan, np.trunc(overall))
+    return aqi, iaqis
+
+
+def aqi_to_list(aqi):
+    """float64 AQI array → list of int | None (for DB writes / JSON)."""
+    return [None if math.isnan(v) else int(v) for v in aqi]
@@ -0,0 +1,6 @@
+import sys
+from app import app, backfill_aqi
+# python backfill_aqi.py        → rows with aqi IS NULL
+# python backfill_aqi.py --all  → recompute every row
+with app.app_context():
+    backfill_aqi(only_missing="--all" not in sys.argv)
@@ -0,0 +1,84 @@
+"""
+Recorded upstream payloads + synthetic scale-up helpers.
+
+pollutant_feed.json        – one data.gov.in page (one station, all pollutants)
+openweather_forecast.json  – one OpenWeather 5 day / 3 h forecast (40 entries)
+"""
+
+import copy
+import json
+from pathlib import Path
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load(name):
+    with open(FIXTURES / name) as f:
+        return json.load(f)
+
+
+def station_names(n):
+    return [f"Synthetic Station {i:04d}, Delhi - BENCH" for i in range(n)]
+
+
+def station_coords(i):
+    # spread over the Delhi bounding box
+    return 28.40 + (i % 50) * 0.009, 76.84 + (i // 50) * 0.011
+
+
+def pollutant_records(n_stations):
+    """data.gov.in records for n stations (one record per pollutant)."""
+    template = load("pollutant_feed.json")["records"]
+    pollutant_ids = ["PM2.5", "SO2", "NO2", "OZONE", "CO", "NH3", "PM10"]
+    by_pid = {r["pollutant_id"]: r for r in template}
+    base = template[0]
+
+    records = []
+    for i, name in enumerate(station_names(n_stations)):
+        lat, lon = station_coords(i)
+        for k, pid in enumerate(pollutant_ids):
+            rec = dict(by_pid.get(pid, base))
+            rec.update(
+                station=name,
+                latitude=f"{lat:.6f}",
+                longitude=f"{lon:.6f}",
+                pollutant_id=pid,
+                avg_value="NA" if (i + k) % 11 == 0 else str((i * 7 + k * 31) % 400),
+            )
+            records.append(rec)
+    return records
+
+
+def forecast_payloads(n_stations):
+    """(weather_json, station_name) pairs, one forecast per station."""
+    template = load("openweather_forecast.json")
+    out = []
+    for i, name in enumerate(station_names(n_stations)):
+        doc = copy.deepcopy(template)
+        doc["list"][0]["main"]["temp"] = 18 + (i % 17)
+        out.append((doc, name))
+    return out
+
+
+def db_rows(n):
+    """Rows shaped like mysql.connector dictionary-cursor output."""
+    from datetime import date, datetime, timedelta
+    from decimal import Decimal
+
+    rows = []
+    for i in range(n):
+        rows.append(
+            {
+                "record_id": i,
+                "station_id": i % 40,
+                "location_name": f"Synthetic Station {i % 40:04d}, Delhi - BENCH",
+                "pm25_ug_m3": Decimal(f"{i % 480}.5"),
+                "PM10": float(i % 590),
+                "CO": None,
+                "reading_date": date(2026, 1, 1 + i % 28),
+                "reading_time": timedelta(seconds=(i * 37) % 86400),
+                "recorded_at": datetime(2026, 1, 1 + i % 28, i % 24),
+                "aqi": i % 500,
+            }
+        )
+    return rows
@@ -0,0 +1,250 @@
+"""
+Offline micro-benchmarks for the ingestion, AQI and serialization hot paths.
+
+    python -m bench.run                          # default scales
+    python -m bench.run --stations 10,100 --history 100000 --repeat 3
+    python -m bench.run --out new.json --compare old.json
+
+No network and no MySQL needed: upstream payloads come from bench/fixtures
+and the database is the in-memory stand-in in bench/standin.py (use
+--round-trip-ms to model network latency to the managed MySQL).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import fixtures  # noqa: E402
+from bench.standin import StandInDB  # noqa: E402
+from live_updates import LocalBackend  # noqa: E402
+
+
+def _quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def measure(name, scale, items, fn, setup=None, repeat=5):
+    """
+    Time fn(state) `repeat` times (setup() builds state, untimed), then run
+    it once more under tracemalloc for peak memory.
+    """
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        with _quiet():
+            started = time.perf_counter()
+            fn(state)
+            timings.append(time.perf_counter() - started)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    with _quiet():
+        fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = _percentile(timings, 50)
+    result = {
+        "name": name,
+        "scale": scale,
+        "items": items,
+        "repeat": repeat,
+        "throughput_per_s": round(items / p50, 1) if p50 else None,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(_percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+    print(
+        f"{name:<28} {scale:>9} {result['p50_ms']:>11.3f} {result['p95_ms']:>11.3f}"
+        f" {result['throughput_per_s'] or 0:>14.1f} {result['peak_mem_kb']:>11.1f}"
+    )
+    return result
+
+
+def _patch_app(app_module, db):
+    """Point the app's DB helpers at the stand-in."""
+    app_module.db_connection = db.connection
+    app_module.station_registry._connection = db.connection
+    app_module.station_registry.invalidate()
+    app_module._schema_ready = True
+    # no live streams in a benchmark: keep publish_latest() in-process
+    app_module.live_updates.backend = LocalBackend()
+
+
+def run(args):
+    with _quiet():
+        import app as app_module
+    from aqi import calculate_aqi_batch
+    from json_provider import dumps as json_dumps
+
+    results = []
+    print(
+        f"{'benchmark':<28} {'scale':>9} {'p50 ms':>11} {'p95 ms':>11}"
+        f" {'items/s':>14} {'peak KiB':>11}"
+    )
+
+    for n in args.stations:
+        records = fixtures.pollutant_records(n)
+        raw_values = [r["avg_value"] for r in records]
+
+        results.append(measure(
+            "clean_value", n, len(raw_values),
+            lambda _: [app_module.clean_value(v) for v in raw_values],
+            repeat=args.repeat,
+        ))
+
+        grouped = app_module.group_pollutant_records(records)
+        readings = [
+            {"PM2.5": g["PM2.5"], "PM10": g["PM10"], "SO2": g["SO2"],
+             "NO2": g["NO2"], "O3": g["OZONE"], "CO": g["CO"], "NH3": g["NH3"]}
+            for g in grouped.values()
+        ]
+        results.append(measure(
+            "calculate_aqi (per row)", n, len(readings),
+            lambda _: [app_module.calculate_aqi(r) for r in readings],
+            repeat=args.repeat,
+        ))
+        results.append(measure(
+            "calculate_aqi_batch", n, len(readings),
+            lambda _: calculate_aqi_batch(
+                {p: [r[p] for r in readings] for p in readings[0]}
+            ),
+            repeat=args.repeat,
+        ))
+
+        results.append(measure(
+            "group_pollutant_records", n, len(records),
+            lambda _: app_module.group_pollutant_records(records),
+            repeat=args.repeat,
+        ))
+
+        def fresh_db(n=n):
+            db = StandInDB(round_trip_ms=args.round_trip_ms)
+            db.add_stations(
+                (name, *fixtures.station_coords(i))
+                for i, name in enumerate(fixtures.station_names(n))
+            )
+            _patch_app(app_module, db)
+            with _quiet():
+                app_module.station_registry.all()
+            db.reset_counters()
+            return db
+
+        results.append(measure(
+            "save_pollutant_records", n, n,
+            lambda _: app_module.save_pollutant_records_to_db(records),
+            setup=fresh_db, repeat=args.repeat,
+        ))
+
+        payloads = fixtures.forecast_payloads(n)
+        results.append(measure(
+            "save_openweather_batch", n, n,
+            lambda _: app_module.save_openweather_batch_to_db(payloads),
+            setup=fresh_db, repeat=args.repeat,
+        ))
+
+        rows = fixtures.db_rows(n * 48)
+        results.append(measure(
+            "json encode rows", n, len(rows),
+            lambda _: json_dumps(rows),
+            repeat=args.repeat,
+        ))
+
+    if args.history:
+        def history_db():
+            db = StandInDB(round_trip_ms=args.round_trip_ms, history_rows=args.history)
+            _patch_app(app_module, db)
+            return db
+
+        results.append(measure(
+            "backfill_aqi", args.history, args.history,
+            lambda _: app_module.backfill_aqi(only_missing=False, chunk_size=5000),
+            setup=history_db, repeat=max(1, min(args.repeat, 3)),
+        ))
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(base_path, results):
+    with open(base_path) as f:
+        base = {(r["name"], r["scale"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {base_path}:")
+    print(f"{'benchmark':<28} {'scale':>9} {'p50 Δ%':>9} {'peak mem Δ%':>12}")
+    for r in results:
+        old = base.get((r["name"], r["scale"]))
+        if not old:
+            continue
+        dp50 = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0
+        dmem = (
+            (r["peak_mem_kb"] - old["peak_mem_kb"]) / old["peak_mem_kb"] * 100
+            if old["peak_mem_kb"] else 0
+        )
+        print(f"{r['name']:<28} {r['scale']:>9} {dp50:>+9.1f} {dmem:>+12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stations", default="10,100,1000",
+                        type=lambda s: [int(x) for x in s.split(",") if x])
+    parser.add_argument("--history", type=int, default=1_000_000,
+                        help="pollutant_readings rows for the AQI backfill (0 = skip)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--round-trip-ms", type=float, default=0.0,
+                        help="simulated DB round-trip latency")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    doc = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"\n📄 results written to {args.out}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
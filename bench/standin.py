@@ -0,0 +1,140 @@
+"""
+In-memory stand-in for the MySQL server used by the benchmarks.
+
+It speaks just enough of the mysql.connector cursor API for the app's
+write/read paths, answers the handful of queries they issue, and can
+add a fixed per-round-trip delay to model network latency. Everything
+else is accepted and counted.
+"""
+
+import re
+import time
+from contextlib import contextmanager
+
+
+class StandInDB:
+    def __init__(self, round_trip_ms=0.0, history_rows=0):
+        self.round_trip = round_trip_ms / 1000.0
+        self.history_rows = history_rows
+        self.stations = {}  # name → (station_id, lat, lon)
+        self.round_trips = 0
+        self.rows_written = 0
+
+    def _trip(self):
+        self.round_trips += 1
+        if self.round_trip:
+            time.sleep(self.round_trip)
+
+    def add_stations(self, stations):
+        for name, lat, lon in stations:
+            if name not in self.stations:
+                self.stations[name] = (len(self.stations) + 1, lat, lon)
+
+    @contextmanager
+    def connection(self):
+        yield _Connection(self)
+
+    def reset_counters(self):
+        self.round_trips = 0
+        self.rows_written = 0
+
+
+class _Connection:
+    in_transaction = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, dictionary=False, buffered=None):
+        return _Cursor(self.db, dictionary)
+
+    def commit(self):
+        self.db._trip()
+
+    def rollback(self):
+        self.db._trip()
+
+    def close(self):
+        pass
+
+
+_IN_NAMES = re.compile(r"FROM stations WHERE name IN", re.I)
+_ALL_STATIONS = re.compile(r"SELECT station_id, name, latitude, longitude FROM stations", re.I)
+_HISTORY = re.compile(r"FROM pollutant_readings\s+WHERE record_id > %s", re.I)
+
+
+class _Cursor:
+    def __init__(self, db, dictionary):
+        self.db = db
+        self.dictionary = dictionary
+        self._rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def _set(self, rows):
+        if not self.dictionary:
+            rows = [tuple(r.values()) for r in rows]
+        self._rows = rows
+        self.rowcount = len(rows)
+
+    def execute(self, sql, params=()):
+        self.db._trip()
+        if _IN_NAMES.search(sql):
+            self._set([
+                {"station_id": self.db.stations[n][0], "name": n}
+                for n in params if n in self.db.stations
+            ])
+        elif _ALL_STATIONS.search(sql):
+            after = params[0] if params else 0
+            self._set([
+                {"station_id": sid, "name": n, "latitude": lat, "longitude": lon}
+                for n, (sid, lat, lon) in self.db.stations.items() if sid > after
+            ])
+        elif _HISTORY.search(sql):
+            last_id, limit = params
+            end = min(self.db.history_rows, last_id + limit)
+            self._set([_history_row(i) for i in range(last_id + 1, end + 1)])
+        else:
+            self._set([])
+
+    def executemany(self, sql, seq):
+        seq = list(seq)
+        self.db._trip()
+        if sql.lstrip().upper().startswith("INSERT INTO STATIONS"):
+            self.db.add_stations(seq)
+        self.db.rows_written += len(seq)
+        self.rowcount = len(seq)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+def _history_row(i):
+    # deterministic, varied readings so every AQI band gets exercised
+    return {
+        "record_id": i,
+        "pm25_ug_m3": float(i % 480),
+        "PM10": float((i * 7) % 590),
+        "so2_ug_m3": float((i * 13) % 900) if i % 5 else None,
+        "no2_ug_m3": float((i * 3) % 420),
+        "OZONE": float((i * 11) % 760),
+        "CO": ((i * 17) % 480) / 10.0,
+        "NH3": float((i * 19) % 2400) if i % 3 else None,
+    }
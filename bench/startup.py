@@ -0,0 +1,186 @@
+"""
+Worker start-up and per-query driver CPU benchmark.
+
+    python -m bench.startup                          # this tree
+    python -m bench.startup --baseline-rev HEAD~1    # + an older commit, side by side
+    python -m bench.startup --out new.json --compare old.json
+
+cold_import    wall time of `import app` in a fresh interpreter (what every
+               gunicorn worker pays without --preload)
+query_cpu_*    client CPU per query for each mysql.connector implementation
+               (pure Python / C extension), 1000 synthetic rows per query;
+               needs DB_* settings for a reachable MySQL, skipped otherwise
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.run import _git_commit, _percentile, compare  # noqa: E402
+
+IMPORT_SNIPPET = (
+    "import time, sys; t = time.perf_counter(); import app; "
+    "print('import_seconds', time.perf_counter() - t); "
+    "print('loaded', *[m for m in ('numpy', 'mysql.connector', 'requests', 'pymysql') "
+    "if m in sys.modules])"
+)
+
+QUERY = """
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < 1000)
+    SELECT n, NOW() AS ts, n * 1.5 AS value, CONCAT('Station ', n) AS name FROM seq
+"""
+
+
+def _result(name, scale, items, timings, **extra):
+    p50 = _percentile(timings, 50)
+    out = {
+        "name": name,
+        "scale": scale,
+        "items": items,
+        "repeat": len(timings),
+        "throughput_per_s": round(items / p50, 1) if p50 else None,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(_percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 99) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "peak_mem_kb": 0.0,
+    }
+    out.update(extra)
+    print(f"{name:<28} {str(scale):>9} {out['p50_ms']:>11.3f} {out['p95_ms']:>11.3f}")
+    return out
+
+
+def cold_import(tree, label, repeat):
+    """`import app` in a fresh interpreter, `repeat` times."""
+    timings = []
+    loaded = ""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=tree, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        for line in out.splitlines():  # app may print its own lines first
+            key, _, value = line.partition(" ")
+            if key == "import_seconds":
+                timings.append(float(value))
+            elif key == "loaded":
+                loaded = ",".join(value.split())
+    return _result("cold_import", label, 1, timings, heavy_modules_loaded=loaded)
+
+
+def _export_rev(rev):
+    """Unpack `git archive rev` into a temp dir (no checkout of this tree)."""
+    tmp = tempfile.mkdtemp(prefix="bench-startup-")
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", rev], cwd=ROOT, capture_output=True, check=True
+    ).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(tmp)
+    if (ROOT / ".env").exists():
+        (Path(tmp) / ".env").write_text((ROOT / ".env").read_text())
+    return tmp
+
+
+def query_cpu(repeat):
+    """Client CPU per 1000-row query, for each driver implementation."""
+    with open(os.devnull, "w") as devnull:
+        old, sys.stdout = sys.stdout, devnull
+        try:
+            import app as app_module
+        finally:
+            sys.stdout = old
+    import mysql.connector
+
+    try:
+        import _mysql_connector  # noqa: F401
+        implementations = [("pure", True), ("c", False)]
+    except ImportError as e:
+        print(f"   (C extension unavailable: {e})")
+        implementations = [("pure", True)]
+
+    results = []
+    for label, use_pure in implementations:
+        try:
+            conn = mysql.connector.connect(
+                host=app_module.DB_HOST,
+                port=app_module.DB_PORT,
+                user=app_module.DB_USER,
+                password=app_module.DB_PASSWORD,
+                database=app_module.DB_NAME,
+                ssl_ca=app_module.DB_SSL_CA,
+                connection_timeout=5,
+                use_pure=use_pure,
+            )
+        except Exception as e:
+            print(f"   query_cpu skipped ({label}): {e}")
+            continue
+
+        cpu = []
+        try:
+            cur = conn.cursor()
+            cur.execute(QUERY)  # warm-up
+            cur.fetchall()
+            for _ in range(repeat):
+                started = time.process_time()
+                cur.execute(QUERY)
+                rows = cur.fetchall()
+                cpu.append(time.process_time() - started)
+            cur.close()
+        finally:
+            conn.close()
+        results.append(_result(f"query_cpu_{label}", 1000, len(rows), cpu))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--baseline-rev", help="also measure cold_import at this git revision")
+    parser.add_argument("--skip-queries", action="store_true")
+    parser.add_argument("--out", default="bench_startup.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<28} {'scale':>9} {'p50 ms':>11} {'p95 ms':>11}")
+    results = [cold_import(ROOT, "tree", args.repeat)]
+    if args.baseline_rev:
+        results.append(cold_import(_export_rev(args.baseline_rev), args.baseline_rev, args.repeat))
+    for r in results:
+        print(f"   {r['scale']}: heavy modules loaded by import: {r['heavy_modules_loaded'] or 'none'}")
+    if not args.skip_queries:
+        results.extend(query_cpu(args.repeat * 10))
+
+    doc = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"\n📄 results written to {args.out}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
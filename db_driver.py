@@ -0,0 +1,63 @@
+"""
+The one MySQL driver used by the app: mysql.connector, with its C
+extension (_mysql_connector) when it loads and the pure-Python protocol
+implementation otherwise.
+
+    DB_DRIVER=auto   C extension if available, else pure Python (default)
+    DB_DRIVER=c      C extension, fail loudly if it can't be loaded
+    DB_DRIVER=pure   always pure Python
+
+mysql.connector itself is imported on first use, so processes that never
+touch the database (and CLI tools importing app) don't pay for it.
+"""
+
+import os
+import threading
+
+DB_DRIVER = os.getenv("DB_DRIVER", "auto").lower()
+
+_lock = threading.Lock()
+_state = {}
+
+
+def load():
+    """Import the driver once; returns (mysql.connector module, use_pure)."""
+    if "module" in _state:
+        return _state["module"], _state["use_pure"]
+    with _lock:
+        if "module" not in _state:
+            import mysql.connector
+
+            use_pure = True
+            if DB_DRIVER != "pure":
+                try:
+                    import _mysql_connector  # noqa: F401
+
+                    use_pure = False
+                except ImportError as e:
+                    if DB_DRIVER == "c":
+                        raise
+                    _state["c_error"] = str(e)
+            _state["use_pure"] = use_pure
+            _state["module"] = mysql.connector
+    return _state["module"], _state["use_pure"]
+
+
+def connect(**kwargs):
+    """mysql.connector.connect() with the selected protocol implementation."""
+    module, use_pure = load()
+    return module.connect(use_pure=use_pure, **kwargs)
+
+
+def info():
+    """Which implementation is in use (loads the driver)."""
+    module, use_pure = load()
+    out = {
+        "driver": "mysql.connector",
+        "version": module.__version__,
+        "implementation": "pure" if use_pure else "c",
+        "requested": DB_DRIVER,
+    }
+    if "c_error" in _state:
+        out["c_extension_error"] = _state["c_error"]
+    return out
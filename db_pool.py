@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Small bounded connection pool (one per gunicorn worker).
+
+    - connections are opened lazily, at most `size` at a time
+    - idle connections older than `recycle` seconds are closed and replaced
+    - connections idle longer than `ping_after` seconds are pinged before reuse
+    - checkout blocks up to `timeout` seconds, then raises PoolTimeout
+    """
+
+    def __init__(self, connect, size=5, timeout=10.0, recycle=1800, ping_after=30):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._lock = threading.Condition()
+        self._idle = []
+        self._open = 0
+        self._pid = None
+        self._invalid = set()
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds": 0.0,
+            "created": 0,
+            "recycled": 0,
+            "broken": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+    def _check_fork(self):
+        # A forked worker must never reuse sockets opened by the parent.
+        pid = os.getpid()
+        if self._pid != pid:
+            self._idle = []
+            self._open = 0
+            self._pid = pid
+
+    def _discard(self, pooled):
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, pooled):
+        now = time.monotonic()
+        if self.recycle and now - pooled.created_at > self.recycle:
+            self._stats["recycled"] += 1
+            return False
+        if now - pooled.last_used > self.ping_after:
+            try:
+                pooled.raw.ping(reconnect=False)
+            except Exception:
+                self._stats["broken"] += 1
+                return False
+        return True
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        started = time.monotonic()
+
+        with self._lock:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    pooled = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"no DB connection available after {self.timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                waited = True
+                self._lock.wait(remaining)
+
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - started
+
+        # Health check / connect outside the lock so slow handshakes
+        # don't block other threads from returning connections.
+        if pooled is not None and not self._is_healthy(pooled):
+            self._discard(pooled)
+            pooled = None
+
+        if pooled is None:
+            try:
+                pooled = _PooledConnection(self._connect())
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats["created"] += 1
+
+        return pooled
+
+    def _release(self, pooled, broken=False):
+        with self._lock:
+            if id(pooled.raw) in self._invalid:
+                self._invalid.discard(id(pooled.raw))
+                broken = True
+        if not broken:
+            try:
+                # End any implicit read transaction so the next user
+                # doesn't see a stale REPEATABLE READ snapshot.
+                if pooled.raw.in_transaction:
+                    pooled.raw.rollback()
+            except Exception:
+                broken = True
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # checked out before a fork; the counters were already reset
+                self._discard(pooled)
+            elif broken:
+                self._open -= 1
+                self._discard(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._lock.notify()
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+    @contextmanager
+    def connection(self):
+        """
+        with pool.connection() as conn:
+            ...
+        Uncommitted work is rolled back when the block exits.
+        """
+        pooled = self._checkout()
+        broken = False
+        try:
+            yield pooled.raw
+        except Exception as e:
+            broken = _is_connection_error(e)
+            raise
+        finally:
+            self._release(pooled, broken=broken)
+
+    def invalidate(self, conn):
+        """
+        Mark a checked-out connection as unusable (e.g. a result set was
+        abandoned half-read); it is closed instead of returned to the pool.
+        """
+        with self._lock:
+            self._invalid.add(id(conn))
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["size"] = self.size
+            out["open"] = self._open
+            out["idle"] = len(self._idle)
+            out["in_use"] = self._open - len(self._idle)
+        return out
+
+    def close_all(self):
+        with self._lock:
+            for pooled in self._idle:
+                self._discard(pooled)
+            self._open -= len(self._idle)
+            self._idle = []
+
+
+def _is_connection_error(exc):
+    # mysql.connector raises OperationalError / InterfaceError when the
+    # socket is gone; anything else (bad SQL, integrity errors) leaves the
+    # connection usable.
+    name = type(exc).__name__
+    return name in ("OperationalError", "InterfaceError") or isinstance(
+        exc, (ConnectionError, OSError)
+    )
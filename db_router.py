@@ -0,0 +1,225 @@
+"""
+Read routing between the primary and read replicas.
+
+Read-only endpoints check out connections through ReadRouter, which picks
+a healthy, caught-up replica (round robin) and falls back to the primary
+pool otherwise. Writes and read-your-writes paths keep using the primary
+pool directly.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from db_pool import _is_connection_error
+
+
+class _Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.lag = None  # seconds behind the source (None = unknown)
+        self.generation = None  # replica's data_generation at last probe
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.last_error = None
+        self.reads = 0
+        self.failures = 0
+        self._probing = threading.Lock()
+
+
+class ReadRouter:
+    """
+    primary: ConnectionPool for the primary.
+    replicas: [(name, ConnectionPool)].
+
+    A replica serves reads while:
+    - its last probe (at most every `check_interval` seconds) succeeded,
+    - it is at most `max_lag` seconds behind its source, and
+    - its data_generation has reached required_generation() (if given),
+      so a response cached for a generation is never built from an older
+      replica snapshot.
+    A replica whose connection fails is taken out for `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        primary,
+        replicas,
+        max_lag=30.0,
+        check_interval=5.0,
+        cooldown=30.0,
+        required_generation=None,
+    ):
+        self.primary = primary
+        self.replicas = [_Replica(name, pool) for name, pool in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.cooldown = cooldown
+        self.required_generation = required_generation
+        self._next = 0
+        self._lock = threading.Lock()
+        self._owners = {}  # id(conn) → pool, for invalidate()
+        self.primary_reads = 0
+
+    # ---------- health ----------
+
+    def _probe(self, replica):
+        """Refresh lag / generation; one thread per replica at a time."""
+        if not replica._probing.acquire(blocking=False):
+            return
+        try:
+            with replica.pool.connection() as conn:
+                with conn.cursor(dictionary=True, buffered=True) as cur:
+                    replica.lag = _replication_lag(cur)
+                    cur.execute("SELECT generation FROM data_generation WHERE id = 1")
+                    row = cur.fetchone()
+                    replica.generation = row["generation"] if row else 0
+            replica.healthy = replica.lag is None or replica.lag <= self.max_lag
+            replica.last_error = None if replica.healthy else f"lag {replica.lag}s"
+        except Exception as e:
+            self._mark_down(replica, e)
+        finally:
+            replica.checked_at = time.monotonic()
+            replica._probing.release()
+
+    def _mark_down(self, replica, error):
+        replica.healthy = False
+        replica.failures += 1
+        replica.down_until = time.monotonic() + self.cooldown
+        replica.last_error = str(error)
+        print(f"⚠️ replica {replica.name} unavailable:", error)
+
+    def _usable(self, replica, required):
+        now = time.monotonic()
+        if now < replica.down_until:
+            return False
+        if now - replica.checked_at >= self.check_interval:
+            self._probe(replica)
+        if not replica.healthy:
+            return False
+        return required is None or (
+            replica.generation is not None and replica.generation >= required
+        )
+
+    def _pick(self):
+        if not self.replicas:
+            return None
+        required = None
+        if self.required_generation is not None:
+            try:
+                required = self.required_generation()
+            except Exception:
+                return None  # can't tell what is fresh: read the primary
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if self._usable(replica, required):
+                return replica
+        return None
+
+    # ---------- public API ----------
+
+    @contextmanager
+    def read_connection(self):
+        """
+        with router.read_connection() as conn:
+            ...   # SELECTs only
+        """
+        replica = self._pick()
+        if replica is not None:
+            try:
+                cm = replica.pool.connection()
+                conn = cm.__enter__()
+            except Exception as e:
+                self._mark_down(replica, e)
+                replica = None
+        if replica is None:
+            cm = self.primary.connection()
+            conn = cm.__enter__()
+            self.primary_reads += 1
+        else:
+            replica.reads += 1
+
+        self._owners[id(conn)] = replica.pool if replica else self.primary
+        try:
+            yield conn
+        except BaseException as e:
+            if replica is not None and isinstance(e, Exception) and _is_connection_error(e):
+                self._mark_down(replica, e)
+            if not cm.__exit__(type(e), e, e.__traceback__):
+                raise
+        else:
+            cm.__exit__(None, None, None)
+        finally:
+            self._owners.pop(id(conn), None)
+
+    def invalidate(self, conn):
+        """ConnectionPool.invalidate() on whichever pool lent `conn`."""
+        pool = self._owners.get(id(conn), self.primary)
+        pool.invalidate(conn)
+
+    def stats(self):
+        return {
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {
+                    "name": r.name,
+                    "healthy": r.healthy and time.monotonic() >= r.down_until,
+                    "lag_seconds": r.lag,
+                    "generation": r.generation,
+                    "reads": r.reads,
+                    "failures": r.failures,
+                    "last_error": r.last_error,
+                    "pool": r.pool.stats(),
+                }
+                for r in self.replicas
+            ],
+        }
+
+    def gauges(self):
+        """Flat name → number view of stats() for metrics.Registry.gauges()."""
+        out = {"primary_reads": self.primary_reads}
+        for r in self.replicas:
+            key = _metric_name(r.name)
+            out[f"{key}_healthy"] = int(r.healthy and time.monotonic() >= r.down_until)
+            out[f"{key}_reads"] = r.reads
+            out[f"{key}_failures"] = r.failures
+            if r.lag is not None:
+                out[f"{key}_lag_seconds"] = r.lag
+        return out
+
+
+def _metric_name(name):
+    return re.sub(r"\W", "_", name)
+
+
+def _replication_lag(cur):
+    """
+    Seconds behind the source from SHOW REPLICA STATUS (MySQL 8.0.22+) or
+    SHOW SLAVE STATUS. None when the server isn't a replica or the user
+    lacks REPLICATION CLIENT (freshness then rests on the generation check).
+    Raises if replication is configured but stopped.
+    """
+    for sql, column in (
+        ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+        ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+    ):
+        try:
+            cur.execute(sql)
+            row = cur.fetchone()
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            continue
+        if not row:
+            return None
+        lag = row.get(column)
+        if lag is None:
+            raise RuntimeError("replication is not running")
+        return float(lag)
+    return None
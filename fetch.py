@@ -1,14 +1,31 @@
-import time
-import schedule
-from app import app, sync_external_data
-def job():
-    print("🔄 Running hourly sync...")
+"""
+External data sync worker.
+
+    python fetch.py          # run the hourly sync scheduler (Procfile `worker`)
+    python fetch.py --once   # run the current slot now (if not already run)
+
+The scheduler can also run inside the web workers instead: start gunicorn
+with SYNC_SCHEDULER=web (see gunicorn.conf.py). Either way every run is
+single-flight across processes.
+"""
+
+import signal
+import sys
+
+from app import app, build_sync_scheduler, migrate
+
+
+def main():
+    migrate()
+    scheduler = build_sync_scheduler()
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+
     with app.app_context():
-        sync_external_data()
-print("⏳ Scheduler started")
-with app.app_context():
-    sync_external_data()
-schedule.every().hour.at(":15").do(job)
-while True:
-    schedule.run_pending()
-    time.sleep(1)
\ No newline at end of file
+        if "--once" in sys.argv:
+            status = scheduler.run_once()
+            sys.exit(0 if status in ("ok", "done") else 1)
+        scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+# MIGRATE_ON_START=1 (default) runs `python migrate.py` once in the master
+# before any worker starts; workers never migrate themselves. Set it to 0
+# where a release phase (Procfile `release`) already does it.
+#
+# SYNC_SCHEDULER=web runs the hourly sync scheduler on a background thread
+# in every worker; the MySQL named lock lets only one of them run a slot.
+# Leave it unset when a separate `python fetch.py` worker does the sync.
+#
+# WRITE_BEHIND=1: each worker claims its write-behind log at start-up, so
+# rows queued before a restart are replayed without waiting for traffic.
+#
+# GUNICORN_PRELOAD=1 imports the app once in the master and forks workers
+# from it: worker boot is a fork instead of a full import, and the driver,
+# numpy and requests modules are shared copy-on-write. Pools, sessions and
+# threads are all created lazily, so nothing connected is inherited.
+#
+# /api/live (Server-Sent Events) keeps one request open per client, so
+# workers are gthread by default: a stream pins one of GUNICORN_THREADS
+# threads, and at most half of them may stream (the rest keep serving
+# normal requests). gthread workers heartbeat from their main loop, so a
+# 10-minute stream is not killed by `timeout` the way a sync worker is.
+# With GUNICORN_WORKER_CLASS=sync (and one thread) /api/live answers 503.
+# gevent/eventlet are not installed by requirements.txt; if you add one,
+# the driver is switched to pure Python (the C extension blocks the hub).
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+if worker_class in ("gevent", "eventlet"):
+    os.environ.setdefault("DB_DRIVER", "pure")
+
+
+def on_starting(server):
+    if os.getenv("MIGRATE_ON_START", "1") != "1":
+        return
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, os.path.join(here, "migrate.py")], cwd=here)
+    if result.returncode != 0:
+        # keep serving: requests answer 503 until a migration succeeds
+        server.log.warning("migrate.py failed (exit %s)", result.returncode)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import db_driver
+    import aqi
+    import requests  # noqa: F401
+
+    db_driver.load()
+    for pollutant in aqi.POLLUTANTS:
+        aqi._table(pollutant)
+
+
+def post_worker_init(worker):
+    from app import build_sync_scheduler, configure_live_streams, get_write_behind
+
+    get_write_behind()
+    configure_live_streams(worker_class, threads)
+
+    if os.getenv("SYNC_SCHEDULER") == "web":
+        worker.sync_scheduler = build_sync_scheduler()
+        worker.sync_scheduler.start_background()
+
+
+def worker_exit(server, worker):
+    from app import get_write_behind
+
+    scheduler = getattr(worker, "sync_scheduler", None)
+    if scheduler is not None:
+        scheduler.stop()
+
+    queue = get_write_behind()
+    if queue is not None:
+        queue.close()
@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every worker thread talking to one provider.
+    `rate` tokens are added per second, up to `burst` tokens.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def fan_out(fn, items, max_workers=8, limiter=None, deadline=None):
+    """
+    Run fn(item) for every item on a thread pool.
+
+    Returns a list of (item, result, error) in the SAME order as `items`,
+    so callers see exactly what a sequential loop would have produced.
+    Items still unfinished when `deadline` seconds have passed get a
+    TimeoutError instead of a result.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return []
+
+    def call(item):
+        if limiter is not None:
+            limiter.acquire()
+        return fn(item)
+
+    ex = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    futures = {ex.submit(call, item): i for i, item in enumerate(items)}
+    try:
+        for fut in as_completed(futures, timeout=deadline):
+            i = futures[fut]
+            try:
+                results[i] = (items[i], fut.result(), None)
+            except Exception as e:
+                results[i] = (items[i], None, e)
+    except FuturesTimeout:
+        for fut, i in futures.items():
+            if results[i] is None:
+                fut.cancel()
+                results[i] = (
+                    items[i],
+                    None,
+                    TimeoutError(f"stage deadline of {deadline}s exceeded"),
+                )
+    finally:
+        # Don't block on stragglers: each request has its own timeout.
+        ex.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+def time_left(deadline, cap=None):
+    """
+    Seconds until the absolute time.monotonic() `deadline` (None = no
+    deadline), optionally capped; never negative.
+    """
+    if deadline is None:
+        return cap
+    left = max(0.0, deadline - time.monotonic())
+    return left if cap is None else min(left, cap)
+
+
+def retry(fn, attempts=3, base_delay=5.0, max_delay=120.0, deadline=None, label="call"):
+    """
+    Call fn(final) until it returns, at most `attempts` times. Sleeps
+    base_delay * 2**n (±20 % jitter, capped at max_delay) between attempts.
+    `final` is True for the last attempt: the last of `attempts`, or the
+    one after which the absolute monotonic `deadline` leaves no time for
+    another. Re-raises the last error.
+    """
+    attempts = max(1, int(attempts))
+    for attempt in range(1, attempts + 1):
+        delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+        left = time_left(deadline)
+        final = attempt == attempts or (left is not None and left <= delay)
+        try:
+            return fn(final)
+        except Exception as e:
+            if final:
+                raise
+            delay = min(delay * random.uniform(0.8, 1.2), time_left(deadline, delay))
+            print(f"⚠️ {label} failed (attempt {attempt}/{attempts}): {e}; retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+
+class StageTimer:
+    """Collects wall-clock durations of named sync stages (plus counters)."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - started, 3)
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def report(self):
+        return {**self.stages, **self.counts}
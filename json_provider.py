@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the stdlib path keeps a bare install working
+    orjson = None
+
+
+def format_timedelta(val):
+    """MySQL TIME comes back as timedelta → 'HH:MM:SS'."""
+    total_seconds = int(val.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def encode_value(val):
+    """
+    JSON form of one MySQL result value:
+        datetime  → ISO 8601 ('2026-01-01T10:00:00')
+        date/time → 'YYYY-MM-DD' / 'HH:MM:SS'
+        timedelta → 'HH:MM:SS'
+        Decimal   → float
+        bytes     → UTF-8 text (base64 if not valid UTF-8)
+    Anything else is returned unchanged.
+    """
+    if isinstance(val, (datetime, date, time)):
+        return val.isoformat()
+    if isinstance(val, timedelta):
+        return format_timedelta(val)
+    if isinstance(val, Decimal):
+        return float(val)
+    if isinstance(val, (bytes, bytearray, memoryview)):
+        raw = bytes(val)
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(raw).decode("ascii")
+    return val
+
+
+def _default(val):
+    encoded = encode_value(val)
+    if encoded is val:
+        raise TypeError(f"Object of type {type(val).__name__} is not JSON serializable")
+    return encoded
+
+
+def dumps(obj, sort_keys=False, indent=False):
+    """Encode in one pass (no intermediate copy of the rows); compact unless indent."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option).decode("utf-8")
+    return json.dumps(
+        obj,
+        default=_default,
+        sort_keys=sort_keys,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+    )
+
+
+def columnar(rows):
+    """
+    [{"a": 1, "b": 2}, ...] → {"columns": ["a", "b"], "data": [[1, 2], ...]}
+    Column names are sent once instead of once per row.
+    """
+    if not rows:
+        return {"columns": [], "data": []}
+    columns = list(rows[0].keys())
+    return {"columns": columns, "data": [list(r.values()) for r in rows]}
+
+
+class RowJSONProvider(DefaultJSONProvider):
+    """
+    App JSON provider that understands MySQL result types, so views can
+    jsonify() raw cursor rows directly. Uses orjson when installed.
+    """
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        # Flask's response() always passes compact separators or indent=2;
+        # both map onto orjson, anything else falls back to the stdlib.
+        if orjson is not None:
+            rest = dict(kwargs)
+            separators = rest.pop("separators", (",", ":"))
+            indent = rest.pop("indent", None)
+            if not rest and separators == (",", ":") and indent in (None, 2):
+                return dumps(obj, sort_keys=self.sort_keys, indent=bool(indent))
+        kwargs.setdefault("default", _default)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
@@ -0,0 +1,307 @@
+"""
+Live update fan-out for Server-Sent Events.
+
+Write paths call Broadcaster.publish() after their commit. The event is
+encoded once, handed to a backend, and delivered to every subscriber in
+this process; each subscriber (one per open /api/live stream) has its own
+bounded queue, so a slow client never blocks ingestion or other clients.
+
+Backends decide how events reach the other processes:
+
+    LocalBackend   this process only (single worker, development)
+    MySQLBackend   events go through a live_events table; every process
+                   that has subscribers polls it from ONE thread, so
+                   publishers in other workers or in fetch.py reach all
+                   streams, however many clients are connected
+
+Nothing is encoded or written while no process has an open stream:
+backend.has_listeners() is checked first (for MySQL, processes with
+subscribers keep a row in live_listeners fresh).
+
+Every open stream holds one request thread while it waits on its queue,
+so the app caps streams per worker (see configure_live_streams in app.py).
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+
+class Subscription:
+    """One client stream: a bounded queue of (event_id, event, data)."""
+
+    def __init__(self, broadcaster, stations, max_queue):
+        self._broadcaster = broadcaster
+        self.stations = stations  # set of names, or None for every station
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def offer(self, item):
+        """Queue an event; returns False once the client has fallen behind."""
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # the client fell behind: it gets a 'resync' and reconnects
+            self.overflowed = True
+            return False
+        return True
+
+    def get(self, timeout):
+        """Next (event_id, event, data), or None after `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broadcaster._unsubscribe(self)
+
+
+class SubscriberLimit(Exception):
+    """This process already serves max_subscribers streams."""
+
+
+class Broadcaster:
+    """
+    publish(event, data): data must be JSON-serializable by `dumps`.
+    Events carry increasing ids (per backend); the last `history` events
+    are kept so a reconnecting client (Last-Event-ID) misses nothing.
+    """
+
+    def __init__(self, backend, dumps=json.dumps, max_queue=256, history=256, max_subscribers=1000):
+        self.backend = backend
+        self.dumps = dumps
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._listening = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def publish(self, event, data):
+        """Never raises: live updates must not fail the write that triggered them."""
+        try:
+            if not self.backend.has_listeners():
+                return
+            self.backend.publish(event, self.dumps(data))
+            self.published += 1
+        except Exception as e:
+            print("⚠️ live update publish failed:", e)
+
+    def deliver(self, event_id, event, data):
+        """Backend callback: hand one encoded event to local subscribers."""
+        item = (event_id, event, data)
+        with self._lock:
+            self._history.append(item)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            was_behind = sub.overflowed
+            if not sub.offer(item) and not was_behind:
+                self.dropped += 1
+        self.delivered += 1
+
+    def subscribe(self, stations=None, last_event_id=None):
+        """
+        Register a stream. Returns (subscription, replay, complete):
+        replay holds the buffered events after last_event_id; complete is
+        False when the buffer can't tell what the client missed (id older
+        than the buffer, or from before a restart): it should resync.
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise SubscriberLimit(f"{len(self._subscribers)} live streams open")
+            if not self._listening:
+                self.backend.listen(self.deliver, self.active)
+                self._listening = True
+            sub = Subscription(self, stations, self.max_queue)
+            self._subscribers.add(sub)
+            replay, complete = [], True
+            if last_event_id is not None:
+                replay = [item for item in self._history if item[0] > last_event_id]
+                complete = bool(self._history) and (
+                    self._history[0][0] <= last_event_id + 1 <= self._history[-1][0] + 1
+                )
+        return sub, replay, complete
+
+    def active(self):
+        """True while this process has at least one open stream."""
+        return bool(self._subscribers)
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_subscribers": self.dropped,
+        }
+
+
+class LocalBackend:
+    """In-process delivery: publish() calls the broadcaster directly."""
+
+    def __init__(self):
+        self._deliver = None
+        self._active = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def listen(self, deliver, active):
+        self._deliver, self._active = deliver, active
+
+    def has_listeners(self):
+        return self._active is not None and self._active()
+
+    def publish(self, event, data):
+        with self._lock:
+            self._next_id += 1
+            event_id = self._next_id
+        self._deliver(event_id, event, data)
+
+
+class MySQLBackend:
+    """
+    connection: zero-arg callable returning a connection context manager.
+    Events older than `retention` seconds are pruned by publishers.
+    A process with open streams refreshes its live_listeners row every
+    listener_ttl / 3 seconds; publishers look for a fresh row at most
+    every presence_interval seconds and skip the INSERT when there is none.
+
+    AUTO_INCREMENT ids are assigned at INSERT but become visible at
+    COMMIT, so id 11 can show up while id 10 is still uncommitted. The
+    poller delivers strictly in id order: at a gap it waits up to
+    gap_timeout seconds for the missing id (a rolled-back publish never
+    fills it) before moving past it.
+    """
+
+    def __init__(
+        self,
+        connection,
+        poll_interval=1.0,
+        retention=3600,
+        batch=500,
+        listener_ttl=30,
+        presence_interval=5.0,
+        gap_timeout=5.0,
+    ):
+        self._connection = connection
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch = batch
+        self.listener_ttl = listener_ttl
+        self.presence_interval = presence_interval
+        self.gap_timeout = gap_timeout
+        self.listener_id = f"{socket.gethostname()}:{os.getpid()}"[:128]
+        self._last_prune = 0.0
+        self._presence = (False, None)  # (listeners seen, checked at)
+        self._thread = None
+
+    def has_listeners(self):
+        present, checked_at = self._presence
+        now = time.monotonic()
+        if checked_at is None or now - checked_at >= self.presence_interval:
+            with self._connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "SELECT 1 FROM live_listeners WHERE seen_at >= %s LIMIT 1",
+                    (datetime.now() - timedelta(seconds=self.listener_ttl),),
+                )
+                present = cur.fetchone() is not None
+                conn.commit()
+            self._presence = (present, now)
+        return present
+
+    def publish(self, event, data):
+        with self._connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO live_events (created_at, event, payload) VALUES (%s, %s, %s)",
+                (datetime.now(), event, data),
+            )
+            conn.commit()
+            if time.monotonic() - self._last_prune > 60:
+                self._last_prune = time.monotonic()
+                cur.execute(
+                    "DELETE FROM live_events WHERE created_at < %s",
+                    (datetime.now() - timedelta(seconds=self.retention),),
+                )
+                cur.execute(
+                    "DELETE FROM live_listeners WHERE seen_at < %s",
+                    (datetime.now() - timedelta(seconds=self.listener_ttl),),
+                )
+                conn.commit()
+
+    def listen(self, deliver, active):
+        self._thread = threading.Thread(
+            target=self._poll, args=(deliver, active), name="live-events-poller", daemon=True
+        )
+        self._thread.start()
+
+    def _heartbeat(self, cur):
+        cur.execute(
+            """
+            INSERT INTO live_listeners (listener, seen_at) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE seen_at = VALUES(seen_at)
+            """,
+            (self.listener_id, datetime.now()),
+        )
+
+    def _poll(self, deliver, active):
+        last_id = None  # every id <= last_id was delivered (or given up on)
+        step = 1  # @@auto_increment_increment
+        gap_since = None
+        beat_at = None
+        while True:
+            if not active():
+                # no streams here: stop advertising, restart at the tail later
+                last_id = beat_at = gap_since = None
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                with self._connection() as conn, conn.cursor() as cur:
+                    if beat_at is None or time.monotonic() - beat_at >= self.listener_ttl / 3:
+                        self._heartbeat(cur)
+                        beat_at = time.monotonic()
+                    if last_id is None:
+                        # start at the tail: history is not replayed to new processes
+                        cur.execute(
+                            "SELECT COALESCE(MAX(event_id), 0), @@auto_increment_increment"
+                            " FROM live_events"
+                        )
+                        last_id, step = cur.fetchone()
+                    cur.execute(
+                        """
+                        SELECT event_id, event, payload FROM live_events
+                        WHERE event_id > %s ORDER BY event_id LIMIT %s
+                        """,
+                        (last_id, self.batch),
+                    )
+                    rows = cur.fetchall()
+                    conn.commit()  # end the snapshot so the next poll sees new rows
+                for event_id, event, payload in rows:
+                    if event_id > last_id + step:
+                        # an earlier id may still be committing: hold back
+                        if gap_since is None:
+                            gap_since = time.monotonic()
+                        if time.monotonic() - gap_since < self.gap_timeout:
+                            break
+                    gap_since = None
+                    deliver(event_id, event, payload)
+                    last_id = event_id
+                else:
+                    if len(rows) == self.batch:
+                        continue
+            except Exception as e:
+                print("⚠️ live events poll failed:", e)
+            time.sleep(self.poll_interval)
@@ -0,0 +1,247 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Each gunicorn worker keeps its own registry; scrape every worker (or run
+one worker per scrape target) to see the whole picture.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = _labels(self.labelnames, key, ("le", repr(float(bound))))
+                yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, ('le', '+Inf'))} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(self, prefix, help_text, fn):
+        """fn() → dict name → number, exported as `<prefix>_<name>` gauges."""
+        self._collectors.append((prefix, help_text, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, help_text, fn in self._collectors:
+            try:
+                values = fn()
+            except Exception as e:
+                print(f"⚠️ metrics collector {prefix} failed:", e)
+                continue
+            for key, value in values.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ("route", "method", "status"),
+)
+http_response_bytes = registry.histogram(
+    "http_response_size_bytes", "HTTP response body size",
+    ("route",), buckets=SIZE_BUCKETS,
+)
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Cursor execute/executemany time", ("query", "status"),
+)
+db_connect_seconds = registry.histogram(
+    "db_connect_duration_seconds", "New MySQL connection setup (TCP + TLS + auth)",
+)
+db_slow_queries = registry.counter(
+    "db_slow_queries_total", "Queries slower than SLOW_QUERY_MS", ("query",),
+)
+upstream_request_seconds = registry.histogram(
+    "upstream_request_duration_seconds", "Upstream API call latency",
+    ("provider", "status"),
+)
+sync_runs = registry.counter(
+    "sync_runs_total", "Scheduled sync runs by outcome", ("status",),
+)
+sync_stage_seconds = registry.histogram(
+    "sync_stage_duration_seconds", "Duration of each sync stage", ("stage",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800),
+)
+
+
+_VERB = re.compile(r"^\s*(\w+)", re.S)
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)", re.I)
+
+
+@lru_cache(maxsize=1024)
+def query_name(sql):
+    """'SELECT ... FROM latest_readings ...' → 'select latest_readings'."""
+    verb = _VERB.match(sql)
+    table = _TABLE.search(sql)
+    return " ".join(
+        p for p in (verb.group(1).lower() if verb else "?", table.group(1) if table else "") if p
+    )
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute()/executemany()."""
+
+    def __init__(self, cursor, slow_query_seconds):
+        self._cursor = cursor
+        self._slow = slow_query_seconds
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def _timed(self, method, sql, *args):
+        name = query_name(sql)
+        status = "ok"
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            db_query_seconds.observe(elapsed, query=name, status=status)
+            if self._slow and elapsed >= self._slow:
+                db_slow_queries.inc(query=name)
+                print(f"🐢 slow query ({elapsed * 1000:.0f} ms) [{name}]: {' '.join(sql.split())[:300]}")
+
+    def execute(self, sql, *args, **kwargs):
+        return self._timed(lambda q, *a: self._cursor.execute(q, *a, **kwargs), sql, *args)
+
+    def executemany(self, sql, seq):
+        return self._timed(self._cursor.executemany, sql, seq)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursor."""
+
+    def __init__(self, conn, slow_query_seconds):
+        self._conn = conn
+        self._slow = slow_query_seconds
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._slow)
+
+
+def instrumented_connect(connect, slow_query_seconds):
+    """Wrap a connection factory: times the connect, instruments the result."""
+
+    def factory():
+        with db_connect_seconds.time():
+            conn = connect()
+        return InstrumentedConnection(conn, slow_query_seconds)
+
+    return factory
@@ -0,0 +1,12 @@
+"""
+Schema migrations and one-time backfills for this service's tables.
+
+    python migrate.py    # Procfile `release`; safe to run concurrently
+
+Web workers never migrate: until this has run they answer 503.
+"""
+
+from app import app, migrate
+
+with app.app_context():
+    migrate()
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+
+class DataGeneration:
+    """
+    Cluster-wide "data generation" counter.
+
+    Every write path bumps it inside its own transaction; readers cache the
+    value for `check_interval` seconds so a cache hit costs no DB round trip
+    most of the time. load() must return (generation, updated_at).
+    """
+
+    def __init__(self, load, check_interval=5):
+        self._load = load
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._value = (0, None)
+        self._checked_at = None
+
+    def current(self):
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is None or now - checked_at > self.check_interval:
+            try:
+                value = self._load()
+            except Exception as e:
+                print("⚠️ data generation check failed:", e)
+                value = self._value
+            with self._lock:
+                self._value = value
+                self._checked_at = now
+        return self._value
+
+    def bump(self, cur):
+        cur.execute(
+            """
+            INSERT INTO data_generation (id, generation, updated_at)
+            VALUES (1, 1, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                generation = generation + 1,
+                updated_at = UTC_TIMESTAMP()
+            """
+        )
+        # re-read on the next request instead of waiting for the interval
+        self._checked_at = None
+
+
+class _Entry:
+    __slots__ = ("generation", "body", "status", "mimetype", "etag", "size")
+
+    def __init__(self, generation, body, status, mimetype):
+        self.generation = generation
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.md5(body).hexdigest()
+        self.size = len(body)
+
+
+class ResponseCache:
+    """LRU cache of rendered responses, bounded by entry count and bytes."""
+
+    def __init__(self, generation, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.generation = generation
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "not_modified": 0}
+
+    def _get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry.generation != generation:
+                self._drop(key)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["bytes"] = self._bytes
+            out["max_entries"] = self.max_entries
+            out["max_bytes"] = self.max_bytes
+        out["generation"] = self.generation.current()[0]
+        return out
+
+    def _respond(self, entry, last_modified):
+        resp = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+        resp.set_etag(entry.etag)
+        if last_modified is not None:
+            resp.last_modified = last_modified
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.make_conditional(request)
+        if resp.status_code == 304:
+            with self._lock:
+                self._stats["not_modified"] += 1
+        return resp
+
+    def cached(self, vary=None):
+        """
+        Decorator for GET views. The key is the endpoint plus the sorted
+        query args (plus vary() when the output also depends on something
+        else, e.g. the current hour). Only 200 responses are stored.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                generation, last_modified = self.generation.current()
+                key = (
+                    request.endpoint,
+                    tuple(sorted(request.args.items(multi=True))),
+                    vary() if vary else None,
+                )
+
+                entry = self._get(key, generation)
+                if entry is None:
+                    resp = make_response(view(*args, **kwargs))
+                    if resp.status_code != 200 or resp.is_streamed:
+                        return resp
+                    entry = _Entry(
+                        generation, resp.get_data(), resp.status_code, resp.mimetype
+                    )
+                    self._put(key, entry)
+
+                return self._respond(entry, last_modified)
+
+            return wrapper
+
+        return decorator
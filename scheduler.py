@@ -0,0 +1,158 @@
+"""
+Periodic sync scheduler.
+
+Runs a job once per `interval` seconds, `offset` seconds into each slot
+(3600 / 900 = every hour at :15), plus a random start jitter. Any number
+of processes may run a scheduler for the same job: every run is taken
+under a cross-process lock and skipped if another process has already
+run that slot. A slot missed while nothing was running (restart, overrun)
+is caught up once, not once per missed slot.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class MySQLLock:
+    """
+    Named server lock (GET_LOCK) held on its own connection for the
+    duration of a run. MySQL releases it if the holder dies.
+    """
+
+    def __init__(self, connect, name, wait=0):
+        self._connect = connect
+        self.name = name
+        self.wait = wait
+
+    @contextmanager
+    def hold(self):
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT GET_LOCK(%s, %s)", (self.name, self.wait))
+            acquired = cur.fetchone()[0] == 1
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    cur.execute("SELECT RELEASE_LOCK(%s)", (self.name,))
+                    cur.fetchone()
+                cur.close()
+        finally:
+            conn.close()
+
+
+class SyncScheduler:
+    """
+    job(deadline) → report dict; `deadline` is an absolute time.monotonic()
+    value the job should finish by. The run's status is report["status"]
+    if set (e.g. 'partial'), else 'ok'; 'error' if the job raised.
+    last_run() → datetime of the newest slot any process has run (or None).
+    record_run(slot, started, finished, status, report) persists a run.
+    """
+
+    def __init__(
+        self,
+        job,
+        lock,
+        last_run,
+        record_run,
+        interval=3600,
+        offset=900,
+        jitter=120,
+        run_deadline=1800,
+        name="sync",
+    ):
+        self.job = job
+        self.lock = lock
+        self.last_run = last_run
+        self.record_run = record_run
+        self.interval = interval
+        self.offset = offset
+        self.jitter = jitter
+        self.run_deadline = run_deadline
+        self.name = name
+        self._stop = threading.Event()
+
+    def slot_for(self, ts):
+        """Start (epoch seconds) of the slot containing `ts`."""
+        return (ts - self.offset) // self.interval * self.interval + self.offset
+
+    def run_once(self, slot=None):
+        """
+        Run the job for `slot` (default: the current slot) unless another
+        process holds the lock or has already run it. Returns the run's
+        status, or 'locked' / 'done' when it was skipped.
+        """
+        slot_at = datetime.fromtimestamp(self.slot_for(time.time()) if slot is None else slot)
+
+        with self.lock.hold() as acquired:
+            if not acquired:
+                print(f"🔒 {self.name}: another process is running it, skipping")
+                return "locked"
+
+            last = self.last_run()
+            if last is not None and last >= slot_at:
+                print(f"⏭  {self.name}: slot {slot_at} already run")
+                return "done"
+
+            started = datetime.now()
+            deadline = time.monotonic() + self.run_deadline
+            try:
+                report = self.job(deadline)
+                status = report.get("status", "ok")
+            except Exception as e:
+                print(f"⚠️ {self.name} run failed:", e)
+                report = {"error": str(e)}
+                status = "error"
+            finished = datetime.now()
+
+            try:
+                self.record_run(slot_at, started, finished, status, report)
+            except Exception as e:
+                print(f"⚠️ {self.name}: could not record run:", e)
+
+            print(f"🏁 {self.name} {status} in {(finished - started).total_seconds():.1f}s")
+            return status
+
+    def run_forever(self):
+        """Catch up the current slot if it never ran, then run every slot."""
+        print(f"⏳ {self.name} scheduler started (pid {os.getpid()})")
+        self._run_logged()
+
+        while not self._stop.is_set():
+            now = time.time()
+            next_slot = self.slot_for(now) + self.interval
+            delay = next_slot - now + random.uniform(0, self.jitter)
+            if self._stop.wait(delay):
+                break
+
+            slot = self.slot_for(time.time())
+            missed = int((slot - next_slot) // self.interval)
+            if missed > 0:
+                print(f"⚠️ {self.name}: {missed} slot(s) missed, catching up once")
+            self._run_logged(slot)
+
+        print(f"🛑 {self.name} scheduler stopped")
+
+    def _run_logged(self, slot=None):
+        # lock/DB trouble must not kill the loop; the next slot retries
+        try:
+            self.run_once(slot)
+        except Exception as e:
+            print(f"⚠️ {self.name} scheduler error:", e)
+
+    def start_background(self):
+        """Run the loop on a daemon thread (e.g. inside a gunicorn worker)."""
+        thread = threading.Thread(
+            target=self.run_forever, name=f"{self.name}-scheduler", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
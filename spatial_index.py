@@ -0,0 +1,94 @@
+"""
+k-nearest-station lookup.
+
+Stations are stored as points on the unit sphere (x, y, z) in a static
+KD-tree: straight-line distance between unit vectors grows monotonically
+with great-circle distance, so the tree's Euclidean search returns the
+right neighbours without special cases at the antimeridian or the poles.
+"""
+
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _unit_vector(lat, lon):
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    return (
+        math.cos(phi) * math.cos(lam),
+        math.cos(phi) * math.sin(lam),
+        math.sin(phi),
+    )
+
+
+def chord_to_km(chord):
+    """Straight-line distance between unit vectors → great-circle km."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """
+    Built once from items [(lat, lon, payload)]; immutable afterwards, so
+    readers need no locking (rebuild and swap the reference instead).
+    """
+
+    def __init__(self, items):
+        points = [(_unit_vector(lat, lon), payload) for lat, lon, payload in items]
+        # node: (point, payload, axis, left, right)
+        self._root = self._build(points, 0)
+        self.size = len(points)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        point, payload = points[mid]
+        return (
+            point,
+            payload,
+            axis,
+            self._build(points[:mid], depth + 1),
+            self._build(points[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, lat, lon, k=1):
+        """[(distance_km, payload)] for the k nearest items, closest first."""
+        if k <= 0 or self._root is None:
+            return []
+        target = _unit_vector(lat, lon)
+        best = []  # max-heap of (-squared distance, tiebreak, payload)
+        counter = 0
+
+        # (node, squared distance from target to the node's region bound)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, plane_d2 = stack.pop()
+            # the region can only hold a closer point if its splitting plane
+            # is nearer than the current k-th best
+            if node is None or (len(best) == k and plane_d2 >= -best[0][0]):
+                continue
+            point, payload, axis, left, right = node
+            d2 = (
+                (point[0] - target[0]) ** 2
+                + (point[1] - target[1]) ** 2
+                + (point[2] - target[2]) ** 2
+            )
+            counter += 1
+            if len(best) < k:
+                heapq.heappush(best, (-d2, counter, payload))
+            elif d2 < -best[0][0]:
+                heapq.heapreplace(best, (-d2, counter, payload))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, diff * diff))
+            stack.append((near, plane_d2))  # popped first: tightens the bound early
+
+        return [
+            (chord_to_km(math.sqrt(-neg_d2)), payload)
+            for neg_d2, _, payload in sorted(best, reverse=True)
+        ]
@@ -0,0 +1,171 @@
+import threading
+import time
+
+from spatial_index import KDTree
+
+
+class StationRegistry:
+    """
+    In-process copy of the `stations` table.
+
+    Loaded once on first use, then kept current by:
+    - refresh_new(): incremental load of rows with station_id > max known id
+      (called after we insert stations, and on a lookup miss)
+    - a full reload once the snapshot is older than `ttl` seconds
+
+    nearest() searches a KD-tree over the stations with coordinates, built
+    on first use after each change to the snapshot.
+    """
+
+    def __init__(self, connection, ttl=900, miss_refresh_interval=5):
+        # connection: zero-arg callable returning a connection context manager
+        self._connection = connection
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._id_by_name = {}
+        self._max_id = 0
+        self._loaded_at = None
+        self._last_miss_refresh = 0.0
+        self._index = None
+
+    # ------------------------------------------------------------------
+    # loading
+    # ------------------------------------------------------------------
+    def _fetch(self, after_id=None):
+        sql = "SELECT station_id, name, latitude, longitude FROM stations"
+        params = ()
+        if after_id is not None:
+            sql += " WHERE station_id > %s"
+            params = (after_id,)
+        with self._connection() as conn, conn.cursor(dictionary=True) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def _add_rows(self, rows):
+        for r in rows:
+            record = {
+                "station_id": r["station_id"],
+                "name": r["name"],
+                "latitude": float(r["latitude"]) if r["latitude"] is not None else None,
+                "longitude": float(r["longitude"]) if r["longitude"] is not None else None,
+            }
+            self._by_id[record["station_id"]] = record
+            if record["name"]:
+                self._id_by_name[record["name"]] = record["station_id"]
+            self._max_id = max(self._max_id, record["station_id"])
+        if rows:
+            self._index = None
+
+    def reload(self):
+        rows = self._fetch()
+        with self._lock:
+            self._by_id = {}
+            self._id_by_name = {}
+            self._max_id = 0
+            self._index = None
+            self._add_rows(rows)
+            self._loaded_at = time.monotonic()
+        print(f"📍 Station registry loaded ({len(rows)} stations)")
+
+    def refresh_new(self):
+        """Pull only stations inserted since the last load."""
+        with self._lock:
+            if self._loaded_at is None:
+                after = None
+            else:
+                after = self._max_id
+        if after is None:
+            self.reload()
+            return
+        rows = self._fetch(after_id=after)
+        if rows:
+            with self._lock:
+                self._add_rows(rows)
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.reload()
+
+    def _refresh_on_miss(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_miss_refresh < self.miss_refresh_interval:
+                return False
+            self._last_miss_refresh = now
+        self.refresh_new()
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # lookups
+    # ------------------------------------------------------------------
+    def get_id(self, name):
+        self._ensure_fresh()
+        station_id = self._id_by_name.get(name)
+        if station_id is None and name and self._refresh_on_miss():
+            station_id = self._id_by_name.get(name)
+        return station_id
+
+    def get(self, station_id):
+        self._ensure_fresh()
+        record = self._by_id.get(station_id)
+        if record is None and self._refresh_on_miss():
+            record = self._by_id.get(station_id)
+        return record
+
+    def get_by_name(self, name):
+        station_id = self.get_id(name)
+        return self._by_id.get(station_id) if station_id is not None else None
+
+    def coords(self, name):
+        record = self.get_by_name(name)
+        if record is None or record["latitude"] is None or record["longitude"] is None:
+            return None
+        return record["latitude"], record["longitude"]
+
+    def all(self):
+        self._ensure_fresh()
+        with self._lock:
+            return [self._by_id[k] for k in sorted(self._by_id)]
+
+    def with_coordinates(self):
+        return [
+            r for r in self.all()
+            if r["latitude"] is not None and r["longitude"] is not None
+        ]
+
+    def nearest(self, lat, lon, k=1):
+        """[(distance_km, station record)] for the k nearest stations."""
+        self._ensure_fresh()
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = KDTree(
+                        (r["latitude"], r["longitude"], r)
+                        for r in self._by_id.values()
+                        if r["latitude"] is not None and r["longitude"] is not None
+                    )
+                index = self._index
+        return index.nearest(lat, lon, k)
+
+    def cached_ids(self, names):
+        """
+        Memory-only lookup (never touches the DB), safe to call while the
+        caller is holding a pooled connection. Returns {name: station_id}
+        for the names already known.
+        """
+        with self._lock:
+            return {n: self._id_by_name[n] for n in names if n in self._id_by_name}
+
+    def ensure_known(self, names):
+        """Call after committing new stations so they show up immediately."""
+        if any(n not in self._id_by_name for n in names if n):
+            self.refresh_new()
@@ -0,0 +1,82 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+import app
+
+
+class FakeCursor:
+    """Unbuffered cursor: serves `chunks` to fetchmany(), then raises `error` if set."""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.closed = False
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        if self.chunks:
+            return self.chunks.pop(0)
+        if self.error is not None:
+            raise self.error
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    invalidated = []
+
+    def run(cursor, fmt, max_rows=1000, max_bytes=10 ** 6):
+        class Conn:
+            def cursor(self, **kwargs):
+                return cursor
+
+        monkeypatch.setattr(app, "db_read_connection", contextmanager(lambda: (yield Conn())))
+        monkeypatch.setattr(app.read_router, "invalidate", invalidated.append)
+        return "".join(app.stream_query_rows("SELECT 1", fmt, max_rows, max_bytes))
+
+    run.invalidated = invalidated
+    return run
+
+
+def test_complete_json_stream_is_a_plain_array(stream):
+    cursor = FakeCursor([[{"a": 1}, {"a": 2}], [{"a": 3}]])
+    assert json.loads(stream(cursor, "json")) == [{"a": 1}, {"a": 2}, {"a": 3}]
+    assert cursor.closed and not stream.invalidated
+
+
+def test_json_stream_failing_midway_ends_with_meta(stream):
+    cursor = FakeCursor([[{"a": 1}, {"a": 2}]], error=RuntimeError("Lost connection"))
+    body = json.loads(stream(cursor, "json"))
+
+    assert body[:2] == [{"a": 1}, {"a": 2}]
+    meta = body[-1]["_meta"]
+    assert len(body) == 3
+    assert meta["rows"] == 2 and meta["truncated"] is None
+    assert "Lost connection" in meta["error"]
+    assert stream.invalidated  # unread rows: connection must not go back to the pool
+
+
+def test_json_stream_failing_before_any_row_ends_with_meta(stream):
+    body = json.loads(stream(FakeCursor([], error=RuntimeError("boom")), "json"))
+    assert body == [{"_meta": {"rows": 0, "bytes": 0, "truncated": None, "error": "boom"}}]
+
+
+def test_capped_json_stream_ends_with_meta(stream):
+    body = json.loads(stream(FakeCursor([[{"a": i} for i in range(5)]]), "json", max_rows=3))
+    assert body[:3] == [{"a": 0}, {"a": 1}, {"a": 2}]
+    assert body[3]["_meta"]["truncated"] == "max_rows"
+
+
+def test_ndjson_stream_failing_midway_has_error_trailer(stream):
+    cursor = FakeCursor([[{"a": 1}]], error=RuntimeError("Lost connection"))
+    lines = [json.loads(line) for line in stream(cursor, "ndjson").splitlines()]
+    assert lines[0] == {"a": 1}
+    assert lines[-1]["_meta"]["rows"] == 1
+    assert "Lost connection" in lines[-1]["_meta"]["error"]
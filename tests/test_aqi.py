@@ -0,0 +1,103 @@
+import math
+import random
+
+import pytest
+
+from aqi import BREAKPOINTS, POLLUTANTS, calculate_aqi, calculate_aqi_batch
+
+
+def reference_calculate_aqi(pollutants):
+    """The pre-NumPy implementation, kept verbatim as the oracle."""
+
+    def compute_iaqi(Cp, bp_list):
+        if Cp is None:
+            return None
+        for BP_Lo, BP_Hi, I_Lo, I_Hi in bp_list:
+            if BP_Lo <= Cp <= BP_Hi:
+                return ((I_Hi - I_Lo) / (BP_Hi - BP_Lo)) * (Cp - BP_Lo) + I_Lo
+        return None
+
+    iaqis = {}
+    for p, bp in BREAKPOINTS.items():
+        iaqis[p] = compute_iaqi(pollutants.get(p), bp)
+
+    overall_aqi = max([v for v in iaqis.values() if v is not None], default=None)
+    return int(overall_aqi) if overall_aqi is not None else None, iaqis
+
+
+def in_gap(pollutant, value):
+    """True if `value` lies between two bands (not covered by any)."""
+    return value is not None and any(
+        prev[1] < value < nxt[0]
+        for prev, nxt in zip(BREAKPOINTS[pollutant], BREAKPOINTS[pollutant][1:])
+    )
+
+
+def random_reading(rng):
+    reading = {}
+    for p in POLLUTANTS:
+        top = BREAKPOINTS[p][-1][1]
+        r = rng.random()
+        if r < 0.15:
+            reading[p] = None
+        elif r < 0.3:
+            reading[p] = float(rng.randint(0, int(top)))  # integer edges
+        elif r < 0.35:
+            reading[p] = rng.uniform(-10, 0) if rng.random() < 0.5 else top + rng.uniform(0.01, 50)
+        else:
+            reading[p] = round(rng.uniform(0, top), rng.choice([0, 1, 2]))
+    return reading
+
+
+def test_matches_reference_outside_band_gaps():
+    rng = random.Random(7)
+    compared = 0
+    for _ in range(20000):
+        reading = random_reading(rng)
+        aqi, iaqis = calculate_aqi(reading)
+        ref_aqi, ref_iaqis = reference_calculate_aqi(reading)
+        for p in POLLUTANTS:
+            if in_gap(p, reading[p]):
+                continue
+            assert iaqis[p] == ref_iaqis[p], (p, reading[p])
+            compared += 1
+        if not any(in_gap(p, v) for p, v in reading.items()):
+            assert aqi == ref_aqi, reading
+    assert compared > 100000
+
+
+@pytest.mark.parametrize(
+    "pollutant, value, expected",
+    [
+        ("PM2.5", 30.5, 51.0),  # between (0, 30) and (31, 60): next band's floor
+        ("PM10", 50.2, 51.0),
+        ("CO", 1.05, 51.0),
+        ("NH3", 1200.5, 301.0),
+    ],
+)
+def test_band_gap_values_are_clamped_to_the_next_band(pollutant, value, expected):
+    assert reference_calculate_aqi({pollutant: value})[1][pollutant] is None
+    aqi, iaqis = calculate_aqi({pollutant: value})
+    assert iaqis[pollutant] == expected
+    assert aqi == int(expected)
+
+
+@pytest.mark.parametrize("value", [None, -1, 500.01, float("nan")])
+def test_unusable_values_give_none(value):
+    assert calculate_aqi({"PM2.5": value}) == (None, {p: None for p in POLLUTANTS})
+
+
+def test_scalar_and_batch_agree():
+    rng = random.Random(11)
+    readings = [random_reading(rng) for _ in range(2000)]
+    batch_aqi, batch_iaqis = calculate_aqi_batch(
+        {p: [r[p] for r in readings] for p in POLLUTANTS}
+    )
+    for i, reading in enumerate(readings):
+        aqi, iaqis = calculate_aqi(reading)
+        assert (aqi is None) == math.isnan(batch_aqi[i])
+        if aqi is not None:
+            assert aqi == int(batch_aqi[i])
+        for p in POLLUTANTS:
+            expected = batch_iaqis[p][i]
+            assert iaqis[p] == (None if math.isnan(expected) else expected)
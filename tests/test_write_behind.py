@@ -0,0 +1,193 @@
+import json
+import os
+import time
+
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+class BadRow(Exception):
+    pass
+
+
+class FakeDB:
+    """flush() target that commits atomically: a failing call stores nothing."""
+
+    def __init__(self, fail_times=0, bad=()):
+        self.commits = []  # one {kind: rows} per successful flush
+        self.fail_times = fail_times
+        self.bad = set(bad)
+
+    def flush(self, groups):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("db down")
+        for rows in groups.values():
+            for row in rows:
+                if row.get("id") in self.bad:
+                    raise BadRow(f"row {row['id']} too long")
+        self.commits.append({k: list(v) for k, v in groups.items()})
+
+    def rows(self):
+        return [
+            (kind, row["id"])
+            for group in self.commits
+            for kind, rows in group.items()
+            for row in rows
+        ]
+
+
+def make_queue(directory, db, **kwargs):
+    kwargs.setdefault("max_delay", 0.01)
+    kwargs.setdefault("retry_delay", 0.01)
+    return WriteBehindQueue(
+        str(directory), db.flush, is_bad_rows=lambda e: isinstance(e, BadRow), **kwargs
+    )
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_group_commits_every_kind_once(tmp_path):
+    db = FakeDB()
+    q = make_queue(tmp_path, db, max_delay=0.2).start()
+    q.append("pollutant", [{"id": 1}])
+    q.append("meteo", [{"id": 2}])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+    assert db.commits == [{"pollutant": [{"id": 1}], "meteo": [{"id": 2}]}]
+
+
+def test_transient_failure_retries_without_duplicates(tmp_path):
+    db = FakeDB(fail_times=2)
+    q = make_queue(tmp_path, db, max_delay=0.2).start()
+    q.append("pollutant", [{"id": 1}])
+    q.append("meteo", [{"id": 2}])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+    assert sorted(db.rows()) == [("meteo", 2), ("pollutant", 1)]
+
+
+def test_bad_rows_are_dead_lettered_and_the_rest_committed(tmp_path):
+    db = FakeDB(bad={3})
+    q = make_queue(tmp_path, db, max_delay=0.2).start()
+    q.append("pollutant", [{"id": i} for i in range(1, 6)])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+
+    assert sorted(db.rows()) == [("pollutant", i) for i in (1, 2, 4, 5)]
+    assert q.stats()["dead_rows"] == 1
+    with open(tmp_path / "wb-0.dead") as f:
+        dead = [json.loads(line) for line in f]
+    assert [(d["k"], d["r"]["id"]) for d in dead] == [("pollutant", 3)]
+    assert "too long" in dead[0]["error"]
+
+
+def test_checkpoint_prevents_replay_after_restart(tmp_path):
+    db = FakeDB()
+    q = make_queue(tmp_path, db).start()
+    q.append("pollutant", [{"id": 1}, {"id": 2}])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+    q._log.close()
+
+    q2 = make_queue(tmp_path, db).start()
+    time.sleep(0.05)
+    q2.close()
+    assert sorted(db.rows()) == [("pollutant", 1), ("pollutant", 2)]
+
+
+def test_uncommitted_rows_are_replayed_after_crash(tmp_path):
+    db = FakeDB(fail_times=10 ** 6)  # never commits: simulates a crash
+    q = make_queue(tmp_path, db, retry_delay=60).start()
+    q.append("pollutant", [{"id": 1}])
+    q.append("meteo", [{"id": 2}])
+    q.close(timeout=0.1)
+    q._log.close()  # process gone: lock released, log left behind
+
+    db.fail_times = 0
+    q2 = make_queue(tmp_path, db).start()
+    wait_for(lambda: q2.stats()["depth"] == 0)
+    q2.close()
+    assert sorted(db.rows()) == [("meteo", 2), ("pollutant", 1)]
+
+
+def test_torn_tail_is_dropped_on_replay(tmp_path):
+    with open(tmp_path / "wb-0.log", "wb") as f:
+        f.write(b'{"k":"pollutant","r":{"id":1}}\n{"k":"pollutant","r":{"id"')
+
+    db = FakeDB()
+    q = make_queue(tmp_path, db).start()
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.append("pollutant", [{"id": 2}])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+    assert db.rows() == [("pollutant", 1), ("pollutant", 2)]
+
+
+def test_orphan_logs_are_adopted(tmp_path):
+    with open(tmp_path / "wb-3.log", "wb") as f:
+        f.write(b'{"k":"pollutant","r":{"id":1}}\n{"k":"meteo","r":{"id":2}}\n')
+    # first line was already committed by the process that owned slot 3
+    with open(tmp_path / "wb-3.ckpt", "w") as f:
+        f.write(str(len(b'{"k":"pollutant","r":{"id":1}}\n')))
+
+    db = FakeDB()
+    q = make_queue(tmp_path, db).start()
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+    assert db.rows() == [("meteo", 2)]
+    assert os.path.getsize(tmp_path / "wb-3.log") == 0
+
+
+def test_queue_full(tmp_path):
+    from write_behind import QueueFull
+
+    db = FakeDB(fail_times=10 ** 6)
+    q = make_queue(tmp_path, db, max_pending=2, block_timeout=0.05, retry_delay=60).start()
+    q.append("pollutant", [{"id": 1}, {"id": 2}])
+    with pytest.raises(QueueFull):
+        q.append("pollutant", [{"id": 3}])
+    q.close(timeout=0.1)
+
+
+def test_schema_not_ready_is_retried_not_dead_lettered(tmp_path):
+    import app
+
+    calls = []
+
+    def flush(groups):
+        calls.append(groups)
+        if len(calls) <= 3:
+            raise app.SchemaNotReady("database schema is not at X; run `python migrate.py`")
+
+    q = WriteBehindQueue(
+        str(tmp_path), flush, is_bad_rows=app._is_bad_row_error, max_delay=0.01, retry_delay=0.01
+    ).start()
+    q.append("pollutant", [{"id": 1}, {"id": 2}])
+    wait_for(lambda: q.stats()["depth"] == 0)
+    q.close()
+
+    assert q.stats()["dead_rows"] == 0
+    assert not os.path.exists(tmp_path / "wb-0.dead")
+    assert calls[-1] == {"pollutant": [{"id": 1}, {"id": 2}]}
+
+
+def test_only_data_errors_count_as_bad_rows():
+    import app
+    import db_driver
+
+    module, _ = db_driver.load()
+    assert app._is_bad_row_error(module.errors.DataError("Data too long"))
+    assert app._is_bad_row_error(module.errors.IntegrityError("Duplicate entry"))
+    assert app._is_bad_row_error(ValueError("bad value"))
+    assert not app._is_bad_row_error(module.errors.OperationalError("gone away"))
+    assert not app._is_bad_row_error(app.SchemaNotReady("not migrated"))
+    assert not app._is_bad_row_error(KeyError("pollutant"))
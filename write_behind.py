@@ -0,0 +1,351 @@
+"""
+Write-behind queue: acknowledge writes once they are fsync'ed to a local
+append-only log, and group-commit them to MySQL from a background thread.
+
+Each process owns one log file in the queue directory (wb-<slot>.log,
+claimed with flock), plus a checkpoint file holding the byte offset up to
+which the log has been committed. On start the un-checkpointed tail is
+replayed, and logs left behind by processes that did not come back are
+moved into this process's log. Delivery is at-least-once: a crash between
+a DB commit and the checkpoint write replays that group.
+
+A group (all kinds together) is committed in one transaction, so a failed
+flush never leaves part of it committed. When a flush fails because of
+the rows themselves (is_bad_rows(error)), the group is split in halves
+until the offending rows are isolated; those are appended to
+wb-<slot>.dead with the error and skipped. Any other error (DB down,
+pool timeout) retries the remaining rows after retry_delay.
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+flush_seconds = metrics.registry.histogram(
+    "write_behind_flush_duration_seconds", "Group commit of queued writes", ("status",),
+)
+flushed_rows = metrics.registry.counter(
+    "write_behind_flushed_rows_total", "Queued rows committed to MySQL", ("kind",),
+)
+rejected_rows = metrics.registry.counter(
+    "write_behind_rejected_rows_total", "Rows refused because the queue was full",
+)
+dead_rows = metrics.registry.counter(
+    "write_behind_dead_rows_total", "Queued rows set aside after a permanent DB error", ("kind",),
+)
+
+
+class QueueFull(Exception):
+    """The write-behind queue is at max_pending; the caller should back off."""
+
+
+class WriteBehindQueue:
+    """
+    flush({kind: rows}) writes one group of rows and commits it in ONE
+    transaction. A flush starts when max_batch rows are pending or the
+    oldest pending row is max_delay seconds old. append() blocks up to
+    block_timeout seconds while max_pending rows are waiting, then raises
+    QueueFull. is_bad_rows(error) tells a permanent, row-caused failure
+    (e.g. data too long) from a transient one; by default all are transient.
+    """
+
+    def __init__(
+        self,
+        directory,
+        flush,
+        max_batch=500,
+        max_delay=0.5,
+        max_pending=50000,
+        block_timeout=2.0,
+        retry_delay=5.0,
+        is_bad_rows=None,
+    ):
+        self.directory = directory
+        self._flush = flush
+        self._is_bad_rows = is_bad_rows or (lambda e: False)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.retry_delay = retry_delay
+
+        self._cond = threading.Condition()
+        self._pending = deque()  # (end_offset, kind, row, enqueued_at)
+        self._log = None
+        self._log_path = None
+        self._offset = 0
+        self._committed = 0
+        self._closed = False
+        self._thread = None
+        self.last_flush_error = None
+        self.dead = 0
+
+    # ---------- startup / replay ----------
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._claim_log()
+        self._replay_orphans()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind-flusher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _claim_log(self):
+        slot = 0
+        while True:
+            path = os.path.join(self.directory, f"wb-{slot}.log")
+            f = open(path, "a+b")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                slot += 1
+                continue
+            self._log, self._log_path = f, path
+            break
+
+        self._committed = _read_checkpoint(self._log_path)
+        if self._committed > os.fstat(self._log.fileno()).st_size:
+            self._committed = 0  # log was truncated after its last checkpoint
+        end = self._committed
+        for end, kind, row in _read_entries(self._log, self._committed):
+            self._pending.append((end, kind, row, time.monotonic()))
+        # drop a torn tail so new appends start on a line boundary
+        self._log.truncate(end)
+        self._offset = end
+        if self._pending:
+            print(
+                f"♻️  write-behind: replaying {len(self._pending)} queued rows"
+                f" from {self._log_path}"
+            )
+
+    def _replay_orphans(self):
+        """
+        Adopt logs of slots nobody holds (a worker that did not return):
+        their un-checkpointed rows are appended to this process's log and
+        committed by the flusher like any other row.
+        """
+        for path in sorted(glob.glob(os.path.join(self.directory, "wb-*.log"))):
+            if path == self._log_path:
+                continue
+            with open(path, "r+b") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # a live process owns it
+                entries = [(kind, row) for _, kind, row in _read_entries(f, _read_checkpoint(path))]
+                if entries:
+                    with self._cond:
+                        self._write_entries(entries)
+                    print(f"♻️  write-behind: adopted {len(entries)} queued rows from {path}")
+                f.truncate(0)
+                _write_checkpoint(path, 0)
+
+    # ---------- producer side ----------
+
+    def append(self, kind, rows):
+        """Durably queue rows of one kind; returns once they are on disk."""
+        if not rows:
+            return
+        with self._cond:
+            deadline = time.monotonic() + self.block_timeout
+            while len(self._pending) + len(rows) > self.max_pending and not self._closed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    rejected_rows.inc(len(rows))
+                    raise QueueFull(f"{len(self._pending)} rows waiting to be committed")
+                self._cond.wait(left)
+            if self._closed:
+                raise QueueFull("write-behind queue is shut down")
+            self._write_entries([(kind, row) for row in rows])
+
+    def _write_entries(self, entries):
+        """Append (kind, row) entries to the log and the pending queue; caller holds _cond."""
+        lines = [_encode(kind, row) for kind, row in entries]
+        self._log.seek(0, os.SEEK_END)
+        self._log.write(b"".join(lines))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+        now = time.monotonic()
+        end = self._offset
+        for line in lines:
+            end += len(line)
+            self._pending.append((end, *_decode(line), now))
+        self._offset = end
+        self._cond.notify_all()
+
+    # ---------- flusher ----------
+
+    def _take_group(self):
+        """Wait for a flush trigger; returns a prefix of the pending rows."""
+        with self._cond:
+            while True:
+                if self._pending:
+                    due = self._pending[0][3] + self.max_delay
+                    if len(self._pending) >= self.max_batch or self._closed:
+                        break
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                elif self._closed:
+                    return []
+                else:
+                    self._cond.wait()
+            return [self._pending[i] for i in range(min(self.max_batch, len(self._pending)))]
+
+    def _run(self):
+        while True:
+            group = self._take_group()
+            if not group:
+                return
+
+            started = time.perf_counter()
+            try:
+                self._commit(group)
+            except Exception as e:
+                flush_seconds.observe(time.perf_counter() - started, status="error")
+                self.last_flush_error = str(e)
+                print(f"⚠️ write-behind flush of {len(group)} rows failed:", e)
+                with self._cond:
+                    if self._closed:
+                        return
+                    self._cond.wait(self.retry_delay)
+                continue
+
+            flush_seconds.observe(time.perf_counter() - started, status="ok")
+            self.last_flush_error = None
+
+    def _commit(self, entries):
+        """
+        Flush `entries` (a prefix of the pending queue) and checkpoint past
+        them. Row-caused failures are bisected down to the bad rows, which
+        go to the dead-letter file; each committed part is checkpointed as
+        soon as it commits, so a transient error later on never makes the
+        retry write it again. Transient errors propagate.
+        """
+        by_kind = _by_kind(entries)
+        try:
+            self._flush(by_kind)
+        except Exception as e:
+            if not self._is_bad_rows(e):
+                raise
+            if len(entries) > 1:
+                mid = len(entries) // 2
+                self._commit(entries[:mid])
+                self._commit(entries[mid:])
+                return
+            self._dead_letter(entries[0], e)
+        else:
+            for kind, rows in by_kind.items():
+                flushed_rows.inc(len(rows), kind=kind)
+        self._checkpoint(entries[-1][0], len(entries))
+
+    def _dead_letter(self, entry, error):
+        _, kind, row, _ = entry
+        line = json.dumps(
+            {"k": kind, "r": row, "error": str(error), "at": time.time()},
+            default=str, separators=(",", ":"),
+        ).encode() + b"\n"
+        with open(self._log_path[: -len(".log")] + ".dead", "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead += 1
+        dead_rows.inc(kind=kind)
+        print(f"☠️  write-behind: {kind} row set aside:", error)
+
+    def _checkpoint(self, end, count):
+        with self._cond:
+            for _ in range(count):
+                self._pending.popleft()
+            self._committed = end
+            if not self._pending:
+                # everything committed: start the log over
+                self._log.truncate(0)
+                self._offset = self._committed = 0
+            _write_checkpoint(self._log_path, self._committed)
+            self._cond.notify_all()
+
+    # ---------- lifecycle / introspection ----------
+
+    def close(self, timeout=10.0):
+        """Stop accepting rows and try to flush what is pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            oldest = self._pending[0][3] if self._pending else None
+            return {
+                "depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "oldest_age_seconds": round(time.monotonic() - oldest, 3) if oldest else 0,
+                "log_bytes": self._offset,
+                "dead_rows": self.dead,
+                "last_flush_error": self.last_flush_error,
+            }
+
+
+def _encode(kind, row):
+    return json.dumps({"k": kind, "r": row}, default=str, separators=(",", ":")).encode() + b"\n"
+
+
+def _decode(line):
+    entry = json.loads(line)
+    return entry["k"], entry["r"]
+
+
+def _by_kind(entries):
+    by_kind = {}
+    for _, kind, row, _ in entries:
+        by_kind.setdefault(kind, []).append(row)
+    return by_kind
+
+
+def _checkpoint_path(log_path):
+    return log_path[: -len(".log")] + ".ckpt"
+
+
+def _read_checkpoint(log_path):
+    try:
+        with open(_checkpoint_path(log_path)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_checkpoint(log_path, offset):
+    tmp = _checkpoint_path(log_path) + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _checkpoint_path(log_path))
+
+
+def _read_entries(f, start):
+    """(end_offset, kind, row) for every complete line after `start`."""
+    f.seek(start)
+    offset = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            break  # torn write from a crash mid-append: never acknowledged
+        offset += len(line)
+        try:
+            kind, row = _decode(line)
+        except ValueError:
+            continue
+        yield offset, kind, row